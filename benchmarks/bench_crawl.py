@@ -0,0 +1,179 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+bench_crawl
+----------------------------------
+
+Crawl a synthetic site (see ``synthetic_site.py``) with each of the
+crawl engines and report throughput, peak memory and where the time
+went.
+
+Each engine runs in a fresh process, so that its peak RSS is its own.
+Time per phase comes from the crawl's own statistics (see
+``pycrawl.metrics``) and is the total across all URLs, so with several
+workers it can exceed the wall-clock time.
+
+Run from the repository root::
+
+  python benchmarks/bench_crawl.py --pages 2000 --latency 0.01 \\
+      --engines sync,threaded,async --output results.json
+
+and compare a later run against those results with
+``--compare results.json``.
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+import pycrawl  # noqa: E402
+from synthetic_site import (SiteServer, add_site_arguments,  # noqa: E402
+                            config_from_args)
+
+
+ENGINES = ['sync', 'threaded', 'async']
+
+
+def peak_rss_kb():
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        rss //= 1024  # bytes, not kilobytes
+    return rss
+
+
+def run_engine(engine, url, options, results):
+    """Run one crawl in this (child) process and put its results."""
+    from pycrawl import pycrawl as crawler
+    from pycrawl.metrics import CrawlStats
+
+    stats = CrawlStats()
+    work_dir = tempfile.mkdtemp(prefix='pycrawl-bench-')
+    os.chdir(work_dir)
+    try:
+        start = time.time()
+        if engine == 'sync':
+            crawler.download_site(url, stats=stats)
+        elif engine == 'threaded':
+            crawler.download_site(url, workers=options['workers'],
+                                  stats=stats)
+        elif engine == 'async':
+            import asyncio
+            from pycrawl.aio import download_site_async
+            asyncio.run(download_site_async(
+                url, concurrency=options['concurrency'], stats=stats))
+        else:
+            raise ValueError("unknown engine {!r}".format(engine))
+        elapsed = time.time() - start
+    finally:
+        os.chdir(BENCH_DIR)
+        shutil.rmtree(work_dir)
+    snapshot = stats.snapshot()
+    phases = dict((phase, histogram['sum'])
+                  for phase, histogram in snapshot['phases'].items())
+    results.put({'elapsed': elapsed, 'peak_rss_kb': peak_rss_kb(),
+                 'phases': phases, 'stats': snapshot})
+
+
+def bench_engine(engine, server, options):
+    server.stats.reset()
+    context = multiprocessing.get_context('spawn')
+    results = context.Queue()
+    process = context.Process(target=run_engine,
+                              args=(engine, server.url, options, results))
+    process.start()
+    result = results.get()
+    process.join()
+    served = server.stats.as_dict()
+    elapsed = result['elapsed']
+    result.update(engine=engine, requests=served['requests'],
+                  pages=served['pages'], bytes=served['bytes'],
+                  errors=served['errors'],
+                  pages_per_sec=served['pages'] / elapsed,
+                  bytes_per_sec=served['bytes'] / elapsed)
+    return result
+
+
+def print_result(result, baseline=None):
+    line = ("{engine:<10} {elapsed:8.2f}s {pages_per_sec:9.1f} pages/s "
+            "{mb_per_sec:8.2f} MB/s {peak_mb:8.1f} MB peak").format(
+                mb_per_sec=result['bytes_per_sec'] / 1e6,
+                peak_mb=result['peak_rss_kb'] / 1024.0, **result)
+    if baseline is not None:
+        line += "  ({:+.1f}% pages/s)".format(
+            (result['pages_per_sec'] / baseline['pages_per_sec'] - 1) * 100)
+    print(line)
+    for phase, total in sorted(result['phases'].items()):
+        print("    {:<8} {:8.2f}s".format(phase, total))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark crawl engines against a synthetic site.")
+    add_site_arguments(parser)
+    parser.add_argument("--engines", default=','.join(ENGINES),
+                        help="comma-separated engines to run "
+                        "(default: %(default)s)")
+    parser.add_argument("--workers", type=int, default=16,
+                        help="threads for the threaded engine")
+    parser.add_argument("--concurrency", type=int, default=100,
+                        help="requests in flight for the async engine")
+    parser.add_argument("--repeat", type=int, default=1,
+                        help="run each engine this many times")
+    parser.add_argument("--output", metavar="FILE",
+                        help="write results to FILE as JSON")
+    parser.add_argument("--compare", metavar="FILE",
+                        help="compare with results saved by --output")
+    args = parser.parse_args()
+
+    engines = [name.strip() for name in args.engines.split(',')]
+    for engine in engines:
+        if engine not in ENGINES:
+            parser.error("unknown engine {!r}".format(engine))
+    baselines = {}
+    if args.compare:
+        with open(args.compare) as f:
+            for result in json.load(f)['results']:
+                baselines.setdefault(result['engine'], result)
+
+    config = config_from_args(args)
+    options = {'workers': args.workers, 'concurrency': args.concurrency}
+    server = SiteServer(config)
+    server.start()
+    results = []
+    try:
+        for engine in engines:
+            for _ in range(args.repeat):
+                result = bench_engine(engine, server, options)
+                print_result(result, baselines.get(engine))
+                results.append(result)
+    finally:
+        server.stop()
+
+    if args.output:
+        report = {
+            'pycrawl_version': pycrawl.__version__,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'site': config.as_dict(),
+            'options': options,
+            'results': results,
+        }
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
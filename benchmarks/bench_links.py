@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+bench_links
+----------------------------------
+
+Compare the link rewriting backends of ``get_content_and_links`` on a
+generated link-heavy page.
+
+Run from the repository root::
+
+  python benchmarks/bench_links.py --links 2000 --repeat 5
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pycrawl import pycrawl  # noqa: E402
+
+
+def make_page(num_links):
+    parts = ['<html><head><title>bench</title></head><body>\n']
+    for i in range(num_links):
+        if i % 3 == 0:
+            parts.append('<p>Paragraph {0} with <a href="http://localhost/'
+                         'page{0}.html">a local link</a></p>\n'.format(i))
+        elif i % 3 == 1:
+            parts.append('<div class="x"><img alt="" src="/img{0}.png">'
+                         '</div>\n'.format(i))
+        else:
+            parts.append('<p><a href="http://example.com/{0}">remote</a> '
+                         'and some more text to parse</p>\n'.format(i))
+    parts.append('</body></html>\n')
+    return ''.join(parts)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--links", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    html = make_page(args.links)
+    print("page: {} bytes, {} links".format(len(html), args.links))
+    for name in pycrawl.HTML_PARSERS:
+        try:
+            pycrawl.get_content_and_links(html, 'localhost', parser=name)
+        except Exception as e:
+            print("{:<12} unavailable ({})".format(name, e.__class__.__name__))
+            continue
+        start = time.time()
+        for _ in range(args.repeat):
+            pycrawl.get_content_and_links(html, 'localhost', parser=name)
+        elapsed = (time.time() - start) / args.repeat
+        print("{:<12} {:8.1f} ms/page {:8.1f} MB/s".format(
+            name, elapsed * 1000, len(html) / elapsed / 1e6))
+
+
+if __name__ == '__main__':
+    main()
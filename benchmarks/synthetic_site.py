@@ -0,0 +1,259 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+synthetic_site
+----------------------------------
+
+A local HTTP server that makes up a website as it's requested, so that
+crawls of any size can be benchmarked without a copy of the site on
+disk.
+
+Pages form a tree: page ``i`` links to pages ``i * fanout + 1`` to
+``i * fanout + fanout``, plus a few pseudo-random "cross links" to other
+pages, so the crawler has to skip URLs it has already seen.  Everything
+is derived from the page number, so a given configuration always
+serves the same site.
+
+Serve a site by hand with::
+
+  python benchmarks/synthetic_site.py --pages 10000 --latency 0.02
+"""
+
+import argparse
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+FILLER = (b'<p>Lorem ipsum dolor sit amet, consectetur adipiscing elit, sed '
+          b'do eiusmod tempor incididunt ut labore et dolore magna aliqua.'
+          b'</p>\n')
+
+
+class SiteConfig(object):
+    """Shape of a synthetic site.
+
+    :param pages: number of HTML pages
+    :param fanout: child pages linked from each page
+    :param depth: if set, only serve pages up to this depth in the tree
+    :param page_size: pad each page with text to about this many bytes
+    :param cross_links: extra links from each page to random pages
+    :param assets: binary files (``<img>`` links) per page
+    :param asset_size: size of each binary file in bytes
+    :param latency: seconds to wait before answering each request
+    :param error_rate: fraction of pages (never the root) that always
+        answer with a 500 error
+    :param seed: seed for the choice of cross links and error pages
+    """
+
+    def __init__(self, pages=1000, fanout=10, depth=None, page_size=8192,
+                 cross_links=2, assets=0, asset_size=16384, latency=0.0,
+                 error_rate=0.0, seed=0):
+        if depth is not None:
+            pages = min(pages, sum(fanout ** k for k in range(depth + 1)))
+        self.pages = pages
+        self.fanout = fanout
+        self.page_size = page_size
+        self.cross_links = cross_links
+        self.assets = assets
+        self.asset_size = asset_size
+        self.latency = latency
+        self.error_rate = error_rate
+        self.seed = seed
+
+    @property
+    def depth(self):
+        """Depth of the deepest page in the tree."""
+        depth, last = 0, 0
+        while last < self.pages - 1:
+            last = last * self.fanout + self.fanout
+            depth += 1
+        return depth
+
+    def as_dict(self):
+        return {'pages': self.pages, 'fanout': self.fanout,
+                'depth': self.depth, 'page_size': self.page_size,
+                'cross_links': self.cross_links, 'assets': self.assets,
+                'asset_size': self.asset_size, 'latency': self.latency,
+                'error_rate': self.error_rate, 'seed': self.seed}
+
+    def is_error(self, page):
+        if page == 0 or not self.error_rate:
+            return False
+        return random.Random(self.seed * 1000003 + page).random() < \
+            self.error_rate
+
+    def links(self, page):
+        """URL paths linked from a page."""
+        first = page * self.fanout + 1
+        children = range(first, min(first + self.fanout, self.pages))
+        rng = random.Random(self.seed * 7919 + page)
+        cross = [rng.randrange(self.pages) for _ in range(self.cross_links)]
+        return ['/page/{}.html'.format(i) for i in list(children) + cross]
+
+    def render_page(self, page):
+        parts = [('<html><head><title>Page {0}</title></head><body>\n'
+                  '<h1>Page {0}</h1>\n').format(page).encode('ascii')]
+        parts.extend('<p><a href="{}">link</a></p>\n'.format(link).encode(
+            'ascii') for link in self.links(page))
+        parts.extend('<img src="/asset/{}-{}.bin">\n'.format(
+            page, i).encode('ascii') for i in range(self.assets))
+        size = sum(len(part) for part in parts)
+        if size < self.page_size:
+            filler = FILLER * (self.page_size // len(FILLER) + 1)
+            parts.append(filler[:self.page_size - size])
+        parts.append(b'</body></html>\n')
+        return b''.join(parts)
+
+    def render_asset(self):
+        return b'\0' * self.asset_size
+
+
+class SiteStats(object):
+    """Counts of requests served, for measuring a crawl from outside."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.requests = 0
+            self.pages = 0
+            self.bytes = 0
+            self.errors = 0
+
+    def record(self, page, length, error):
+        with self._lock:
+            self.requests += 1
+            self.pages += page
+            self.bytes += length
+            self.errors += error
+
+    def as_dict(self):
+        with self._lock:
+            return {'requests': self.requests, 'pages': self.pages,
+                    'bytes': self.bytes, 'errors': self.errors}
+
+
+class SiteHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # headers and body are sent separately; don't let Nagle's algorithm
+    # hold the body back waiting for an ACK
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        config = self.server.config
+        if config.latency:
+            time.sleep(config.latency)
+        path = self.path.split('?', 1)[0]
+        page = None
+        if path in ('', '/', '/index.html'):
+            page = 0
+        elif path.startswith('/page/') and path.endswith('.html'):
+            try:
+                page = int(path[len('/page/'):-len('.html')])
+            except ValueError:
+                pass
+        if page is not None and 0 <= page < config.pages:
+            if config.is_error(page):
+                self.respond(500, 'text/plain', b'synthetic error\n',
+                             page=True, error=True)
+            else:
+                self.respond(200, 'text/html',
+                             config.render_page(page), page=True)
+        elif path == '/robots.txt':
+            self.respond(200, 'text/plain', b'User-agent: *\nDisallow:\n')
+        elif path.startswith('/asset/'):
+            self.respond(200, 'application/octet-stream',
+                         config.render_asset())
+        else:
+            self.respond(404, 'text/plain', b'not found\n', error=True)
+
+    def respond(self, status, content_type, body, page=False, error=False):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        self.server.stats.record(page, len(body), error)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class SiteServer(ThreadingHTTPServer):
+    """Serves the site described by config, counting requests in stats."""
+
+    daemon_threads = True
+    # the default backlog of 5 drops connections from busy crawlers
+    request_queue_size = 1024
+
+    def __init__(self, config, host='localhost', port=0):
+        ThreadingHTTPServer.__init__(self, (host, port), SiteHandler)
+        self.config = config
+        self.stats = SiteStats()
+
+    @property
+    def url(self):
+        return 'http://{}:{}'.format(*self.server_address[:2])
+
+    def start(self):
+        """Serve from a background thread; return the root URL."""
+        thread = threading.Thread(target=self.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return self.url
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+def add_site_arguments(parser):
+    """Add options describing a SiteConfig to an ArgumentParser."""
+    parser.add_argument("--pages", type=int, default=1000)
+    parser.add_argument("--fanout", type=int, default=10)
+    parser.add_argument("--depth", type=int,
+                        help="serve only pages up to this depth")
+    parser.add_argument("--page-size", type=int, default=8192,
+                        help="approximate size of each page in bytes")
+    parser.add_argument("--cross-links", type=int, default=2,
+                        help="extra links from each page to random pages")
+    parser.add_argument("--assets", type=int, default=0,
+                        help="binary files linked from each page")
+    parser.add_argument("--asset-size", type=int, default=16384)
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="seconds of delay per request")
+    parser.add_argument("--error-rate", type=float, default=0.0,
+                        help="fraction of pages that fail with a 500 error")
+    parser.add_argument("--seed", type=int, default=0)
+
+
+def config_from_args(args):
+    return SiteConfig(pages=args.pages, fanout=args.fanout, depth=args.depth,
+                      page_size=args.page_size, cross_links=args.cross_links,
+                      assets=args.assets, asset_size=args.asset_size,
+                      latency=args.latency, error_rate=args.error_rate,
+                      seed=args.seed)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    add_site_arguments(parser)
+    parser.add_argument("--port", type=int, default=8001)
+    args = parser.parse_args()
+    server = SiteServer(config_from_args(args), port=args.port)
+    print("serving {} pages at {}".format(server.config.pages, server.url))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,610 @@
+# -*- coding: utf-8 -*-
+
+"""asyncio crawl backend.
+
+Fetches through aiohttp, so a single process can keep many requests in
+flight at once.  Parsing and saving documents reuse the same functions
+as the synchronous crawler, run in a thread pool so that the event loop
+keeps fetching while earlier documents are processed.
+
+Requires Python 3 and the optional ``aiohttp`` dependency
+(``pip install pycrawl[async]``).
+"""
+
+import asyncio
+import functools
+import inspect
+import logging
+import time
+
+try:
+    import aiohttp
+except ImportError:  # optional dependency
+    aiohttp = None
+
+from pycrawl import pycrawl
+from pycrawl.engine import DEFAULT_PER_HOST_LIMIT
+from pycrawl.frontier import Frontier
+from pycrawl.manifest import BodyDigest, ManifestEntry
+from pycrawl.metrics import NULL_STATS, CrawlStats
+from pycrawl.results import BodyBuffer, CrawlResult
+from pycrawl.retry import RetryLater
+from pycrawl.robots import RobotsUnavailable
+from pycrawl.scheduler import DEFAULT_MAX_DELAY, HostScheduler
+from pycrawl.scope import CrawlScope
+from pycrawl.session import DEFAULT_TIMEOUT
+from pycrawl.sitemaps import (SitemapError, SitemapParser, SitemapWalk,
+                              get_sitemap_urls)
+from pycrawl.storage import MirrorStore
+
+
+DEFAULT_CONCURRENCY = 100
+
+log = logging.getLogger(__name__)
+
+
+async def download_site_async(root_url, max_depth=None,
+                              concurrency=None, per_host_limit=None,
+                              robots_cache=None, max_body_size=None,
+                              max_html_size=pycrawl.DEFAULT_MAX_HTML_SIZE,
+                              journal=None, resume=False, manifest=None,
+                              frontier=None,
+                              html_parser=pycrawl.DEFAULT_HTML_PARSER,
+                              parse_pool=None, store=None, stats=None,
+                              crawl_delay=None,
+                              max_crawl_delay=DEFAULT_MAX_DELAY, burst=1,
+                              scope=None, budget=None, sitemaps=False,
+                              skip_unchanged=False, head_probe=False,
+                              on_result=None, timeout=None,
+                              total_timeout=None, retry=None,
+                              breakers=None):
+    """Crawl and download a website, starting with root_url.
+
+    The asyncio counterpart of :func:`pycrawl.pycrawl.download_site`.
+
+    :param root_url: URL to start from, as a string, or a list of them
+    :param max_depth: if set, follow links only this many levels deep
+    :param concurrency: maximum number of requests in flight at once
+    :param per_host_limit: maximum concurrent requests to one host
+        (default: :data:`~pycrawl.engine.DEFAULT_PER_HOST_LIMIT`)
+    :param robots_cache: a :class:`~pycrawl.robots.RobotsCache` to use
+        instead of the shared one
+    :param max_body_size: if set, skip documents larger than this many
+        bytes
+    :param max_html_size: parse and rewrite at most this many bytes of
+        each HTML document
+    :param journal: a :class:`~pycrawl.journal.CrawlJournal` to record
+        progress in
+    :param resume: if true, continue the crawl recorded in ``journal``
+        rather than starting a new one
+    :param manifest: a :class:`~pycrawl.manifest.Manifest`, to re-crawl
+        incrementally using conditional requests
+    :param frontier: a :class:`~pycrawl.frontier.Frontier` to queue URLs
+        in, instead of a default one
+    :param html_parser: how to find and rewrite links; one of
+        ``pycrawl.HTML_PARSERS``
+    :param parse_pool: a :class:`~pycrawl.parsepool.ParsePool` to
+        rewrite HTML in, so that parsing can use several cores
+    :param store: where to write documents (default: a
+        :class:`~pycrawl.storage.MirrorStore`)
+    :param stats: a :class:`~pycrawl.metrics.CrawlStats` to record
+        timings and counts in
+    :param crawl_delay: minimum seconds between requests to one host;
+        a longer ``Crawl-delay`` or ``Request-rate`` in robots.txt
+        takes precedence
+    :param max_crawl_delay: cut robots.txt delays longer than this many
+        seconds to this
+    :param burst: requests a host may receive at once before delays
+        apply
+    :param scope: a :class:`~pycrawl.scope.CrawlScope` of the hosts and
+        URLs to follow links to, and the content types to download
+        (default: the hosts of the seed URLs, and any type)
+    :param budget: a :class:`~pycrawl.scheduler.CrawlBudget`; once it
+        is spent, the crawl finishes the requests in flight and stops
+    :param sitemaps: if true, also start from the URLs in the sitemaps
+        of the seed URLs' hosts
+    :param skip_unchanged: with ``sitemaps`` and a manifest, don't fetch
+        pages whose sitemap ``lastmod`` is no newer than their
+        ``Last-Modified`` when last downloaded
+    :param head_probe: if true, send a HEAD request before each new
+        document, and skip it if the headers show an unwanted type or
+        size
+    :param on_result: if given, called with a
+        :class:`~pycrawl.results.CrawlResult` for each response; if it
+        returns an awaitable (as a coroutine function does), the crawl
+        awaits it
+    :param timeout: ``(connect, read)`` timeouts in seconds
+    :param total_timeout: if set, give up on a request not finished
+        after this many seconds
+    :param retry: a :class:`~pycrawl.retry.RetryPolicy`, to retry URLs
+        that fail in ways that may not last
+    :param breakers: :class:`~pycrawl.retry.CircuitBreakers`, to pause
+        hosts that keep failing, and give up on them if they don't
+        recover
+    """
+    if aiohttp is None:
+        raise RuntimeError("download_site_async requires aiohttp")
+    if budget is not None:
+        if stats is None:
+            stats = CrawlStats()
+        stats.add_hook(budget.on_stat)
+    crawl = AsyncCrawl(root_url, max_depth=max_depth,
+                       concurrency=concurrency or DEFAULT_CONCURRENCY,
+                       per_host_limit=per_host_limit,
+                       robots_cache=robots_cache,
+                       max_body_size=max_body_size,
+                       max_html_size=max_html_size,
+                       journal=journal, resume=resume,
+                       manifest=manifest, frontier=frontier,
+                       html_parser=html_parser, parse_pool=parse_pool,
+                       store=store, stats=stats, crawl_delay=crawl_delay,
+                       max_crawl_delay=max_crawl_delay, burst=burst,
+                       scope=scope, budget=budget, sitemaps=sitemaps,
+                       skip_unchanged=skip_unchanged, head_probe=head_probe,
+                       on_result=on_result, timeout=timeout,
+                       total_timeout=total_timeout, retry=retry,
+                       breakers=breakers)
+    await crawl.run()
+
+
+async def run_crawler(crawler, on_result=None, budget=None):
+    """Run a :class:`~pycrawl.crawler.Crawler`'s crawl on the event loop.
+
+    See :meth:`pycrawl.crawler.Crawler.run_async`.
+    """
+    options, close = crawler.prepare(on_result, budget)
+    try:
+        await download_site_async(crawler.seeds,
+                                  concurrency=crawler.config.workers,
+                                  **options)
+    finally:
+        close()
+
+
+async def iter_crawler_results(crawler, queue_size):
+    """Run a :class:`~pycrawl.crawler.Crawler`'s crawl, yielding results.
+
+    See :meth:`pycrawl.crawler.Crawler.aiter_results`.
+    """
+    results = asyncio.Queue(queue_size)
+    budget = crawler.make_budget()
+    crawl = asyncio.ensure_future(run_crawler(crawler, results.put, budget))
+    try:
+        while True:
+            getter = asyncio.ensure_future(results.get())
+            await asyncio.wait([getter, crawl],
+                               return_when=asyncio.FIRST_COMPLETED)
+            if not getter.done():
+                getter.cancel()
+                break
+            yield getter.result()
+        # the crawl is over; hand out what it left in the queue
+        while not results.empty():
+            yield results.get_nowait()
+        crawl.result()
+    finally:
+        if not crawl.done():
+            budget.stop("results no longer wanted")
+            crawl.cancel()
+            try:
+                await crawl
+            except asyncio.CancelledError:
+                pass
+        while not results.empty():
+            results.get_nowait().close()
+
+
+class AsyncCrawl(object):
+    """State for a single asyncio crawl; see :func:`download_site_async`."""
+
+    def __init__(self, root_url, max_depth=None, concurrency=None,
+                 per_host_limit=None, robots_cache=None, max_body_size=None,
+                 max_html_size=pycrawl.DEFAULT_MAX_HTML_SIZE, journal=None,
+                 resume=False, manifest=None, frontier=None,
+                 html_parser=pycrawl.DEFAULT_HTML_PARSER, parse_pool=None,
+                 store=None, stats=None, crawl_delay=None,
+                 max_crawl_delay=DEFAULT_MAX_DELAY, burst=1, scope=None,
+                 budget=None, sitemaps=False, skip_unchanged=False,
+                 head_probe=False, on_result=None, timeout=None,
+                 total_timeout=None, retry=None, breakers=None):
+        if isinstance(root_url, (list, tuple)):
+            seed_urls = list(root_url)
+        else:
+            seed_urls = [root_url]
+        self.seed_urls = [pycrawl.get_canonical_url(url)
+                          for url in seed_urls]
+        if scope is None:
+            scope = CrawlScope.from_seeds(self.seed_urls)
+        self.scope = scope
+        self.max_depth = max_depth
+        self.concurrency = concurrency or DEFAULT_CONCURRENCY
+        self.per_host_limit = per_host_limit or DEFAULT_PER_HOST_LIMIT
+        if robots_cache is None:
+            robots_cache = pycrawl.robots_txt_cache
+        self.robots_cache = robots_cache
+        self.max_body_size = max_body_size
+        self.max_html_size = max_html_size
+        self.journal = journal
+        self.resume = resume
+        self.manifest = manifest
+        self.sitemaps = sitemaps
+        self.skip_unchanged = skip_unchanged
+        self.head_probe = head_probe
+        self.on_result = on_result
+        self.timeout = timeout or DEFAULT_TIMEOUT
+        self.total_timeout = total_timeout
+        self.retry = retry
+        self.breakers = breakers
+        self.frontier = frontier if frontier is not None else Frontier()
+        self.scheduler = HostScheduler(self.frontier, delay=crawl_delay,
+                                       burst=burst,
+                                       per_host_limit=self.per_host_limit,
+                                       robots_cache=self.robots_cache,
+                                       max_delay=max_crawl_delay,
+                                       budget=budget, breakers=breakers)
+        self.html_parser = html_parser
+        self.parse_pool = parse_pool
+        self.store = store if store is not None else MirrorStore()
+        self.stats = stats if stats is not None else NULL_STATS
+        if stats is not None:
+            stats.gauge('frontier', self.scheduler.__len__)
+            stats.gauge('in_flight', lambda: self._in_flight)
+
+        self._in_flight = 0
+        self._changed = None
+        self._robots_pending = {}
+        self._session = None
+
+    async def run(self):
+        connector = aiohttp.TCPConnector(
+            limit=self.concurrency,
+            limit_per_host=self.per_host_limit)
+        connect, read = self.timeout
+        timeout = aiohttp.ClientTimeout(total=self.total_timeout,
+                                        sock_connect=connect, sock_read=read)
+        self._changed = asyncio.Event()
+        async with aiohttp.ClientSession(connector=connector,
+                                         timeout=timeout) as session:
+            self._session = session
+            if self.journal is not None and self.resume:
+                self.frontier.restore(self.journal.pending(),
+                                      self.journal.seen())
+            else:
+                if self.journal is not None:
+                    self.journal.reset(
+                        pycrawl.get_crawl_name(self.seed_urls))
+                for url in self.seed_urls:
+                    self._add(url, 0)
+                if self.sitemaps:
+                    for root in pycrawl.get_site_roots(self.seed_urls):
+                        await self._load_sitemaps(root)
+            workers = [asyncio.ensure_future(self._work())
+                       for _ in range(self.concurrency)]
+            try:
+                # stop as soon as all workers finish or any one fails
+                done, pending = await asyncio.wait(
+                    workers, return_when=asyncio.FIRST_EXCEPTION)
+            finally:
+                for task in workers:
+                    task.cancel()
+                self.frontier.close()
+        for task in done:
+            if task.exception() is not None:
+                raise task.exception()
+
+    def _add(self, url, depth):
+        pycrawl.add_to_frontier(self.frontier, self.journal, url, depth)
+
+    async def _work(self):
+        while True:
+            item, wait = self.scheduler.take()
+            if item is None:
+                if wait is None and self._in_flight == 0:
+                    # nothing queued and nobody left to produce more work
+                    self._changed.set()
+                    return
+                self._changed.clear()
+                try:
+                    # wait for a fetch to finish or a host to be ready
+                    await asyncio.wait_for(self._changed.wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            url, depth, host = item
+            self._in_flight += 1
+            try:
+                links = await self.process_url_and_get_links(url)
+                if self.max_depth is not None and depth >= self.max_depth:
+                    links = []
+                for link in pycrawl.get_absolute_links(links, url,
+                                                       self.stats):
+                    if self.scope.allows(link):
+                        self._add(link, depth + 1)
+                if self.journal is not None:
+                    self.journal.done(url)
+            except RetryLater as e:
+                self.scheduler.retry(url, depth, host, e.delay)
+            finally:
+                self.scheduler.done(host)
+                self._in_flight -= 1
+                self._changed.set()
+
+    async def process_url_and_get_links(self, url):
+        """Download and save url, and if it's HTML, update links and
+        return them.
+
+        :param url: a URL string
+        :return: a list of URLs linked to in the document
+        :raise: :class:`~pycrawl.retry.RetryLater`, if the URL should be
+            fetched again later
+        """
+        stats = self.stats
+        stats.count('urls')
+        start = time.time()
+        allowed = await self.can_robots_fetch(url)
+        stats.record_time('robots', time.time() - start)
+        if not allowed:
+            stats.count('robots_denied')
+            return []
+        previous = pycrawl.get_previous_download(url, self.manifest,
+                                                 self.store)
+        headers = previous.conditional_headers() if previous else {}
+        response = body = None
+        try:
+            if self.head_probe and previous is None:
+                start = time.time()
+                await self._probe_url(url)
+                stats.record_time('head', time.time() - start)
+            log.debug("fetching %s", url)
+            start = time.time()
+            async with self._session.get(url, headers=headers) as response:
+                stats.record_time('request', time.time() - start)
+                stats.status(response.status)
+                pycrawl.check_response(url, response.status,
+                                       response.headers, self.retry,
+                                       self.breakers, stats)
+                if previous is not None and response.status == 304:
+                    stats.count('not_modified')
+                    await self._report(url, response, previous.links)
+                    return previous.links
+                digest = BodyDigest()
+                if self.on_result is not None:
+                    body = BodyBuffer()
+                links = await self._save_response_and_get_links(
+                    url, response, digest, body)
+        except (pycrawl.UnwantedContentType, pycrawl.BodyTooLarge) as e:
+            log.info("skipping %s: %s", url, e)
+            if isinstance(e, pycrawl.UnwantedContentType):
+                stats.count('unwanted_type')
+            else:
+                stats.count('too_large')
+            if body is not None:
+                body.close()
+            if response is not None:
+                # skipped once the headers were in
+                await self._report(url, response, [])
+            return []
+        except (aiohttp.ClientConnectionError, aiohttp.ClientPayloadError,
+                asyncio.TimeoutError) as e:
+            if body is not None:
+                body.close()
+            pycrawl.fetch_failed(url, str(e) or type(e).__name__,
+                                 self.retry, self.breakers, stats)
+            stats.count('fetch_errors')
+            return []
+        except aiohttp.ClientError as e:
+            if body is not None:
+                body.close()
+            log.warning("can't fetch %s: %s", url, e)
+            stats.count('fetch_errors')
+            return []
+        except BaseException:
+            if body is not None:
+                body.close()
+            raise
+        stats.count('documents')
+        stats.count('bytes_downloaded', digest.size)
+        if self.manifest is not None:
+            self.manifest.put(url, ManifestEntry(
+                etag=response.headers.get('etag'),
+                last_modified=response.headers.get('last-modified'),
+                length=digest.size, sha1=digest.hexdigest(), links=links))
+        await self._report(url, response, links, body)
+        return links
+
+    async def _report(self, url, response, links, body=None):
+        # pass a CrawlResult to on_result; see pycrawl.report_result
+        if self.on_result is None:
+            return
+        outcome = self.on_result(CrawlResult(
+            url, response.status, response.headers,
+            pycrawl.get_absolute_links(links, url),
+            body.detach() if body is not None else None))
+        if inspect.isawaitable(outcome):
+            await outcome
+
+    async def _probe_url(self, url):
+        """Async version of :func:`pycrawl.probe_url`."""
+        try:
+            async with self._session.head(url,
+                                          allow_redirects=True) as response:
+                if response.status != 200:
+                    return
+                pycrawl.check_content_type(
+                    response.headers.get('content-type'), self.scope)
+                pycrawl.check_content_length(
+                    response.headers.get('content-length'),
+                    self.max_body_size)
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            # the GET will find out
+            pass
+
+    async def _save_response_and_get_links(self, url, response, digest,
+                                           body=None):
+        """Async version of :func:`pycrawl.save_stream_and_get_links`.
+
+        Reads the body in chunks, handing each one to a thread to be
+        written, so that memory use doesn't depend on document size.
+        The body is passed through digest, and copied to body if given,
+        on the way.
+        """
+        loop = asyncio.get_event_loop()
+        content_type = response.headers.get('content-type', '')
+        pycrawl.check_content_type(content_type, self.scope)
+        pycrawl.check_content_length(response.headers.get('content-length'),
+                                     self.max_body_size)
+        chunks = self._limit_size(response.content.iter_chunked(
+            pycrawl.CHUNK_SIZE), digest, body)
+        hostname, filename = pycrawl.get_host_and_filename(url)
+
+        if pycrawl.is_html(content_type):
+            buf = []
+            size = 0
+            async for chunk in chunks:
+                buf.append(chunk)
+                size += len(chunk)
+                if size > self.max_html_size:
+                    break
+            if size <= self.max_html_size and self.store.rewrites_links:
+                # parsing and writing block, so keep them off the event loop
+                return await loop.run_in_executor(None, functools.partial(
+                    pycrawl.save_stream_and_get_links, url, content_type,
+                    buf, encoding=response.charset,
+                    max_html_size=self.max_html_size,
+                    html_parser=self.html_parser,
+                    parse_pool=self.parse_pool, store=self.store,
+                    stats=self.stats))
+            # too big to rewrite, or not to be rewritten: save it as it is
+            prefix = b''.join(buf)
+            await self._write_chunks(url, filename, content_type, prefix,
+                                     chunks)
+            start = time.time()
+            _, links = await loop.run_in_executor(
+                None, pycrawl.rewrite_html, prefix[:self.max_html_size],
+                response.charset, hostname, self.html_parser,
+                self.parse_pool)
+            self.stats.record_time('parse', time.time() - start)
+            return links
+
+        await self._write_chunks(url, filename, content_type, b'', chunks)
+        return []
+
+    async def _limit_size(self, chunks, digest, body=None):
+        size = 0
+        waited = 0.0
+        try:
+            start = time.time()
+            async for chunk in chunks:
+                waited += time.time() - start
+                digest.update(chunk)
+                if body is not None:
+                    body.update(chunk)
+                size += len(chunk)
+                if (self.max_body_size is not None and
+                        size > self.max_body_size):
+                    raise pycrawl.BodyTooLarge(
+                        "body exceeds {} bytes".format(self.max_body_size))
+                yield chunk
+                start = time.time()
+        finally:
+            self.stats.record_time('download', waited)
+
+    async def _write_chunks(self, url, filename, content_type, first,
+                            chunks):
+        loop = asyncio.get_event_loop()
+        writing = 0.0
+        size = 0
+        start = time.time()
+        writer = await loop.run_in_executor(None, functools.partial(
+            self.store.open, filename, url=url, content_type=content_type))
+        try:
+            await loop.run_in_executor(None, writer.write, first)
+            size += len(first)
+            writing += time.time() - start
+            async for chunk in chunks:
+                start = time.time()
+                await loop.run_in_executor(None, writer.write, chunk)
+                size += len(chunk)
+                writing += time.time() - start
+        except BaseException:
+            writer.abort()
+            raise
+        start = time.time()
+        await loop.run_in_executor(None, writer.commit)
+        self.stats.record_time('write', writing + time.time() - start)
+        self.stats.count('bytes_written', size)
+
+    async def _load_sitemaps(self, root_url):
+        """Queue the pages in a site's sitemaps, reading them as they
+        download."""
+        await self.can_robots_fetch(root_url)
+        robots_parser = self.robots_cache.lookup(
+            pycrawl.get_robots_url(root_url))
+        walk = SitemapWalk(get_sitemap_urls(root_url, robots_parser))
+        manifest = self.manifest if self.skip_unchanged else None
+        for sitemap_url in walk:
+            parser = SitemapParser()
+            try:
+                async with self._session.get(sitemap_url) as response:
+                    if response.status != 200:
+                        continue
+                    log.debug("reading sitemap %s", sitemap_url)
+                    async for chunk in response.content.iter_chunked(
+                            pycrawl.CHUNK_SIZE):
+                        pycrawl.queue_sitemap_pages(
+                            walk.pages(parser.feed(chunk)), self.frontier,
+                            self.journal, self.scope, manifest=manifest,
+                            store=self.store, stats=self.stats,
+                            max_depth=self.max_depth)
+                pycrawl.queue_sitemap_pages(
+                    walk.pages(parser.close()), self.frontier,
+                    self.journal, self.scope, manifest=manifest,
+                    store=self.store, stats=self.stats,
+                    max_depth=self.max_depth)
+            except SitemapError as e:
+                log.warning("skipping rest of sitemap %s: %s",
+                            sitemap_url, e)
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                log.warning("couldn't read sitemap %s", sitemap_url)
+
+    async def can_robots_fetch(self, url):
+        """According to the site's robots.txt, may we access this URL?
+
+        Concurrent callers for the same site share a single fetch of
+        robots.txt.
+        """
+        robots_url = pycrawl.get_robots_url(url)
+        rp = self.robots_cache.lookup(robots_url)
+        if rp is None:
+            try:
+                pending = self._robots_pending[robots_url]
+            except KeyError:
+                pending = asyncio.ensure_future(
+                    self._load_robots(robots_url))
+                self._robots_pending[robots_url] = pending
+            rp = await pending
+        return rp.can_fetch("*", url)
+
+    async def _load_robots(self, robots_url):
+        try:
+            try:
+                text = await self._fetch_robots(robots_url)
+            except RobotsUnavailable as e:
+                return self.robots_cache.store_failure(robots_url, e)
+            return self.robots_cache.store(robots_url, text)
+        finally:
+            del self._robots_pending[robots_url]
+
+    async def _fetch_robots(self, robots_url):
+        """Async version of :func:`pycrawl.robots.fetch_robots_txt`."""
+        try:
+            async with self._session.get(robots_url) as response:
+                if 400 <= response.status < 500:
+                    # no robots.txt => assume robots are OK
+                    return None
+                if response.status != 200:
+                    raise RobotsUnavailable("HTTP status {}".format(
+                        response.status))
+                return await response.text(errors='replace')
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            raise RobotsUnavailable(str(e) or type(e).__name__)
@@ -0,0 +1,355 @@
+# -*- coding: utf-8 -*-
+
+"""Crawling from Python code, with results handed back as they arrive.
+
+:func:`~pycrawl.pycrawl.download_site` saves what it crawls and returns
+nothing.  A :class:`Crawler` instead yields a
+:class:`~pycrawl.results.CrawlResult` for each response, so the
+documents can be indexed or otherwise processed while the crawl goes
+on::
+
+    crawler = Crawler('http://example.com/', max_depth=2, workers=8)
+    for result in crawler.iter_results():
+        index(result.url, result.headers, result.read(), result.links)
+
+or, from a coroutine, ``async for result in crawler.aiter_results()``.
+
+Saving is optional: a crawler writes documents only if given a store,
+or one of the output options (``content_store``, ``warc``, ``pack`` or
+``write_queue``) in its :class:`CrawlConfig`.
+"""
+
+from __future__ import absolute_import
+
+import copy
+import threading
+try:  # Python 3
+    import queue
+except ImportError:  # Python 2
+    import Queue as queue
+
+from pycrawl import robots
+from pycrawl.frontier import Scorer, make_frontier
+from pycrawl.journal import CrawlJournal
+from pycrawl.manifest import Manifest
+from pycrawl.metrics import CrawlStats
+from pycrawl.pycrawl import (DEFAULT_HTML_PARSER, DEFAULT_MAX_HTML_SIZE,
+                             download_site, ensure_scheme,
+                             get_manifest_path)
+from pycrawl.retry import (DEFAULT_BACKOFF, DEFAULT_COOLDOWN,
+                           DEFAULT_MAX_RETRY_DELAY, DEFAULT_RETRIES,
+                           DEFAULT_THRESHOLD, CircuitBreakers, RetryPolicy)
+from pycrawl.robots import RobotsCache
+from pycrawl.scheduler import DEFAULT_MAX_DELAY, CrawlBudget
+from pycrawl.scope import CrawlScope
+from pycrawl.session import DEFAULT_TIMEOUT
+from pycrawl.storage import ContentStore, NullStore, PackStore, WarcStore
+from pycrawl.writer import QueuedMirrorStore
+
+
+# results waiting for the caller before the crawl waits for it
+DEFAULT_QUEUE_SIZE = 100
+# how often a crawl blocked on a full queue checks if it's been stopped
+_PUT_INTERVAL = 0.1
+
+
+class CrawlConfig(object):
+    """Options for a :class:`Crawler`.
+
+    The options have the names and defaults of the command line's (see
+    ``pycrawl --help``), with dashes turned into underscores:
+    ``max_depth``, ``workers``, ``per_host``, ``crawl_delay``,
+    ``include``, ``incremental``, ``content_store`` and so on.  Those
+    given override the defaults; an unknown name raises TypeError.
+    """
+
+    DEFAULTS = {
+        # what to crawl
+        'allow_host': (), 'allow_suffix': (), 'include': (), 'exclude': (),
+        'deny_ext': (), 'accept_type': None, 'head_probe': False,
+        'sitemaps': False, 'skip_unchanged': False, 'max_depth': None,
+        # how fast
+        'workers': None, 'per_host': None, 'crawl_delay': None,
+        'max_crawl_delay': DEFAULT_MAX_DELAY, 'burst': 1,
+        'pool_size': None, 'use_async': False,
+        'robots_cache': None, 'robots_ttl': robots.DEFAULT_TTL,
+        # failures
+        'connect_timeout': DEFAULT_TIMEOUT[0],
+        'read_timeout': DEFAULT_TIMEOUT[1], 'total_timeout': None,
+        'retries': DEFAULT_RETRIES, 'retry_backoff': DEFAULT_BACKOFF,
+        'max_retry_delay': DEFAULT_MAX_RETRY_DELAY,
+        'breaker_threshold': DEFAULT_THRESHOLD,
+        'breaker_cooldown': DEFAULT_COOLDOWN,
+        # documents
+        'max_body_size': None, 'max_html_size': DEFAULT_MAX_HTML_SIZE,
+        'html_parser': DEFAULT_HTML_PARSER, 'parse_processes': None,
+        # state
+        'journal': None, 'resume': False, 'incremental': False,
+        'manifest': None,
+        # frontier
+        'seen_set': 'fingerprint', 'bloom_capacity': None,
+        'bloom_error_rate': None, 'spill_dir': None, 'queue_memory': None,
+        'score_depth': None, 'score_links': None, 'score_path': (),
+        # budget
+        'max_pages': None, 'max_bytes': None, 'max_time': None,
+        # output
+        'content_store': None, 'symlinks': False, 'warc': None,
+        'pack': None, 'write_queue': None, 'fsync_interval': None,
+    }
+
+    def __init__(self, **options):
+        for name, value in self.DEFAULTS.items():
+            setattr(self, name, value)
+        self.update(**options)
+
+    def __repr__(self):
+        changed = sorted((name, getattr(self, name))
+                         for name, default in self.DEFAULTS.items()
+                         if getattr(self, name) != default)
+        return 'CrawlConfig({})'.format(', '.join(
+            '{}={!r}'.format(name, value) for name, value in changed))
+
+    def update(self, **options):
+        """Change options, as given to the constructor."""
+        for name, value in options.items():
+            if name not in self.DEFAULTS:
+                raise TypeError("unknown crawl option {!r}".format(name))
+            setattr(self, name, value)
+
+
+class Crawler(object):
+    """Crawl from seed URLs, handing back each response.
+
+    Each of :meth:`run`, :meth:`iter_results` and :meth:`aiter_results`
+    runs a whole crawl, with a new frontier.  Stores, manifests and
+    other files named in the config are opened for the crawl and closed
+    after it; a store passed in is left open for the caller to close.
+
+    :param seeds: a URL to start from, or a list of them
+    :param config: a :class:`CrawlConfig` (default: the defaults)
+    :param store: where to save documents, such as a
+        :class:`~pycrawl.storage.MirrorStore` (default: as chosen by
+        the config's output options, or else nowhere)
+    :param stats: a :class:`~pycrawl.metrics.CrawlStats` to record
+        the crawl in
+    :param options: :class:`CrawlConfig` options, overriding those in
+        config
+    """
+
+    def __init__(self, seeds, config=None, store=None, stats=None,
+                 **options):
+        if not isinstance(seeds, (list, tuple)):
+            seeds = [seeds]
+        if not seeds:
+            raise ValueError("no URLs to crawl")
+        self.seeds = [ensure_scheme(url) for url in seeds]
+        self.config = copy.copy(config) if config else CrawlConfig()
+        self.config.update(**options)
+        self.store = store
+        self.stats = stats if stats is not None else CrawlStats()
+
+    def make_budget(self):
+        """Return a :class:`~pycrawl.scheduler.CrawlBudget` for a crawl.
+
+        Even without limits, a budget is how a crawl is stopped early.
+        """
+        config = self.config
+        return CrawlBudget(max_pages=config.max_pages,
+                           max_bytes=config.max_bytes,
+                           max_time=config.max_time)
+
+    def prepare(self, on_result=None, budget=None):
+        """Build the parts of a crawl from the config.
+
+        :return: ``(options, close)``, where options are the keyword
+            arguments for :func:`~pycrawl.pycrawl.download_site` or
+            :func:`~pycrawl.aio.download_site_async` that the two have
+            in common, and close is a function to call after the crawl
+        """
+        config = self.config
+        scope = CrawlScope.from_seeds(
+            self.seeds, hosts=config.allow_host,
+            suffixes=config.allow_suffix, include=config.include,
+            exclude=config.exclude,
+            deny_extensions=[ext for exts in config.deny_ext
+                             for ext in exts.split(',') if ext],
+            content_types=config.accept_type)
+        scorer = None
+        if (config.score_depth is not None or
+                config.score_links is not None or config.score_path):
+            scorer = Scorer(depth_weight=(1.0 if config.score_depth is None
+                                          else config.score_depth),
+                            link_weight=config.score_links or 0.0,
+                            path_weights=config.score_path)
+        frontier = make_frontier(config.seen_set,
+                                 bloom_capacity=config.bloom_capacity,
+                                 bloom_error_rate=config.bloom_error_rate,
+                                 spill_dir=config.spill_dir,
+                                 memory_queue_size=config.queue_memory,
+                                 scorer=scorer)
+        closers = []
+        store = self.store
+        if store is None:
+            store = self._make_store()
+            closers.append(store.close)
+        manifest = journal = parse_pool = None
+        if config.incremental:
+            manifest = Manifest(config.manifest or
+                                get_manifest_path(self.seeds[0]))
+            closers.append(manifest.close)
+        if config.journal:
+            journal = CrawlJournal(config.journal)
+            closers.append(journal.close)
+        if config.parse_processes:
+            from pycrawl.parsepool import ParsePool
+            parse_pool = ParsePool(config.parse_processes)
+            closers.append(parse_pool.close)
+        robots_cache = RobotsCache(ttl=config.robots_ttl,
+                                   path=config.robots_cache)
+        if config.robots_cache:
+            closers.append(robots_cache.save)
+        if budget is None:
+            budget = self.make_budget()
+        breakers = None
+        if config.breaker_threshold:
+            breakers = CircuitBreakers(threshold=config.breaker_threshold,
+                                       cooldown=config.breaker_cooldown,
+                                       stats=self.stats)
+
+        def close():
+            for closer in reversed(closers):
+                closer()
+
+        options = dict(
+            max_depth=config.max_depth, per_host_limit=config.per_host,
+            robots_cache=robots_cache, max_body_size=config.max_body_size,
+            max_html_size=config.max_html_size, journal=journal,
+            resume=config.resume, manifest=manifest, frontier=frontier,
+            html_parser=config.html_parser, parse_pool=parse_pool,
+            store=store, stats=self.stats, crawl_delay=config.crawl_delay,
+            max_crawl_delay=config.max_crawl_delay, burst=config.burst,
+            scope=scope, budget=budget, sitemaps=config.sitemaps,
+            skip_unchanged=config.skip_unchanged,
+            head_probe=config.head_probe, on_result=on_result,
+            timeout=(config.connect_timeout, config.read_timeout),
+            total_timeout=config.total_timeout,
+            retry=RetryPolicy(retries=config.retries,
+                              backoff=config.retry_backoff,
+                              max_delay=config.max_retry_delay),
+            breakers=breakers)
+        return options, close
+
+    def _make_store(self):
+        config = self.config
+        if config.content_store:
+            return ContentStore(config.content_store,
+                                symlinks=config.symlinks)
+        elif config.warc:
+            return WarcStore(config.warc)
+        elif config.pack:
+            return PackStore(config.pack)
+        elif config.write_queue:
+            return QueuedMirrorStore(queue_size=config.write_queue,
+                                     fsync_interval=config.fsync_interval)
+        return NullStore()
+
+    def run(self, on_result=None):
+        """Crawl until the frontier is empty or the budget is spent.
+
+        :param on_result: if given, called with each
+            :class:`~pycrawl.results.CrawlResult`, from the crawling
+            threads
+        """
+        self._run(on_result, self.make_budget())
+
+    def _run(self, on_result, budget):
+        if self.config.use_async:
+            import asyncio
+            asyncio.run(self.run_async(on_result, budget))
+            return
+        options, close = self.prepare(on_result, budget)
+        try:
+            download_site(self.seeds, workers=self.config.workers,
+                          pool_size=self.config.pool_size, **options)
+        finally:
+            close()
+
+    def run_async(self, on_result=None, budget=None):
+        """Crawl with the asyncio backend; see :meth:`run`.
+
+        :param on_result: as for :meth:`run`, but called on the event
+            loop; a coroutine function is awaited
+        :param budget: a :class:`~pycrawl.scheduler.CrawlBudget` to
+            stop the crawl with (default: :meth:`make_budget`)
+        :return: a coroutine
+        """
+        from pycrawl.aio import run_crawler
+        return run_crawler(self, on_result, budget)
+
+    def iter_results(self, queue_size=DEFAULT_QUEUE_SIZE):
+        """Crawl in a background thread, yielding each result.
+
+        Results are yielded as soon as they're ready, while the crawl
+        goes on.  If the caller falls ``queue_size`` results behind,
+        the crawl waits for it to catch up.  Stopping early (closing
+        the generator, or breaking out of a loop over it) stops the
+        crawl: requests in flight are finished, and their results
+        dropped.
+
+        :return: a generator of :class:`~pycrawl.results.CrawlResult`;
+            close each result's body when done with it
+        :raise: whatever the crawl raised, once the results before it
+            have been yielded
+        """
+        results = queue.Queue(queue_size)
+        stopped = threading.Event()
+        budget = self.make_budget()
+        errors = []
+        finished = object()
+
+        def put(item):
+            while not stopped.is_set():
+                try:
+                    results.put(item, timeout=_PUT_INTERVAL)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        def on_result(result):
+            if not put(result):
+                result.close()
+
+        def crawl():
+            try:
+                self._run(on_result, budget)
+            except BaseException as e:
+                errors.append(e)
+            finally:
+                put(finished)
+
+        thread = threading.Thread(target=crawl, name='pycrawl-crawler')
+        thread.daemon = True
+        thread.start()
+        try:
+            while True:
+                item = results.get()
+                if item is finished:
+                    break
+                yield item
+        finally:
+            stopped.set()
+            budget.stop("results no longer wanted")
+            thread.join()
+        if errors:
+            raise errors[0]
+
+    def aiter_results(self, queue_size=DEFAULT_QUEUE_SIZE):
+        """Crawl with the asyncio backend, yielding each result.
+
+        The async counterpart of :meth:`iter_results`, for use as
+        ``async for result in crawler.aiter_results()``.  Requires
+        aiohttp.
+        """
+        from pycrawl.aio import iter_crawler_results
+        return iter_crawler_results(self, queue_size)
@@ -0,0 +1,412 @@
+# -*- coding: utf-8 -*-
+
+"""Crawling with several processes, each owning a share of the URLs.
+
+Every URL belongs to one of N partitions, chosen by hashing its host
+(or, with ``partition_by='url'``, the whole canonical URL).  Each crawl
+process owns one partition: only it queues, fetches and remembers the
+URLs in that partition, and only it reads their hosts' robots.txt and
+applies their crawl delays.  Partitioning by host therefore keeps each
+site's politeness in a single process.
+
+Links found to URLs in other partitions are forwarded through a
+:class:`Mailbox`, a SQLite file shared by the processes, in batches.
+A :class:`PartitionedFrontier` does the forwarding and receiving, so
+the crawl engines don't know they're running distributed: when a
+partition runs out of URLs, its engine waits on the frontier for more
+rather than finishing, and so keeps its scheduler, and the crawl
+delays it has applied so far, for the whole crawl.
+
+A coordinator starts the processes and watches the mailbox: the crawl
+is over once every process is idle and no links are waiting to be
+delivered, checked in a single transaction so that a link in transit
+can't be missed.  Each process then stores its statistics in the
+mailbox, for the coordinator to merge.
+"""
+
+from __future__ import absolute_import
+
+from contextlib import contextmanager
+import json
+import logging
+import multiprocessing
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+import zlib
+
+from pycrawl.urls import canonical_url, parse_url
+
+
+log = logging.getLogger(__name__)
+
+PARTITION_BY = ['host', 'url']
+
+DEFAULT_BATCH_SIZE = 500
+DEFAULT_POLL_INTERVAL = 0.5  # seconds
+# how long to wait for the mailbox if another process is writing to it
+LOCK_TIMEOUT = 60.0
+
+
+def partition_of(url, partitions, by='host'):
+    """Return the partition, from 0 to ``partitions - 1``, owning url.
+
+    The hash is stable across processes and Python versions, unlike
+    the built-in ``hash()`` of a string.
+
+    :param url: an absolute URL
+    :param partitions: the number of partitions
+    :param by: ``'host'`` to keep each host's URLs together, or
+        ``'url'`` to spread them out
+    """
+    parsed = parse_url(url)
+    key = parsed.netloc.lower() if by == 'host' else parsed.url
+    return zlib.crc32(key.encode('utf-8')) % partitions
+
+
+class Mailbox(object):
+    """Links in transit between the processes of a distributed crawl.
+
+    Safe to open from several processes at once, each opening its own,
+    and to use from several threads.
+
+    :param path: SQLite file shared by the processes
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.RLock()
+        self._db = sqlite3.connect(path, timeout=LOCK_TIMEOUT,
+                                   isolation_level=None,
+                                   check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS links ("
+                         " id INTEGER PRIMARY KEY,"
+                         " partition INTEGER NOT NULL,"
+                         " url TEXT NOT NULL,"
+                         " depth INTEGER NOT NULL)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS links_partition"
+                         " ON links (partition, id)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS partitions ("
+                         " partition INTEGER PRIMARY KEY,"
+                         " idle INTEGER NOT NULL DEFAULT 0,"
+                         " stats TEXT)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS meta ("
+                         " key TEXT PRIMARY KEY, value TEXT)")
+
+    @contextmanager
+    def _transaction(self, begin="BEGIN IMMEDIATE"):
+        # IMMEDIATE takes the write lock at once, so what's read can't
+        # change before it's written back
+        with self._lock:
+            self._db.execute(begin)
+            try:
+                yield self._db
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._db.execute("COMMIT")
+
+    def reset(self, partitions):
+        """Discard any earlier crawl and prepare for a new one.
+
+        Every partition starts busy, so the crawl can't look finished
+        before each process has crawled its seeds.
+        """
+        with self._transaction() as db:
+            db.execute("DELETE FROM links")
+            db.execute("DELETE FROM partitions")
+            db.execute("DELETE FROM meta")
+            db.executemany("INSERT INTO partitions (partition) VALUES (?)",
+                           [(n,) for n in range(partitions)])
+
+    def send(self, links):
+        """Post ``(partition, url, depth)`` triples to their owners."""
+        if links:
+            with self._transaction() as db:
+                db.executemany("INSERT INTO links (partition, url, depth)"
+                               " VALUES (?, ?, ?)", links)
+
+    def receive(self, partition, idle=False):
+        """Take the links posted to a partition.
+
+        :param idle: if true and there are none, mark the partition as
+            idle until links next arrive for it
+        :return: a list of ``(url, depth)`` pairs
+        """
+        with self._transaction() as db:
+            rows = db.execute("SELECT id, url, depth FROM links"
+                              " WHERE partition = ? ORDER BY id",
+                              (partition,)).fetchall()
+            if rows:
+                db.execute("DELETE FROM links WHERE partition = ?"
+                           " AND id <= ?", (partition, rows[-1][0]))
+            db.execute("UPDATE partitions SET idle = ? WHERE partition = ?",
+                       (int(idle and not rows), partition))
+        return [(url, depth) for _, url, depth in rows]
+
+    def is_quiescent(self):
+        """Is every partition idle, with no links left to deliver?"""
+        # one read transaction, so both counts come from one snapshot
+        with self._transaction("BEGIN") as db:
+            busy = db.execute("SELECT COUNT(*) FROM partitions"
+                              " WHERE idle = 0").fetchone()[0]
+            waiting = db.execute("SELECT COUNT(*) FROM links").fetchone()[0]
+        return busy == 0 and waiting == 0
+
+    def finish(self):
+        """Tell every process the crawl is over."""
+        with self._transaction() as db:
+            db.execute("INSERT OR REPLACE INTO meta VALUES ('finished', '1')")
+
+    def is_finished(self):
+        with self._lock:
+            row = self._db.execute("SELECT value FROM meta"
+                                   " WHERE key = 'finished'").fetchone()
+        return row is not None
+
+    def put_stats(self, partition, snapshot):
+        """Store a partition's final :meth:`CrawlStats.snapshot`."""
+        with self._transaction() as db:
+            db.execute("UPDATE partitions SET stats = ? WHERE partition = ?",
+                       (json.dumps(snapshot), partition))
+
+    def stats(self):
+        """Return the stats snapshots stored so far."""
+        with self._lock:
+            rows = self._db.execute("SELECT stats FROM partitions"
+                                    " WHERE stats IS NOT NULL"
+                                    " ORDER BY partition").fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+class PartitionedFrontier(object):
+    """A frontier for one partition of a distributed crawl.
+
+    URLs in this partition are queued in the wrapped frontier; others
+    are sent to their owners through the mailbox, in batches.  Links
+    posted to this partition are collected whenever the scheduler asks
+    for new hosts, at most every ``poll_interval`` seconds; once the
+    partition has nothing to do, :meth:`idle` marks it as idle in the
+    mailbox until links arrive or the crawl is over.
+
+    URLs forwarded are remembered in the wrapped frontier's seen set,
+    so a link found on every page is only sent once.
+
+    :param frontier: the :class:`~pycrawl.frontier.Frontier` holding
+        this partition's URLs
+    :param mailbox: the crawl's :class:`Mailbox`
+    :param partition: this partition's number
+    :param partitions: the number of partitions
+    :param partition_by: ``'host'`` or ``'url'``; see
+        :func:`partition_of`
+    """
+
+    def __init__(self, frontier, mailbox, partition, partitions,
+                 partition_by='host', batch_size=DEFAULT_BATCH_SIZE,
+                 poll_interval=DEFAULT_POLL_INTERVAL, clock=time.time):
+        self.frontier = frontier
+        self.mailbox = mailbox
+        self.partition = partition
+        self.partitions = partitions
+        self.partition_by = partition_by
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.clock = clock
+        self._outbox = []
+        self._last_poll = None
+        self._idle = False
+        self._finished = False
+
+    @property
+    def seen(self):
+        return self.frontier.seen
+
+    def __len__(self):
+        return len(self.frontier)
+
+    def owner(self, url):
+        """Return the partition owning url."""
+        return partition_of(url, self.partitions, self.partition_by)
+
+    def add(self, url, depth):
+        """Queue url if it's in this partition, or else forward it.
+
+        :return: True if the URL was queued here
+        """
+        owner = self.owner(url)
+        if owner == self.partition:
+            return self.frontier.add(url, depth)
+        if url not in self.frontier.seen:
+            self.frontier.seen.add(url)
+            self._outbox.append((owner, url, depth))
+            if len(self._outbox) >= self.batch_size:
+                self.flush()
+        return False
+
+    def requeue(self, url, depth):
+        self.frontier.requeue(url, depth)
+
+    def pop(self, host=None):
+        return self.frontier.pop(host)
+
+    def pending(self, host):
+        return self.frontier.pending(host)
+
+    def pop_new_hosts(self):
+        now = self.clock()
+        # while idle, idle() does the polling, so as not to mark this
+        # partition busy again with nothing to do
+        if not self._idle and (self._last_poll is None or
+                               now - self._last_poll >= self.poll_interval):
+            self.exchange()
+        return self.frontier.pop_new_hosts()
+
+    def idle(self):
+        """Wait for links from other partitions, having none to crawl.
+
+        Called by the scheduler when no URLs are queued or in flight.
+        The mailbox is polled at most every ``poll_interval`` seconds.
+
+        :return: seconds to wait before asking again (0 if links have
+            arrived), or None once the coordinator has finished the
+            crawl
+        """
+        if self._finished:
+            return None
+        now = self.clock()
+        if self._idle and now - self._last_poll < self.poll_interval:
+            return self._last_poll + self.poll_interval - now
+        if self.mailbox.is_finished():
+            self._finished = True
+            return None
+        if self.exchange(idle=True):
+            return 0.0
+        return self.poll_interval
+
+    def restore(self, pending, seen):
+        self.frontier.restore(pending, seen)
+
+    def flush(self):
+        """Send the links waiting to be forwarded."""
+        outbox = self._outbox
+        self._outbox = []
+        self.mailbox.send(outbox)
+
+    def exchange(self, idle=False):
+        """Forward waiting links, and queue those posted to us.
+
+        :param idle: if true and nothing has arrived, mark this
+            partition as idle in the mailbox
+        :return: the number of links received
+        """
+        self._last_poll = self.clock()
+        self.flush()
+        received = self.mailbox.receive(self.partition, idle=idle)
+        for url, depth in received:
+            self.frontier.add(url, depth)
+        self._idle = idle and not received
+        return len(received)
+
+    def close(self):
+        # the crawl engines close their frontier when they finish, but
+        # links may still arrive until the crawl is over; see
+        # run_partition
+        self.flush()
+
+
+def run_partition(frontier, seed_urls, crawl,
+                  poll_interval=DEFAULT_POLL_INTERVAL):
+    """Crawl one partition until the coordinator says it's finished.
+
+    The crawl starts from the seeds this partition owns, and goes on
+    to the links that arrive from other partitions in the same run, so
+    that each host's crawl delay is kept between them.
+
+    :param frontier: the partition's :class:`PartitionedFrontier`
+    :param seed_urls: the crawl's seed URLs, from every partition
+    :param crawl: function called as ``crawl(seed_urls)`` to crawl
+        from ``frontier`` until it is idle and the crawl is finished
+    """
+    owned = [url for url in seed_urls
+             if frontier.owner(canonical_url(url)) == frontier.partition]
+    try:
+        crawl(owned)
+        # the crawl returns early if its budget is spent; the others
+        # can only finish once this partition is idle too
+        while not frontier.mailbox.is_finished():
+            frontier.exchange(idle=True)
+            time.sleep(poll_interval)
+    finally:
+        frontier.flush()
+        frontier.frontier.close()
+
+
+def _run_worker(argv):
+    # module level, so it can be started by the 'spawn' method
+    from pycrawl.pycrawl import main
+    main(argv)
+
+
+def crawl_distributed(argv, processes, mailbox_path=None, stats=None,
+                      poll_interval=DEFAULT_POLL_INTERVAL):
+    """Run a crawl in several processes, and wait for it to finish.
+
+    Each process runs the command line argv with ``--partition N``
+    added, and so builds its own frontier, robots cache and output.
+
+    :param argv: the crawl's command line, including ``--processes``
+    :param processes: the number of processes (and partitions)
+    :param mailbox_path: SQLite file to exchange links through
+        (default: a temporary file)
+    :param stats: a :class:`~pycrawl.metrics.CrawlStats` to merge the
+        processes' stats into
+    :raise: RuntimeError if a process fails
+    """
+    temp_dir = None
+    if mailbox_path is None:
+        temp_dir = tempfile.mkdtemp(prefix='pycrawl-')
+        mailbox_path = os.path.join(temp_dir, 'mailbox.sqlite')
+    mailbox = Mailbox(mailbox_path)
+    mailbox.reset(processes)
+    get_context = getattr(multiprocessing, 'get_context', None)
+    # spawn, not fork: the parent may already be running threads
+    context = get_context('spawn') if get_context else multiprocessing
+    workers = [context.Process(target=_run_worker,
+                               args=(list(argv) + [
+                                   '--partition', str(n),
+                                   '--mailbox', mailbox_path],),
+                               name='pycrawl-partition-{}'.format(n))
+               for n in range(processes)]
+    failed = None
+    try:
+        for worker in workers:
+            worker.start()
+        while not mailbox.is_quiescent():
+            failed = [n for n, worker in enumerate(workers)
+                      if worker.exitcode is not None]
+            if failed:
+                break
+            time.sleep(poll_interval)
+    finally:
+        mailbox.finish()
+        for worker in workers:
+            if worker.pid is not None:
+                worker.join()
+        if stats is not None:
+            for snapshot in mailbox.stats():
+                stats.merge(snapshot)
+        mailbox.close()
+        if temp_dir is not None:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+    if failed:
+        raise RuntimeError("crawl process for partition {} exited with "
+                           "status {}".format(failed[0],
+                                              workers[failed[0]].exitcode))
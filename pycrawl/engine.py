@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+
+"""Concurrent crawl engine: a pool of worker threads sharing one frontier."""
+
+from __future__ import absolute_import
+
+import threading
+
+from pycrawl.frontier import Frontier
+from pycrawl.retry import RetryLater
+from pycrawl.scheduler import HostScheduler
+
+
+DEFAULT_PER_HOST_LIMIT = 8
+
+
+class ThreadedCrawl(object):
+    """Crawl with a bounded pool of worker threads.
+
+    Work items are ``(url, depth)`` pairs taken from a shared frontier,
+    so depth limits are enforced per URL rather than by waiting for a
+    whole level to finish.  Which URL is fetched next is up to a
+    :class:`~pycrawl.scheduler.HostScheduler`, so workers skip over
+    URLs for busy hosts, or hosts still within their crawl delay,
+    rather than blocking on them.
+
+    :param process_url: callable taking a URL string and returning a
+        list of raw links found there; it may raise
+        :class:`~pycrawl.retry.RetryLater` to have the URL queued again
+    :param accept_link: callable taking a raw link and returning its
+        canonical URL string, or None if it should not be followed
+    :param workers: number of worker threads
+    :param max_depth: if set, follow links only this many levels deep
+    :param per_host_limit: maximum concurrent requests to a single host
+    :param journal: if given, a :class:`~pycrawl.journal.CrawlJournal`
+        to record added and finished URLs in
+    :param frontier: a :class:`~pycrawl.frontier.Frontier` to use
+        instead of a default one
+    :param scheduler: a :class:`~pycrawl.scheduler.HostScheduler` to
+        take URLs from, instead of one over ``frontier`` that only
+        applies ``per_host_limit``
+    """
+
+    def __init__(self, process_url, accept_link, workers,
+                 max_depth=None, per_host_limit=None, journal=None,
+                 frontier=None, scheduler=None):
+        if workers < 1:
+            raise ValueError("need at least one worker")
+        self.process_url = process_url
+        self.accept_link = accept_link
+        self.workers = workers
+        self.max_depth = max_depth
+        self.per_host_limit = per_host_limit or DEFAULT_PER_HOST_LIMIT
+        self.journal = journal
+
+        if scheduler is None:
+            if frontier is None:
+                frontier = Frontier()
+            scheduler = HostScheduler(frontier,
+                                      per_host_limit=self.per_host_limit)
+        self.scheduler = scheduler
+        self.frontier = scheduler.frontier
+
+        self._lock = threading.Condition()
+        self._in_flight = 0
+        self._error = None
+
+    def restore(self, pending, seen):
+        """Continue an earlier crawl instead of starting from seed URLs.
+
+        :param pending: ``(url, depth)`` pairs still to be processed
+        :param seen: URLs already added to the frontier at some point
+        """
+        with self._lock:
+            self.frontier.restore(pending, seen)
+
+    def run(self, seed_urls=()):
+        """Crawl from the given canonical URLs until the frontier is empty.
+
+        If any worker raises, the crawl stops and the exception is
+        re-raised here once all workers have exited.
+        """
+        with self._lock:
+            for url in seed_urls:
+                self._add(url, 0)
+
+        threads = [threading.Thread(target=self._work)
+                   for _ in range(self.workers)]
+        for t in threads:
+            t.daemon = True
+            t.start()
+        for t in threads:
+            t.join()
+
+        if self._error is not None:
+            raise self._error
+
+    def _add(self, url, depth):
+        # caller must hold self._lock
+        if self.frontier.add(url, depth) and self.journal is not None:
+            self.journal.add(url, depth)
+
+    def _take(self):
+        """Block until the scheduler hands out a URL.
+
+        :return: ``(url, depth, host)``, or None when the crawl is over
+        """
+        with self._lock:
+            while True:
+                if self._error is not None:
+                    return None
+                item, wait = self.scheduler.take()
+                if item is not None:
+                    self._in_flight += 1
+                    return item
+                if self._in_flight == 0 and wait is None:
+                    # nothing queued that we can take and nobody left
+                    # to produce more work
+                    self._lock.notify_all()
+                    return None
+                self._lock.wait(wait)
+
+    def _work(self):
+        while True:
+            item = self._take()
+            if item is None:
+                return
+            url, depth, host = item
+            try:
+                links = self.process_url(url)
+                if self.max_depth is not None and depth >= self.max_depth:
+                    links = []
+                accepted = [self.accept_link(link) for link in links]
+            except RetryLater as e:
+                with self._lock:
+                    self.scheduler.retry(url, depth, host, e.delay)
+                    self._finish(host)
+                continue
+            except Exception as e:
+                with self._lock:
+                    if self._error is None:
+                        self._error = e
+                    self._finish(host)
+                return
+            with self._lock:
+                for link in accepted:
+                    if link is not None:
+                        self._add(link, depth + 1)
+                if self.journal is not None:
+                    self.journal.done(url)
+                self._finish(host)
+
+    def _finish(self, host):
+        # caller must hold self._lock
+        self.scheduler.done(host)
+        self._in_flight -= 1
+        self._lock.notify_all()
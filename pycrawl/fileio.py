@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+
+"""Helpers for writing downloaded files safely."""
+
+from contextlib import contextmanager
+import os
+import tempfile
+
+
+# mkstemp creates files readable only by their owner; give downloaded
+# files the permissions a plain open() would have
+_umask = os.umask(0)
+os.umask(_umask)
+FILE_MODE = 0o666 & ~_umask
+
+
+def ensure_parent_dir(filename):
+    """Create the directory that filename will live in, if necessary."""
+    dirname = os.path.dirname(filename)
+    if dirname and not os.path.isdir(dirname):
+        try:
+            os.makedirs(dirname)
+        except OSError:
+            # another worker may have created it in the meantime
+            if not os.path.isdir(dirname):
+                raise
+
+
+def make_temp_file(filename, mode='wb', make_dirs=True):
+    """Open a temporary file in the directory where filename will live.
+
+    :param make_dirs: create that directory first, if necessary
+    :return: ``(path, file)``
+    """
+    if make_dirs:
+        ensure_parent_dir(filename)
+    dirname, basename = os.path.split(filename)
+    fd, tmp_path = tempfile.mkstemp(prefix='.' + basename + '.',
+                                    suffix='.part', dir=dirname or '.')
+    return tmp_path, os.fdopen(fd, mode)
+
+
+def commit_temp_file(tmp_path, filename):
+    """Move a finished temporary file into place as filename."""
+    os.chmod(tmp_path, FILE_MODE)
+    os.rename(tmp_path, filename)
+
+
+def discard_temp_file(tmp_path):
+    try:
+        os.remove(tmp_path)
+    except OSError:
+        pass
+
+
+@contextmanager
+def atomic_open(filename, mode='wb'):
+    """Open a temporary file that is renamed to filename when closed.
+
+    The temporary file lives in the same directory as filename, so the
+    rename is atomic: readers see either the old file or the complete
+    new one, never a partial write.  If the block raises, the temporary
+    file is removed and filename is left untouched.
+    """
+    tmp_path, f = make_temp_file(filename, mode)
+    try:
+        with f:
+            yield f
+        commit_temp_file(tmp_path, filename)
+    except BaseException:
+        discard_temp_file(tmp_path)
+        raise
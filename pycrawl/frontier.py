@@ -0,0 +1,511 @@
+# -*- coding: utf-8 -*-
+
+"""The crawl frontier: URLs waiting to be fetched, and URLs already seen.
+
+Each URL is checked against the seen set once, when it's added, so a
+page linked from many others is still queued only once.  The seen set
+can store compact fingerprints or a Bloom filter instead of full URL
+strings, and the queues can spill to disk, so memory stays bounded on
+very large sites.
+
+Instead of first in, first out, queues can hand out the URLs that a
+:class:`Scorer` rates highest first, based on their depth, their path
+and how many links to them have been found.
+
+Frontiers are not thread-safe; engines using several threads must hold
+a lock around them.
+"""
+
+from __future__ import absolute_import
+
+from collections import deque
+import functools
+import hashlib
+import heapq
+import itertools
+import json
+import math
+import re
+import struct
+import tempfile
+
+from pycrawl.urls import parse_url
+
+
+DEFAULT_MEMORY_QUEUE_SIZE = 100000
+DEFAULT_BLOOM_CAPACITY = 1000000
+
+
+def _digest(url):
+    if not isinstance(url, bytes):
+        url = url.encode('utf-8')
+    return hashlib.sha1(url).digest()
+
+
+def fingerprint(url):
+    """Return a 64-bit integer fingerprint of a URL string."""
+    return struct.unpack('>Q', _digest(url)[:8])[0]
+
+
+class ExactSet(object):
+    """Seen set storing full URL strings: exact, but the largest."""
+
+    def __init__(self):
+        self._urls = set()
+
+    def __contains__(self, url):
+        return url in self._urls
+
+    def __len__(self):
+        return len(self._urls)
+
+    def add(self, url):
+        self._urls.add(url)
+
+
+class FingerprintSet(object):
+    """Seen set storing 64-bit URL fingerprints instead of the URLs.
+
+    Memory use no longer depends on URL length.  Two URLs only collide
+    with probability around n / 2**64, which is negligible for any
+    realistic crawl.
+    """
+
+    def __init__(self):
+        self._fingerprints = set()
+
+    def __contains__(self, url):
+        return fingerprint(url) in self._fingerprints
+
+    def __len__(self):
+        return len(self._fingerprints)
+
+    def add(self, url):
+        self._fingerprints.add(fingerprint(url))
+
+
+class BloomFilter(object):
+    """Seen set using a fixed amount of memory, with false positives.
+
+    A URL that was never added is reported as seen with probability
+    about ``error_rate`` (once ``capacity`` URLs have been added); such
+    URLs are skipped by the crawl.  URLs that were added are always
+    reported as seen.
+
+    :param capacity: number of URLs the filter is sized for
+    :param error_rate: false positive rate at that capacity
+    """
+
+    def __init__(self, capacity=DEFAULT_BLOOM_CAPACITY, error_rate=0.001):
+        if not 0 < error_rate < 1:
+            raise ValueError("error_rate must be between 0 and 1")
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.num_bits = max(8, int(math.ceil(
+            -capacity * math.log(error_rate) / math.log(2) ** 2)))
+        self.num_hashes = max(1, int(round(
+            self.num_bits / float(capacity) * math.log(2))))
+        self._bits = bytearray((self.num_bits + 7) // 8)
+        self._count = 0
+
+    def _positions(self, url):
+        h1, h2 = struct.unpack('>QQ', _digest(url)[:16])
+        for i in range(self.num_hashes):
+            yield (h1 + i * h2) % self.num_bits
+
+    def __contains__(self, url):
+        return all(self._bits[pos >> 3] & (1 << (pos & 7))
+                   for pos in self._positions(url))
+
+    def __len__(self):
+        return self._count
+
+    def add(self, url):
+        for pos in self._positions(url):
+            self._bits[pos >> 3] |= 1 << (pos & 7)
+        self._count += 1
+
+
+class SpillPool(object):
+    """Memory budget and spill file shared by a frontier's queues.
+
+    Between them, the :class:`SpillQueue` objects sharing a pool keep
+    at most ``memory_size`` items in memory, and spill the rest to one
+    temporary file, open only while it holds items.  Each spilled item
+    points to the next one spilled from its queue, so queues only need
+    to remember where their spilled items start and end: memory and
+    open files stay bounded however many hosts are queued.
+
+    :param memory_size: most items held in memory, over all the queues
+    :param spill_dir: directory for the spill file (default: the
+        system temporary directory)
+    """
+
+    # each item is stored as the offset of the next one from its queue
+    # (or -1), then the item as a line of JSON
+    _next = struct.Struct('>q')
+
+    def __init__(self, memory_size=DEFAULT_MEMORY_QUEUE_SIZE, spill_dir=None):
+        self.memory_size = memory_size
+        self.spill_dir = spill_dir
+        self.in_memory = 0
+        self.spilled = 0
+        self._file = None
+
+    def has_room(self):
+        return self.in_memory < self.memory_size
+
+    def write(self, item, previous=None):
+        """Spill item to the file.
+
+        :param previous: the offset of the item spilled before it from
+            the same queue, if it hasn't been read back yet
+        :return: the offset of item, for :meth:`read`
+        """
+        if self._file is None:
+            self._file = tempfile.TemporaryFile(dir=self.spill_dir)
+        self._file.seek(0, 2)
+        offset = self._file.tell()
+        line = json.dumps([item[0], item[1]]) + '\n'
+        self._file.write(self._next.pack(-1) + line.encode('utf-8'))
+        if previous is not None:
+            self._file.seek(previous)
+            self._file.write(self._next.pack(offset))
+        self.spilled += 1
+        return offset
+
+    def read(self, offset):
+        """Read back the item spilled at offset.
+
+        :return: ``(item, next_offset)``, where ``next_offset`` is the
+            offset of the next item spilled from the same queue, or -1
+        """
+        self._file.seek(offset)
+        next_offset, = self._next.unpack(self._file.read(self._next.size))
+        url, depth = json.loads(self._file.readline().decode('utf-8'))
+        self.forget(1)
+        return (url, depth), next_offset
+
+    def forget(self, count):
+        """Record that count spilled items won't be read back."""
+        self.spilled -= count
+        if not self.spilled and self._file is not None:
+            # nothing left to read; start afresh with the next spill
+            self._file.close()
+            self._file = None
+
+
+class SpillQueue(object):
+    """FIFO queue of ``(url, depth)`` pairs that spills to disk.
+
+    Items are kept in memory while its :class:`SpillPool` has room for
+    them; after that, further items are spilled to the pool's file and
+    read back in batches as the in-memory part drains.
+
+    :param memory_size: maximum number of items held in memory, if
+        no pool is given
+    :param spill_dir: directory for the spill file, if no pool is
+        given (default: the system temporary directory)
+    :param pool: a :class:`SpillPool` shared with other queues
+    """
+
+    def __init__(self, memory_size=DEFAULT_MEMORY_QUEUE_SIZE, spill_dir=None,
+                 pool=None):
+        if pool is None:
+            pool = SpillPool(memory_size, spill_dir)
+        self.pool = pool
+        self._head = deque()
+        self._spilled = 0
+        self._first = None  # offsets of the oldest and newest spilled
+        self._last = None
+
+    def __len__(self):
+        return len(self._head) + self._spilled
+
+    def append(self, item):
+        if self._spilled or not self.pool.has_room():
+            self._last = self.pool.write(
+                item, self._last if self._spilled else None)
+            if not self._spilled:
+                self._first = self._last
+            self._spilled += 1
+        else:
+            self._head.append(item)
+            self.pool.in_memory += 1
+
+    def popleft(self):
+        """Remove and return the oldest item; raise IndexError if empty."""
+        if not self._head and self._spilled:
+            self._refill()
+        item = self._head.popleft()
+        self.pool.in_memory -= 1
+        return item
+
+    def _refill(self):
+        # at least one item, even if other queues have filled the pool
+        while self._spilled and (not self._head or self.pool.has_room()):
+            item, self._first = self.pool.read(self._first)
+            self._head.append(item)
+            self.pool.in_memory += 1
+            self._spilled -= 1
+
+    def close(self):
+        self.pool.in_memory -= len(self._head)
+        self.pool.forget(self._spilled)
+        self._head.clear()
+        self._spilled = 0
+
+
+class Scorer(object):
+    """Rate URLs for a priority frontier; higher scores are crawled first.
+
+    A URL's score is::
+
+        links * link_weight - depth * depth_weight + path weights
+
+    where ``links`` is the number of links to it found so far, and the
+    path weights are those of the patterns its path matches.
+
+    :param depth_weight: score lost for each level deeper
+    :param link_weight: score gained for each link found to the URL
+    :param path_weights: ``(pattern, weight)`` pairs, where pattern is
+        a regular expression searched for in the URL's path
+    """
+
+    def __init__(self, depth_weight=1.0, link_weight=0.0, path_weights=()):
+        self.depth_weight = depth_weight
+        self.link_weight = link_weight
+        self.path_weights = [(re.compile(pattern), weight)
+                             for pattern, weight in path_weights]
+
+    @property
+    def uses_links(self):
+        return bool(self.link_weight)
+
+    def __call__(self, url, depth, links):
+        score = links * self.link_weight - depth * self.depth_weight
+        if self.path_weights:
+            path = parse_url(url).path
+            for pattern, weight in self.path_weights:
+                if pattern.search(path):
+                    score += weight
+        return score
+
+
+class PriorityQueue(object):
+    """Queue of ``(url, depth)`` pairs, handing out the best first.
+
+    Has the same methods as a FIFO queue, so it can be used as a
+    frontier's per-host queue.  URLs with equal scores come out in the
+    order they were added.
+
+    :param score: callable ``score(url, depth, links)`` returning a
+        number; see :class:`Scorer`
+    """
+
+    def __init__(self, score):
+        self.score = score
+        self._heap = []  # (-score, seq, url)
+        self._pending = {}  # url -> [depth, links, seq of current entry]
+        self._seq = itertools.count()
+
+    def __len__(self):
+        return len(self._pending)
+
+    def append(self, item):
+        url, depth = item
+        self._pending[url] = [depth, 1, None]
+        self._push(url)
+
+    def bump(self, url):
+        """Count another link to url, if it is still waiting."""
+        entry = self._pending.get(url)
+        if entry is not None:
+            entry[1] += 1
+            self._push(url)
+
+    def _push(self, url):
+        entry = self._pending[url]
+        entry[2] = seq = next(self._seq)
+        heapq.heappush(self._heap,
+                       (-self.score(url, entry[0], entry[1]), seq, url))
+        if len(self._heap) > 2 * len(self._pending) + 1000:
+            # drop entries superseded by bumps
+            self._heap = [item for item in self._heap
+                          if self._is_current(item[1], item[2])]
+            heapq.heapify(self._heap)
+
+    def _is_current(self, seq, url):
+        entry = self._pending.get(url)
+        return entry is not None and entry[2] == seq
+
+    def popleft(self):
+        """Remove and return the best item; raise IndexError if empty."""
+        while self._heap:
+            _, seq, url = heapq.heappop(self._heap)
+            if self._is_current(seq, url):
+                depth = self._pending.pop(url)[0]
+                return (url, depth)
+        raise IndexError("pop from an empty queue")
+
+
+class Frontier(object):
+    """URLs waiting to be crawled, each tagged with its depth.
+
+    Waiting URLs are kept in a FIFO queue per host (network location),
+    so a scheduler can take the next URL for any host without reading
+    past other hosts' URLs; :meth:`pop` with no host takes turns
+    between hosts.
+
+    :param seen: set-like object recording URLs ever added (default:
+        a :class:`FingerprintSet`)
+    :param new_queue: callable returning an empty queue of
+        ``(url, depth)`` pairs, with ``append``, ``popleft`` and
+        ``__len__`` (default: :class:`collections.deque`)
+    :param count_links: tell queues (which must have a ``bump``
+        method, like :class:`PriorityQueue`) each time a URL still
+        waiting is added again
+    """
+
+    def __init__(self, seen=None, new_queue=deque, count_links=False):
+        self.seen = seen if seen is not None else FingerprintSet()
+        self.new_queue = new_queue
+        self.count_links = count_links
+        self.queues = {}  # host -> queue, for hosts with URLs waiting
+        self._turns = deque()  # hosts in the order they take turns
+        self._in_turns = set()
+        self._new_hosts = []
+        self._len = 0
+
+    def __len__(self):
+        return self._len
+
+    def add(self, url, depth):
+        """Queue url unless it has been added before.
+
+        :return: True if the URL was queued
+        """
+        if url in self.seen:
+            if self.count_links:
+                queue = self.queues.get(parse_url(url).netloc)
+                if queue is not None:
+                    queue.bump(url)
+            return False
+        self.seen.add(url)
+        self._append(url, depth)
+        return True
+
+    def _append(self, url, depth):
+        host = parse_url(url).netloc
+        queue = self.queues.get(host)
+        if queue is None:
+            queue = self.queues[host] = self.new_queue()
+            self._new_hosts.append(host)
+            if host not in self._in_turns:
+                self._in_turns.add(host)
+                self._turns.append(host)
+        queue.append((url, depth))
+        self._len += 1
+
+    def requeue(self, url, depth):
+        """Queue a URL that was taken, but needs to be fetched again."""
+        self._append(url, depth)
+
+    def pop(self, host=None):
+        """Return the next ``(url, depth)`` pair, or None if empty.
+
+        :param host: take the next URL for this host, rather than from
+            whichever host's turn it is
+        """
+        if host is None:
+            # drop hosts whose queues have emptied since their turn
+            while self._turns and self._turns[0] not in self.queues:
+                self._in_turns.discard(self._turns.popleft())
+            if not self._turns:
+                return None
+            host = self._turns[0]
+            self._turns.rotate(-1)
+        queue = self.queues.get(host)
+        if queue is None:
+            return None
+        item = queue.popleft()
+        self._len -= 1
+        if not len(queue):
+            del self.queues[host]
+            close = getattr(queue, 'close', None)
+            if close is not None:
+                close()
+        return item
+
+    def pending(self, host):
+        """Return the number of URLs waiting for host."""
+        queue = self.queues.get(host)
+        return len(queue) if queue is not None else 0
+
+    def pop_new_hosts(self):
+        """Return hosts that have had URLs queued since the last call,
+        having had none waiting before."""
+        hosts = self._new_hosts
+        self._new_hosts = []
+        return hosts
+
+    def idle(self):
+        """Called by the scheduler when no URLs are queued or in flight.
+
+        :return: seconds to wait before looking for URLs again, or None
+            if no more will be added
+        """
+        return None
+
+    def restore(self, pending, seen):
+        """Load the state of an earlier crawl.
+
+        :param pending: ``(url, depth)`` pairs still to be crawled
+        :param seen: URLs already added at some point
+        """
+        for url in seen:
+            self.seen.add(url)
+        for url, depth in pending:
+            self.seen.add(url)
+            self._append(url, depth)
+
+    def close(self):
+        for queue in self.queues.values():
+            close = getattr(queue, 'close', None)
+            if close is not None:
+                close()
+
+
+def make_frontier(seen_set='fingerprint', bloom_capacity=None,
+                  bloom_error_rate=None, spill_dir=None,
+                  memory_queue_size=None, scorer=None):
+    """Build a Frontier from command-line style options.
+
+    :param seen_set: ``'exact'``, ``'fingerprint'`` or ``'bloom'``
+    :param bloom_capacity: number of URLs a Bloom filter is sized for
+    :param bloom_error_rate: a Bloom filter's false positive rate
+    :param spill_dir: if given, spill queued URLs to a file in this
+        directory once ``memory_queue_size`` are held in memory, over
+        all the hosts
+    :param scorer: if given, a :class:`Scorer` (or other callable) to
+        order each host's queue by; can't be used with ``spill_dir``
+    """
+    if seen_set == 'exact':
+        seen = ExactSet()
+    elif seen_set == 'fingerprint':
+        seen = FingerprintSet()
+    elif seen_set == 'bloom':
+        seen = BloomFilter(bloom_capacity or DEFAULT_BLOOM_CAPACITY,
+                           bloom_error_rate or 0.001)
+    else:
+        raise ValueError("unknown seen set type {!r}".format(seen_set))
+    new_queue = deque
+    if scorer is not None:
+        if spill_dir is not None:
+            raise ValueError("a priority frontier can't spill to disk")
+        new_queue = functools.partial(PriorityQueue, scorer)
+    elif spill_dir is not None:
+        new_queue = functools.partial(SpillQueue, pool=SpillPool(
+            memory_queue_size or DEFAULT_MEMORY_QUEUE_SIZE, spill_dir))
+    return Frontier(seen=seen, new_queue=new_queue,
+                    count_links=getattr(scorer, 'uses_links', False))
@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+
+"""Persistent crawl journal, so an interrupted crawl can be resumed.
+
+The journal is a SQLite file recording every URL added to the frontier
+(with its depth) and whether it has been processed yet.  Updates are
+buffered in memory and written in batches, so journaling costs little
+per URL; a checkpoint flushes the buffer in a single transaction.
+"""
+
+import sqlite3
+import threading
+import time
+
+
+DEFAULT_BATCH_SIZE = 500
+DEFAULT_CHECKPOINT_INTERVAL = 5.0  # seconds
+
+
+class CrawlJournal(object):
+    """Record of a crawl's frontier and finished URLs.
+
+    Safe to use from several threads at once.
+
+    :param path: SQLite file to write to
+    :param batch_size: write a checkpoint after this many updates
+    :param interval: write a checkpoint after this many seconds
+    """
+
+    def __init__(self, path, batch_size=DEFAULT_BATCH_SIZE,
+                 interval=DEFAULT_CHECKPOINT_INTERVAL):
+        self.path = path
+        self.batch_size = batch_size
+        self.interval = interval
+        self._lock = threading.RLock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("CREATE TABLE IF NOT EXISTS urls ("
+                         " url TEXT PRIMARY KEY,"
+                         " depth INTEGER NOT NULL,"
+                         " done INTEGER NOT NULL DEFAULT 0)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS meta ("
+                         " key TEXT PRIMARY KEY, value TEXT)")
+        self._db.commit()
+        self._added = []
+        self._done = []
+        self._last_checkpoint = time.time()
+        self._checkpoint_requested = False
+        self._closed = False
+
+    def reset(self, root_url):
+        """Discard any previous crawl and start recording a new one."""
+        with self._lock:
+            self._added = []
+            self._done = []
+            with self._db:
+                self._db.execute("DELETE FROM urls")
+                self._db.execute("DELETE FROM meta")
+                self._db.execute("INSERT INTO meta VALUES ('root_url', ?)",
+                                 (root_url,))
+
+    def root_url(self):
+        """Return the root URL of the recorded crawl, or None."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT value FROM meta WHERE key = 'root_url'").fetchone()
+        return row[0] if row else None
+
+    def pending(self):
+        """Return ``(url, depth)`` pairs added but not yet done.
+
+        Pairs are in the order they were added, so a resumed crawl
+        keeps its breadth-first order.
+        """
+        self.checkpoint()
+        with self._lock:
+            return self._db.execute(
+                "SELECT url, depth FROM urls WHERE done = 0"
+                " ORDER BY rowid").fetchall()
+
+    def seen(self):
+        """Return the set of all URLs recorded, done or not."""
+        self.checkpoint()
+        with self._lock:
+            return set(row[0] for row in
+                       self._db.execute("SELECT url FROM urls"))
+
+    def done_urls(self):
+        """Return the set of URLs that have been processed."""
+        self.checkpoint()
+        with self._lock:
+            return set(row[0] for row in
+                       self._db.execute("SELECT url FROM urls WHERE done = 1"))
+
+    def add(self, url, depth):
+        """Record that url was added to the frontier at the given depth."""
+        with self._lock:
+            if self._closed:
+                return
+            self._added.append((url, depth))
+            self._maybe_checkpoint()
+
+    def done(self, url):
+        """Record that url has been processed."""
+        with self._lock:
+            if self._closed:
+                return
+            self._done.append((url,))
+            self._maybe_checkpoint()
+
+    def request_checkpoint(self):
+        """Ask for a checkpoint at the next update.
+
+        Unlike :meth:`checkpoint`, this is safe to call from a signal
+        handler.
+        """
+        self._checkpoint_requested = True
+
+    def _maybe_checkpoint(self):
+        # caller must hold self._lock
+        if (self._checkpoint_requested or
+                len(self._added) + len(self._done) >= self.batch_size or
+                time.time() - self._last_checkpoint >= self.interval):
+            self.checkpoint()
+
+    def checkpoint(self):
+        """Write all buffered updates to disk in one transaction."""
+        with self._lock:
+            if self._closed:
+                return
+            added, self._added = self._added, []
+            done, self._done = self._done, []
+            if added or done:
+                with self._db:
+                    self._db.executemany(
+                        "INSERT OR IGNORE INTO urls (url, depth)"
+                        " VALUES (?, ?)", added)
+                    self._db.executemany(
+                        "UPDATE urls SET done = 1 WHERE url = ?", done)
+            self._last_checkpoint = time.time()
+            self._checkpoint_requested = False
+
+    def close(self):
+        """Write a final checkpoint and close the file."""
+        with self._lock:
+            if self._closed:
+                return
+            self.checkpoint()
+            self._closed = True
+            self._db.close()
@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+
+"""Single-pass link extraction and rewriting.
+
+Rather than building a document tree and serializing it again, the
+document is tokenized once, recording where each link attribute's
+value lies in the text.  Rewritten links are spliced into those spans
+and everything else is copied through unchanged, so the output differs
+from the input only in the links that were changed.
+"""
+
+from __future__ import absolute_import
+
+import re
+try:  # Python 3
+    from html import escape
+    from html.parser import HTMLParser
+    from urllib.parse import urlparse
+except ImportError:  # Python 2
+    from cgi import escape
+    from HTMLParser import HTMLParser
+    from urlparse import urlparse
+
+from pycrawl.urls import parse_url
+
+
+# tag name -> attribute holding the link
+LINK_ATTRS = {'a': 'href', 'img': 'src'}
+
+# attributes within a start tag, as HTMLParser finds them
+_attr_re = re.compile(
+    r'((?<=[\'"\s/])[^\s/>][^\s/=>]*)'
+    r'(\s*=+\s*(\'([^\']*)\'|"([^"]*)"|(?![\'"])([^>\s]*)))?'
+    r'(?:\s|/(?!>))*')
+
+
+def localize_link(link, hostname):
+    """Decide how a link should appear in the downloaded copy of a page.
+
+    :param link: link target as found in the document
+    :param hostname: hostname from which the document came
+    :return: the link to write, made relative if it points to hostname,
+        or None if it isn't a link to follow (eg. ``mailto:``)
+    """
+    try:
+        parsed = parse_url(link)
+    except ValueError:
+        # malformed, so it can't be one of ours; leave it as it is
+        return link
+    if parsed.scheme == 'mailto':
+        return None
+    if parsed.hostname == hostname:
+        # keep the query and fragment, which parse_url drops
+        return urlparse(link)._replace(scheme='', netloc='').geturl()
+    return link
+
+
+class _LinkScanner(HTMLParser):
+    """Record the position and value of each link attribute."""
+
+    def __init__(self, html):
+        HTMLParser.__init__(self)
+        self.spans = []
+        # offset of the start of each line, to turn getpos() into an
+        # offset into the document
+        self._line_starts = [0]
+        self._line_starts.extend(m.end() for m in re.finditer('\n', html))
+
+    def handle_starttag(self, tag, attrs):
+        attrname = LINK_ATTRS.get(tag)
+        if attrname is None:
+            return
+        # use the value HTMLParser decoded (ie. with entities resolved),
+        # but find where its raw text lies so it can be replaced
+        value = None
+        for name, attr_value in attrs:
+            if name == attrname:
+                value = attr_value
+                break
+        if value is None:
+            return
+        lineno, col = self.getpos()
+        tag_start = self._line_starts[lineno - 1] + col
+        text = self.get_starttag_text()
+        for m in _attr_re.finditer(text, len(tag) + 1):
+            if m.group(1).lower() != attrname:
+                continue
+            for group in (4, 5, 6):
+                if m.group(group) is not None:
+                    start, end = m.span(group)
+                    self.spans.append((tag_start + start, tag_start + end,
+                                       value))
+                    return
+            return
+
+
+def find_links(html):
+    """List the link attributes in an HTML document, in document order.
+
+    :param html: an HTML document
+    :return: list of ``(start, end, link)``, where ``html[start:end]``
+        is the raw text of the attribute value and link is its value
+    """
+    scanner = _LinkScanner(html)
+    scanner.feed(html)
+    scanner.close()
+    return scanner.spans
+
+
+def rewrite_links(html, hostname):
+    """Update local links in HTML and list all link targets.
+
+    :param html: original HTML document
+    :param hostname: hostname from which the document came
+    :return: tuple of replacement HTML and list of linked URLs
+    """
+    out = []
+    links = []
+    pos = 0
+    for start, end, link in find_links(html):
+        new_link = localize_link(link, hostname)
+        if new_link is None:
+            continue
+        links.append(new_link)
+        if new_link != link:
+            out.append(html[pos:start])
+            out.append(escape(new_link, True))
+            pos = end
+    out.append(html[pos:])
+    return (''.join(out), links)
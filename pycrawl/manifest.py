@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+
+"""Per-URL manifest for incremental re-crawls.
+
+For each URL saved, the manifest records the validators the server sent
+(ETag and Last-Modified), the size and hash of the body, and the links
+found in it.  On the next crawl these let us make conditional requests,
+and when the server answers 304 Not Modified, keep the local copy and
+reuse the stored links without parsing the document again.
+"""
+
+import hashlib
+import json
+import sqlite3
+import threading
+
+
+DEFAULT_BATCH_SIZE = 100
+
+
+class ManifestEntry(object):
+    """What we know about a previously saved URL."""
+
+    __slots__ = ('etag', 'last_modified', 'length', 'sha1', 'links')
+
+    def __init__(self, etag=None, last_modified=None, length=None,
+                 sha1=None, links=()):
+        self.etag = etag
+        self.last_modified = last_modified
+        self.length = length
+        self.sha1 = sha1
+        self.links = list(links)
+
+    def conditional_headers(self):
+        """Request headers asking the server to send the body only if changed.
+        """
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+
+class BodyDigest(object):
+    """Count and hash a body as it streams past."""
+
+    def __init__(self):
+        self.size = 0
+        self._hash = hashlib.sha1()
+
+    def wrap(self, chunks):
+        """Pass byte chunks through, hashing each one."""
+        for chunk in chunks:
+            self.update(chunk)
+            yield chunk
+
+    def update(self, chunk):
+        self.size += len(chunk)
+        self._hash.update(chunk)
+
+    def hexdigest(self):
+        return self._hash.hexdigest()
+
+
+class Manifest(object):
+    """SQLite-backed store of :class:`ManifestEntry` objects, keyed by URL.
+
+    Safe to use from several threads at once.  New entries are buffered
+    and written in batches; call :meth:`close` to write the remainder.
+
+    :param path: SQLite file to use
+    :param batch_size: write after this many new entries
+    """
+
+    def __init__(self, path, batch_size=DEFAULT_BATCH_SIZE):
+        self.path = path
+        self.batch_size = batch_size
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("CREATE TABLE IF NOT EXISTS manifest ("
+                         " url TEXT PRIMARY KEY,"
+                         " etag TEXT,"
+                         " last_modified TEXT,"
+                         " length INTEGER,"
+                         " sha1 TEXT,"
+                         " links TEXT)")
+        self._db.commit()
+        self._pending = {}
+
+    def get(self, url):
+        """Return the entry for url, or None."""
+        with self._lock:
+            try:
+                return self._pending[url]
+            except KeyError:
+                pass
+            row = self._db.execute(
+                "SELECT etag, last_modified, length, sha1, links"
+                " FROM manifest WHERE url = ?", (url,)).fetchone()
+        if row is None:
+            return None
+        etag, last_modified, length, sha1, links = row
+        return ManifestEntry(etag, last_modified, length, sha1,
+                             json.loads(links))
+
+    def put(self, url, entry):
+        """Record the entry for url."""
+        with self._lock:
+            self._pending[url] = entry
+            if len(self._pending) >= self.batch_size:
+                self._flush()
+
+    def flush(self):
+        """Write buffered entries to disk."""
+        with self._lock:
+            self._flush()
+
+    def _flush(self):
+        # caller must hold self._lock
+        if not self._pending:
+            return
+        rows = [(url, e.etag, e.last_modified, e.length, e.sha1,
+                 json.dumps(e.links))
+                for url, e in self._pending.items()]
+        with self._db:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO manifest VALUES (?, ?, ?, ?, ?, ?)",
+                rows)
+        self._pending = {}
+
+    def close(self):
+        with self._lock:
+            self._flush()
+            self._db.close()
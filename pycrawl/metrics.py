@@ -0,0 +1,348 @@
+# -*- coding: utf-8 -*-
+
+"""Crawl instrumentation: phase timings, counters and progress reports.
+
+A :class:`CrawlStats` collects, for one crawl:
+
+* a latency histogram for each phase of fetching a URL (``robots``,
+  ``request``, ``download``, ``parse`` and ``write``);
+* counters, such as documents saved and bytes downloaded;
+* the number of responses with each HTTP status;
+* gauges, such as the frontier size, sampled when asked for.
+
+Phase timers are exclusive: time spent in a phase that runs inside
+another one (reading the body while it's being written, say) counts
+towards the inner phase only.
+
+Exporters can follow a crawl as it happens by registering a hook with
+:meth:`CrawlStats.add_hook`, or read the totals at any time with
+:meth:`CrawlStats.snapshot`.
+"""
+
+import bisect
+from contextlib import contextmanager
+import json
+import logging
+import threading
+import time
+
+
+log = logging.getLogger(__name__)
+
+PHASES = ['robots', 'request', 'download', 'parse', 'write']
+
+# upper bounds of latency histogram buckets, in seconds
+BUCKETS = [0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5,
+           1.0, 2.0, 5.0, 10.0, 30.0, 60.0]
+
+DEFAULT_PROGRESS_INTERVAL = 10.0
+
+
+class Histogram(object):
+    """Counts of observations falling into fixed buckets."""
+
+    def __init__(self, bounds=BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+
+    def add(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def merge(self, data):
+        """Add in the observations of another histogram's :meth:`as_dict`,
+        which must have the same bounds."""
+        for i, (_, n) in enumerate(data['buckets']):
+            self.counts[i] += n
+        self.count += data['count']
+        self.sum += data['sum']
+        for name, better in (('min', min), ('max', max)):
+            value = data[name]
+            if value is not None:
+                mine = getattr(self, name)
+                setattr(self, name,
+                        value if mine is None else better(mine, value))
+
+    def quantile(self, q):
+        """Estimate a quantile as the upper bound of its bucket."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank and n:
+                return self.bounds[i] if i < len(self.bounds) else self.max
+        return self.max
+
+    def as_dict(self):
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'min': self.min,
+            'max': self.max,
+            'mean': self.sum / self.count if self.count else None,
+            'p50': self.quantile(0.5),
+            'p90': self.quantile(0.9),
+            'p99': self.quantile(0.99),
+            'buckets': [[bound, n] for bound, n in
+                        zip(self.bounds + ['+Inf'], self.counts)],
+        }
+
+
+class _Timer(object):
+    __slots__ = ('excluded', 'elapsed')
+
+    def __init__(self):
+        self.excluded = 0.0
+        self.elapsed = None
+
+
+class NullStats(object):
+    """Stats that time nothing and record nothing.
+
+    Used when a function is called without a :class:`CrawlStats`, so
+    instrumented code doesn't need to check for one.
+    """
+
+    @contextmanager
+    def time(self, phase):
+        yield
+
+    def time_iter(self, phase, iterable):
+        return iterable
+
+    def record_time(self, phase, seconds):
+        pass
+
+    def count(self, name, n=1):
+        pass
+
+    def status(self, code):
+        pass
+
+
+NULL_STATS = NullStats()
+
+
+class CrawlStats(object):
+    """Metrics for one crawl.  Safe to use from several threads."""
+
+    def __init__(self):
+        self.start_time = time.time()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._phases = dict((phase, Histogram()) for phase in PHASES)
+        self._counters = {}
+        self._statuses = {}
+        self._gauges = {}
+        self._gauge_max = {}
+        self._hooks = []
+
+    def add_hook(self, hook):
+        """Call ``hook(name, value)`` for every observation.
+
+        Names are ``time.<phase>`` (value in seconds),
+        ``status.<code>`` (value 1) and the counter names (value the
+        amount added).  Hooks run on the crawling threads, so they
+        should be quick.
+        """
+        self._hooks.append(hook)
+
+    def gauge(self, name, read):
+        """Register a gauge: read() is called when the stats are sampled."""
+        self._gauges[name] = read
+
+    @contextmanager
+    def _measure(self):
+        # time a block, less any blocks timed within it on this thread;
+        # the result is left in the yielded timer's ``elapsed``
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        timer = _Timer()
+        stack.append(timer)
+        start = time.time()
+        try:
+            yield timer
+        finally:
+            elapsed = time.time() - start
+            stack.pop()
+            if stack:
+                stack[-1].excluded += elapsed
+            timer.elapsed = max(0.0, elapsed - timer.excluded)
+
+    @contextmanager
+    def time(self, phase):
+        """Time the enclosed block as part of phase."""
+        timer = None
+        try:
+            with self._measure() as timer:
+                yield
+        finally:
+            if timer is not None:
+                self.record_time(phase, timer.elapsed)
+
+    def time_iter(self, phase, iterable):
+        """Time the steps of an iterator, recorded as one observation."""
+        iterator = iter(iterable)
+        total = 0.0
+        try:
+            while True:
+                timer = None
+                try:
+                    with self._measure() as timer:
+                        item = next(iterator)
+                except StopIteration:
+                    return
+                finally:
+                    if timer is not None:
+                        total += timer.elapsed
+                yield item
+        finally:
+            self.record_time(phase, total)
+
+    def record_time(self, phase, seconds):
+        with self._lock:
+            histogram = self._phases.get(phase)
+            if histogram is None:
+                histogram = self._phases[phase] = Histogram()
+            histogram.add(seconds)
+        self._notify('time.' + phase, seconds)
+
+    def count(self, name, n=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + n
+        self._notify(name, n)
+
+    def status(self, code):
+        with self._lock:
+            self._statuses[code] = self._statuses.get(code, 0) + 1
+        self._notify('status.{}'.format(code), 1)
+
+    def _notify(self, name, value):
+        for hook in self._hooks:
+            hook(name, value)
+
+    def counter(self, name):
+        with self._lock:
+            return self._counters.get(name, 0)
+
+    def sample_gauges(self):
+        """Read every gauge, remembering the largest value seen."""
+        values = {}
+        for name, read in list(self._gauges.items()):
+            try:
+                value = read()
+            except Exception:
+                continue
+            values[name] = value
+            with self._lock:
+                if (name not in self._gauge_max or
+                        value > self._gauge_max[name]):
+                    self._gauge_max[name] = value
+        return values
+
+    def snapshot(self):
+        """Return all the stats so far as a JSON-serializable dict."""
+        gauges = self.sample_gauges()
+        with self._lock:
+            elapsed = time.time() - self.start_time
+            counters = dict(self._counters)
+            return {
+                'elapsed': elapsed,
+                'counters': counters,
+                'rates': dict((name, value / elapsed if elapsed else 0.0)
+                              for name, value in counters.items()),
+                'status_codes': dict((str(code), n) for code, n
+                                     in sorted(self._statuses.items())),
+                'phases': dict((phase, histogram.as_dict()) for
+                               phase, histogram in self._phases.items()),
+                'gauges': gauges,
+                'gauges_max': dict(self._gauge_max),
+            }
+
+    def merge(self, snapshot):
+        """Add in the stats of another crawl, from its :meth:`snapshot`.
+
+        Used to total the stats of the processes of a distributed crawl.
+        Counters, statuses and timings are added up; the largest value
+        of each gauge is kept.
+        """
+        with self._lock:
+            for name, value in snapshot['counters'].items():
+                self._counters[name] = self._counters.get(name, 0) + value
+            for code, n in snapshot['status_codes'].items():
+                code = int(code)
+                self._statuses[code] = self._statuses.get(code, 0) + n
+            for phase, data in snapshot['phases'].items():
+                histogram = self._phases.get(phase)
+                if histogram is None:
+                    histogram = self._phases[phase] = Histogram()
+                histogram.merge(data)
+            for name, value in snapshot['gauges_max'].items():
+                if (name not in self._gauge_max or
+                        value > self._gauge_max[name]):
+                    self._gauge_max[name] = value
+
+    def write(self, path):
+        """Save a snapshot to path as JSON."""
+        with open(path, 'w') as f:
+            json.dump(self.snapshot(), f, indent=2, sort_keys=True)
+
+    def progress_line(self):
+        snapshot = self.snapshot()
+        elapsed = snapshot['elapsed'] or 1e-9
+        counters = snapshot['counters']
+        line = "{} documents ({:.1f}/s), {:.1f} MB ({:.2f} MB/s)".format(
+            counters.get('documents', 0),
+            counters.get('documents', 0) / elapsed,
+            counters.get('bytes_downloaded', 0) / 1e6,
+            counters.get('bytes_downloaded', 0) / 1e6 / elapsed)
+        for name, value in sorted(snapshot['gauges'].items()):
+            line += ", {} {}".format(name, value)
+        return line
+
+
+class ProgressReporter(object):
+    """Log a progress line for a crawl every ``interval`` seconds.
+
+    :param stats: the CrawlStats to report on
+    :param interval: seconds between lines
+    """
+
+    def __init__(self, stats, interval=DEFAULT_PROGRESS_INTERVAL):
+        self.stats = stats
+        self.interval = interval
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run,
+                                        name='pycrawl-progress')
+        self._thread.daemon = True
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            log.info("%s", self.stats.progress_line())
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread.is_alive():
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+
+"""Offload HTML parsing and link rewriting to a pool of processes.
+
+Parsing is pure Python and holds the GIL, so however many threads fetch
+concurrently, a crawl of HTML-heavy sites is limited to one core.  A
+:class:`ParsePool` hands each document's raw bytes to a worker process
+and gives back the rewritten document and its links, so fetching
+threads only wait on the network and the pool.
+
+Requires Python 3, for :mod:`concurrent.futures`.
+"""
+
+from __future__ import absolute_import
+
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import threading
+
+
+def _rewrite_job(raw, encoding, hostname, parser):
+    # runs in a worker process
+    from pycrawl import pycrawl
+    html = pycrawl.decode_html(raw, encoding)
+    return pycrawl.get_content_and_links(html, hostname, parser=parser)
+
+
+class ParsePool(object):
+    """A pool of processes that decode HTML and rewrite its links.
+
+    At most ``max_pending`` documents are queued or being parsed at
+    once; callers submitting more block until one finishes, so fetching
+    can't run arbitrarily far ahead of parsing.
+
+    :param processes: number of worker processes (default: one per CPU)
+    :param max_pending: maximum documents in the pool at once (default:
+        twice the number of processes)
+    """
+
+    def __init__(self, processes=None, max_pending=None):
+        self.processes = processes or multiprocessing.cpu_count()
+        self.max_pending = max_pending or 2 * self.processes
+        self._executor = ProcessPoolExecutor(self.processes)
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+
+    def submit(self, raw, encoding, hostname, parser):
+        """Queue a document for rewriting, blocking while the pool is full.
+
+        :param raw: the HTML document, as bytes
+        :param encoding: its character encoding
+        :param hostname: hostname from which the document came
+        :param parser: parser name, as for
+            :func:`pycrawl.pycrawl.get_content_and_links`
+        :return: a Future for the tuple of replacement HTML and links
+        """
+        self._slots.acquire()
+        try:
+            future = self._executor.submit(_rewrite_job, raw, encoding,
+                                           hostname, parser)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda f: self._slots.release())
+        return future
+
+    def get_content_and_links(self, raw, encoding, hostname, parser):
+        """Rewrite a document in the pool and wait for the result.
+
+        :return: tuple of replacement HTML and list of linked URLs
+        """
+        return self.submit(raw, encoding, hostname, parser).result()
+
+    def close(self):
+        self._executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,346 @@
+# -*- coding: utf-8 -*-
+
+"""Profile a crawl from the command line (``--profile``).
+
+Three profilers are available:
+
+``cprofile``
+    deterministic profiling of every function call, in every thread,
+    saved in :mod:`pstats` format
+``sample``
+    a statistical profiler that records the stacks of all threads
+    every few milliseconds, including threads waiting on I/O, saved as
+    collapsed stacks (one ``frame;frame;... count`` line per stack, as
+    read by flame graph tools)
+``memory``
+    :mod:`tracemalloc` snapshots taken as memory use peaks, saved as a
+    report of the top allocation sites within
+    :func:`~pycrawl.pycrawl.get_content_and_links` and
+    :func:`~pycrawl.pycrawl.download_site` (Python 3 only)
+
+Each profiler can stop after the first N URLs, to keep its overhead
+bounded on long crawls: register its ``on_stat`` method as a
+:class:`~pycrawl.metrics.CrawlStats` hook.
+"""
+
+from collections import Counter
+import cProfile
+import dis
+import linecache
+import logging
+import os
+import pstats
+import sys
+import threading
+try:  # Python 3
+    from io import StringIO
+    import tracemalloc
+except ImportError:  # Python 2
+    # pstats writes byte strings, which io.StringIO won't take
+    from StringIO import StringIO
+    tracemalloc = None
+
+
+log = logging.getLogger(__name__)
+
+PROFILERS = ['cprofile', 'sample', 'memory']
+DEFAULT_SAMPLE_INTERVAL = 0.005
+DEFAULT_TOP = 25
+
+
+class _Profiler(object):
+    """Common handling of the URL limit."""
+
+    def __init__(self, max_urls=None):
+        self.max_urls = max_urls
+        self._urls = 0
+        self._count_lock = threading.Lock()
+        self._stopped = False
+
+    def on_stat(self, name, value):
+        """CrawlStats hook: stop once max_urls URLs have been started."""
+        if name != 'urls' or self.max_urls is None:
+            return
+        with self._count_lock:
+            self._urls += value
+            over = self._urls > self.max_urls
+        if over and not self._stopped:
+            log.info("profiled the first %d URLs; stopping profiler",
+                     self.max_urls)
+            self.stop()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+class CProfiler(_Profiler):
+    """Run cProfile in every thread of the crawl.
+
+    Before Python 3.12, a cProfile profiler only sees the thread that
+    enabled it, so each new thread gets its own, and they are merged
+    when saved.  From 3.12 a single profiler covers all threads.
+    """
+
+    def __init__(self, max_urls=None):
+        super(CProfiler, self).__init__(max_urls)
+        self._profiles = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._per_thread = not hasattr(sys, 'monitoring')
+
+    def start(self):
+        if self._per_thread:
+            threading.setprofile(self._start_thread)
+        self._enable()
+
+    def _start_thread(self, *args):
+        # the first profiling event in a new thread; replace this hook
+        # with a profiler of the thread's own
+        sys.setprofile(None)
+        if not self._stopped:
+            self._enable()
+
+    def _enable(self):
+        profile = cProfile.Profile()
+        with self._lock:
+            self._profiles.append(profile)
+        self._local.profile = profile
+        profile.enable()
+
+    def on_stat(self, name, value):
+        super(CProfiler, self).on_stat(name, value)
+        if self._stopped and self._per_thread:
+            # other threads' profilers can only be stopped from their
+            # own thread
+            self._stop_thread()
+
+    def _stop_thread(self):
+        profile = getattr(self._local, 'profile', None)
+        if profile is not None:
+            profile.disable()
+            self._local.profile = None
+
+    def stop(self):
+        self._stopped = True
+        if self._per_thread:
+            threading.setprofile(None)
+            self._stop_thread()
+        else:
+            with self._lock:
+                for profile in self._profiles:
+                    profile.disable()
+
+    def stats(self):
+        """Return the merged profiles as a pstats.Stats."""
+        with self._lock:
+            profiles = list(self._profiles)
+        stats = pstats.Stats(profiles[0])
+        for profile in profiles[1:]:
+            stats.add(profile)
+        return stats
+
+    def save(self, path):
+        stats = self.stats()
+        stats.dump_stats(path)
+        out = StringIO()
+        stats.stream = out
+        stats.sort_stats('cumulative').print_stats(DEFAULT_TOP)
+        log.info("%s", out.getvalue())
+
+
+def _frame_label(code, lineno=None):
+    filename = code.co_filename
+    return '{} ({}:{})'.format(code.co_name, os.path.basename(filename),
+                               lineno or code.co_firstlineno)
+
+
+class SamplingProfiler(_Profiler):
+    """Record the stack of every thread at regular intervals.
+
+    :param interval: seconds between samples
+    """
+
+    def __init__(self, max_urls=None, interval=DEFAULT_SAMPLE_INTERVAL):
+        super(SamplingProfiler, self).__init__(max_urls)
+        self.interval = interval
+        self.samples = Counter()
+        self._done = threading.Event()
+        self._thread = threading.Thread(target=self._run,
+                                        name='pycrawl-sampler')
+        self._thread.daemon = True
+
+    def start(self):
+        self._thread.start()
+
+    def _run(self):
+        me = threading.current_thread().ident
+        while not self._done.wait(self.interval):
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_label(frame.f_code))
+                    frame = frame.f_back
+                stack.reverse()
+                self.samples[tuple(stack)] += 1
+
+    def stop(self):
+        self._stopped = True
+        self._done.set()
+        if (self._thread.is_alive() and
+                self._thread is not threading.current_thread()):
+            self._thread.join()
+
+    def top(self, n=DEFAULT_TOP, inclusive=False):
+        """Functions with the most samples.
+
+        :param inclusive: count samples in a function's callees too,
+            rather than only those where it was running itself
+        :return: list of ``(label, samples)``, most first
+        """
+        totals = Counter()
+        for stack, count in self.samples.items():
+            for label in (set(stack) if inclusive else stack[-1:]):
+                totals[label] += count
+        return totals.most_common(n)
+
+    def save(self, path):
+        with open(path, 'w') as f:
+            for stack, count in self.samples.most_common():
+                f.write('{} {}\n'.format(';'.join(stack), count))
+        total = sum(self.samples.values()) or 1
+        lines = ['{} samples'.format(sum(self.samples.values()))]
+        lines.extend('{:6.1f}%  {}'.format(100.0 * count / total, label)
+                     for label, count in self.top())
+        log.info("%s", '\n'.join(lines))
+
+
+def _code_lines(func):
+    """Return (filename, first line, last line) of a function's code."""
+    code = func.__code__
+    lines = [line for _, line in dis.findlinestarts(code) if line]
+    return (code.co_filename, code.co_firstlineno,
+            max(lines or [code.co_firstlineno]))
+
+
+class MemoryProfiler(_Profiler):
+    """Keep a tracemalloc snapshot from when memory use was highest.
+
+    Traced memory is checked every ``interval`` seconds; whenever it
+    is ``margin`` above the last snapshot's, a new snapshot is taken.
+
+    :param functions: report allocations made within these functions
+        (default: ``get_content_and_links`` and ``download_site``)
+    :param frames: frames of traceback to record for each allocation
+    """
+
+    def __init__(self, max_urls=None, functions=None, frames=25,
+                 interval=0.1, margin=0.05):
+        if tracemalloc is None:
+            raise RuntimeError("MemoryProfiler requires Python 3")
+        super(MemoryProfiler, self).__init__(max_urls)
+        if functions is None:
+            from pycrawl import pycrawl
+            functions = [pycrawl.get_content_and_links,
+                         pycrawl.download_site]
+        self.functions = functions
+        self.frames = frames
+        self.interval = interval
+        self.margin = margin
+        self.snapshot = None
+        self.snapshot_size = 0
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+        self._thread = threading.Thread(target=self._run,
+                                        name='pycrawl-memory')
+        self._thread.daemon = True
+
+    def start(self):
+        tracemalloc.start(self.frames)
+        self._thread.start()
+
+    def _run(self):
+        while not self._done.wait(self.interval):
+            self._check()
+
+    def _check(self):
+        with self._lock:
+            if not tracemalloc.is_tracing():
+                return
+            current, _ = tracemalloc.get_traced_memory()
+            if current > self.snapshot_size * (1 + self.margin):
+                self.snapshot = tracemalloc.take_snapshot().filter_traces(
+                    [tracemalloc.Filter(False, tracemalloc.__file__)])
+                self.snapshot_size = current
+
+    def stop(self):
+        if self._stopped:
+            return
+        self._stopped = True
+        self._done.set()
+        if (self._thread.is_alive() and
+                self._thread is not threading.current_thread()):
+            self._thread.join()
+        self._check()
+        with self._lock:
+            tracemalloc.stop()
+
+    def top_sites(self, func, n=DEFAULT_TOP):
+        """Top allocation sites in traces passing through func.
+
+        :return: list of ``(filename, lineno, size, count)``, largest
+            first
+        """
+        filename, first, last = _code_lines(func)
+        sites = {}
+        for trace in self.snapshot.traces:
+            frames = trace.traceback
+            if not any(frame.filename == filename and
+                       first <= frame.lineno <= last for frame in frames):
+                continue
+            site = frames[-1]
+            key = (site.filename, site.lineno)
+            size, count = sites.get(key, (0, 0))
+            sites[key] = (size + trace.size, count + 1)
+        ranked = sorted(sites.items(), key=lambda item: -item[1][0])
+        return [(f, line, size, count)
+                for (f, line), (size, count) in ranked[:n]]
+
+    def report(self):
+        if self.snapshot is None:
+            return "no memory snapshot was taken"
+        lines = ['peak traced memory: {:.1f} MiB'.format(
+            self.snapshot_size / 1048576.0)]
+        for func in self.functions:
+            lines.append('')
+            lines.append('top allocation sites within {}:'.format(
+                func.__name__))
+            for filename, lineno, size, count in self.top_sites(func):
+                lines.append('{:10.1f} KiB {:7d} blocks  {}:{}'.format(
+                    size / 1024.0, count, filename, lineno))
+                source = linecache.getline(filename, lineno).strip()
+                if source:
+                    lines.append('{:29}{}'.format('', source))
+        return '\n'.join(lines)
+
+    def save(self, path):
+        report = self.report()
+        with open(path, 'w') as f:
+            f.write(report + '\n')
+        log.info("%s", report)
+
+
+def make_profiler(kind, max_urls=None):
+    """Create a profiler by name; see PROFILERS."""
+    if kind == 'cprofile':
+        return CProfiler(max_urls)
+    elif kind == 'sample':
+        return SamplingProfiler(max_urls)
+    elif kind == 'memory':
+        return MemoryProfiler(max_urls)
+    raise ValueError("unknown profiler {!r}".format(kind))
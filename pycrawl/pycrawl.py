@@ -1,34 +1,591 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+from __future__ import absolute_import
+
 import argparse
+from contextlib import closing
+from email.utils import mktime_tz, parsedate_tz
+import itertools
+import logging
 import os
 import re
+import signal
 import sys
+import time
 try:  # Python 3
-    from urllib import robotparser
-    from urllib.parse import urlparse
+    from logging.handlers import QueueHandler, QueueListener
+    import queue
+    from urllib.parse import urljoin, urlparse
 except ImportError:  # Python 2
-    import robotparser
-    from urlparse import urlparse
+    QueueHandler = QueueListener = None
+    from urlparse import urljoin, urlparse
     str = unicode
 
 import bs4
-import requests
-from requests.exceptions import ConnectionError
+from requests.exceptions import (ChunkedEncodingError, ConnectionError,
+                                 RequestException, Timeout)
+
+from pycrawl import robots
+from pycrawl.distributed import (PARTITION_BY, Mailbox, PartitionedFrontier,
+                                 crawl_distributed, run_partition)
+from pycrawl.engine import DEFAULT_PER_HOST_LIMIT, ThreadedCrawl
+from pycrawl.frontier import (DEFAULT_MEMORY_QUEUE_SIZE, Frontier, Scorer,
+                              make_frontier)
+from pycrawl.journal import CrawlJournal
+from pycrawl.links import LINK_ATTRS, localize_link, rewrite_links
+from pycrawl.manifest import BodyDigest, Manifest, ManifestEntry
+from pycrawl.metrics import (DEFAULT_PROGRESS_INTERVAL, NULL_STATS,
+                             CrawlStats, ProgressReporter)
+from pycrawl.profiling import PROFILERS, make_profiler
+from pycrawl.results import BodyBuffer, CrawlResult
+from pycrawl.retry import (DEFAULT_BACKOFF, DEFAULT_COOLDOWN,
+                           DEFAULT_MAX_RETRY_DELAY, DEFAULT_RETRIES,
+                           DEFAULT_THRESHOLD, RETRY_STATUSES,
+                           CircuitBreakers, RetryLater, RetryPolicy,
+                           parse_retry_after)
+from pycrawl.robots import (AllowAllRobots, RobotsCache,  # noqa: F401
+                            get_robots_url, parse_robots_txt)
+from pycrawl.scheduler import DEFAULT_MAX_DELAY, CrawlBudget, HostScheduler
+from pycrawl.scope import CrawlScope, parse_content_type, read_seed_file
+from pycrawl.session import (DEFAULT_MAX_HOSTS, DEFAULT_TIMEOUT,
+                             CrawlSession, get_default_session)
+from pycrawl.sitemaps import get_sitemap_urls, read_sitemaps
+from pycrawl.storage import (ContentStore, MirrorStore, PackStore, WarcStore,
+                             write_chunks)
+from pycrawl.urls import canonical_url, parse_url
+from pycrawl.writer import QueuedMirrorStore
+
+
+CHUNK_SIZE = 64 * 1024
+DEFAULT_MAX_HTML_SIZE = 10 * 1024 * 1024
+HTML_PARSERS = ['stream', 'html.parser', 'lxml']
+HTML_TYPES = ('text/html', 'application/xhtml+xml')
+DEFAULT_HTML_PARSER = 'stream'
+
+# named explicitly, since this module is also run as a script
+log = logging.getLogger('pycrawl.pycrawl')
 
 
 def main(argv=None):
     if argv is not None:
         sys.argv = argv
     parser = argparse.ArgumentParser()
-    parser.add_argument("url", help="the base URL to retrieve")
+    parser.add_argument("urls", metavar="url", nargs="*",
+                        help="URLs to start crawling from")
+    parser.add_argument("--seeds", metavar="FILE",
+                        help="also start from the URLs listed in FILE, one "
+                        "per line")
+    parser.add_argument("--allow-host", metavar="HOST", action="append",
+                        default=[],
+                        help="follow links to HOST as well as to the hosts "
+                        "of the start URLs; may be repeated")
+    parser.add_argument("--allow-suffix", metavar="DOMAIN", action="append",
+                        default=[],
+                        help="follow links to DOMAIN and any host under it; "
+                        "may be repeated")
+    parser.add_argument("--include", metavar="REGEX", action="append",
+                        default=[],
+                        help="only follow links to URLs matching REGEX; may "
+                        "be repeated")
+    parser.add_argument("--exclude", metavar="REGEX", action="append",
+                        default=[],
+                        help="don't follow links to URLs matching REGEX; "
+                        "may be repeated")
+    parser.add_argument("--deny-ext", metavar="EXT[,EXT...]",
+                        action="append", default=[],
+                        help="don't follow links to URLs ending in these "
+                        "file extensions; may be repeated")
+    parser.add_argument("--accept-type", metavar="TYPE", action="append",
+                        help="only download documents whose Content-Type "
+                        "is TYPE, such as text/html or image/*; others are "
+                        "dropped before their body is read; may be "
+                        "repeated")
+    parser.add_argument("--head", dest="head_probe", action="store_true",
+                        help="send a HEAD request first, and skip documents "
+                        "of unwanted types or sizes without fetching them")
+    parser.add_argument("--sitemaps", action="store_true",
+                        help="also start from every URL in the start hosts' "
+                        "sitemaps, found from robots.txt or /sitemap.xml")
+    parser.add_argument("--skip-unchanged", action="store_true",
+                        help="with --sitemaps and --incremental, skip pages "
+                        "whose sitemap lastmod is no newer than the copy "
+                        "already downloaded")
     parser.add_argument("-d", "--max-depth", type=int,
                         help="maximum recursion depth")
+    parser.add_argument("-w", "--workers", type=int,
+                        help="fetch with this many concurrent worker threads "
+                        "(with --async, the maximum requests in flight)")
+    parser.add_argument("--per-host", type=int, metavar="N",
+                        default=DEFAULT_PER_HOST_LIMIT,
+                        help="with --workers or --async, allow at most N "
+                        "concurrent requests to any one host (default: "
+                        "%(default)s)")
+    parser.add_argument("--crawl-delay", type=float, metavar="SECONDS",
+                        help="wait at least SECONDS between requests to any "
+                        "one host; a longer Crawl-delay or Request-rate in "
+                        "robots.txt takes precedence")
+    parser.add_argument("--max-crawl-delay", type=float, metavar="SECONDS",
+                        default=DEFAULT_MAX_DELAY,
+                        help="honour robots.txt delays only up to SECONDS, "
+                        "or not at all if 0 (default: %(default)s)")
+    parser.add_argument("--burst", type=int, metavar="N", default=1,
+                        help="allow N requests to a host at once before "
+                        "delays apply (default: %(default)s)")
+    parser.add_argument("--pool-size", type=int, metavar="N",
+                        help="keep up to N open connections per host")
+    parser.add_argument("--connect-timeout", type=float, metavar="SECONDS",
+                        default=DEFAULT_TIMEOUT[0],
+                        help="give up connecting to a server after SECONDS "
+                        "(default: %(default)s)")
+    parser.add_argument("--read-timeout", type=float, metavar="SECONDS",
+                        default=DEFAULT_TIMEOUT[1],
+                        help="give up on a response if no data arrives for "
+                        "SECONDS (default: %(default)s)")
+    parser.add_argument("--total-timeout", type=float, metavar="SECONDS",
+                        help="give up on a response still downloading after "
+                        "SECONDS")
+    parser.add_argument("--retries", type=int, metavar="N",
+                        default=DEFAULT_RETRIES,
+                        help="retry a URL up to N times after a connection "
+                        "error, timeout, 429 or 5xx status (default: "
+                        "%(default)s)")
+    parser.add_argument("--retry-backoff", type=float, metavar="SECONDS",
+                        default=DEFAULT_BACKOFF,
+                        help="wait about SECONDS before the first retry of a "
+                        "URL, doubling for each one after (default: "
+                        "%(default)s)")
+    parser.add_argument("--max-retry-delay", type=float, metavar="SECONDS",
+                        default=DEFAULT_MAX_RETRY_DELAY,
+                        help="wait at most SECONDS before a retry; a URL "
+                        "whose server asks for a longer Retry-After is "
+                        "given up on (default: %(default)s)")
+    parser.add_argument("--breaker-threshold", type=int, metavar="N",
+                        default=DEFAULT_THRESHOLD,
+                        help="after N failures in a row, pause a host for "
+                        "--breaker-cooldown, then try it with one request; "
+                        "give up on hosts that keep failing, or never if 0 "
+                        "(default: %(default)s)")
+    parser.add_argument("--breaker-cooldown", type=float, metavar="SECONDS",
+                        default=DEFAULT_COOLDOWN,
+                        help="how long to first pause a failing host for; "
+                        "this doubles each time it fails again (default: "
+                        "%(default)s)")
+    parser.add_argument("--robots-cache", metavar="FILE",
+                        help="load cached robots.txt files from FILE, and "
+                        "save them there after the crawl")
+    parser.add_argument("--robots-ttl", type=float, metavar="SECONDS",
+                        default=robots.DEFAULT_TTL,
+                        help="fetch robots.txt again once cached copies are "
+                        "this old (default: %(default)s)")
+    parser.add_argument("--max-body-size", type=parse_size, metavar="SIZE",
+                        help="skip documents larger than SIZE bytes "
+                        "(suffixes K, M and G are accepted)")
+    parser.add_argument("--max-html-size", type=parse_size, metavar="SIZE",
+                        default=DEFAULT_MAX_HTML_SIZE,
+                        help="parse and rewrite links in at most SIZE bytes "
+                        "of each HTML document; larger ones are saved "
+                        "unchanged (default: %(default)s)")
+    parser.add_argument("--html-parser", default=DEFAULT_HTML_PARSER,
+                        choices=HTML_PARSERS,
+                        help="how to find and rewrite links: 'stream' "
+                        "rewrites links in place in a single pass, others "
+                        "rebuild the document with that BeautifulSoup "
+                        "parser (default: %(default)s)")
+    parser.add_argument("--parse-processes", type=int, metavar="N",
+                        help="parse and rewrite HTML in a pool of N "
+                        "processes, so that parsing can use several cores")
+    parser.add_argument("--journal", metavar="FILE",
+                        help="record crawl progress in FILE, so that the "
+                        "crawl can be resumed if interrupted")
+    parser.add_argument("--resume", action="store_true",
+                        help="continue the crawl recorded with --journal")
+    parser.add_argument("--incremental", action="store_true",
+                        help="only download documents that have changed "
+                        "since the last crawl")
+    parser.add_argument("--manifest", metavar="FILE",
+                        help="with --incremental, where to record what was "
+                        "downloaded (default: HOSTNAME.manifest, for the "
+                        "first URL's host)")
+    parser.add_argument("--seen-set", default="fingerprint",
+                        choices=["exact", "fingerprint", "bloom"],
+                        help="how to remember URLs already queued: full "
+                        "strings, 64-bit fingerprints, or a Bloom filter "
+                        "(default: %(default)s)")
+    parser.add_argument("--bloom-capacity", type=int, metavar="N",
+                        help="with --seen-set=bloom, size the filter for N "
+                        "URLs")
+    parser.add_argument("--bloom-error-rate", type=float, metavar="RATE",
+                        help="with --seen-set=bloom, the false positive rate "
+                        "(URLs wrongly skipped as already seen)")
+    parser.add_argument("--spill-dir", metavar="DIR",
+                        help="spill the URL queue to a file in DIR once it "
+                        "gets large")
+    parser.add_argument("--queue-memory", type=int, metavar="N",
+                        default=DEFAULT_MEMORY_QUEUE_SIZE,
+                        help="with --spill-dir, keep at most N queued URLs "
+                        "in memory, over all hosts (default: %(default)s)")
+    parser.add_argument("--score-depth", type=float, metavar="WEIGHT",
+                        help="crawl the highest-scoring URLs first, taking "
+                        "WEIGHT off a URL's score for each level of depth "
+                        "(default with other --score options: 1)")
+    parser.add_argument("--score-links", type=float, metavar="WEIGHT",
+                        help="crawl the highest-scoring URLs first, adding "
+                        "WEIGHT to a URL's score for each link to it found")
+    parser.add_argument("--score-path", type=parse_path_weight,
+                        metavar="REGEX=WEIGHT", action="append", default=[],
+                        help="crawl the highest-scoring URLs first, adding "
+                        "WEIGHT to the score of URLs whose path matches "
+                        "REGEX; may be repeated")
+    parser.add_argument("--max-pages", type=int, metavar="N",
+                        help="stop after fetching N URLs")
+    parser.add_argument("--max-bytes", type=parse_size, metavar="SIZE",
+                        help="stop once SIZE bytes have been downloaded")
+    parser.add_argument("--max-time", type=float, metavar="SECONDS",
+                        help="stop starting new fetches after SECONDS")
+    parser.add_argument("--processes", type=int, metavar="N",
+                        help="crawl with N processes, each owning the hosts "
+                        "(or URLs) that hash to it and passing on links to "
+                        "the others")
+    parser.add_argument("--partition-by", choices=PARTITION_BY,
+                        default="host",
+                        help="with --processes, share out URLs by host, so "
+                        "each host is crawled by one process, or by URL "
+                        "(default: %(default)s)")
+    parser.add_argument("--mailbox", metavar="FILE",
+                        help="with --processes, pass links between the "
+                        "processes through the SQLite file FILE (default: "
+                        "a temporary file)")
+    # set by the coordinator of a --processes crawl for each process
+    parser.add_argument("--partition", type=int, help=argparse.SUPPRESS)
+    output = parser.add_mutually_exclusive_group()
+    output.add_argument("--content-store", metavar="DIR",
+                        help="keep each distinct document once, in DIR, and "
+                        "link the saved files to it")
+    output.add_argument("--warc", metavar="FILE",
+                        help="append documents, as served, to the WARC "
+                        "file FILE instead of saving a copy of the site")
+    output.add_argument("--pack", metavar="FILE",
+                        help="append documents, as served, to FILE, with an "
+                        "index of where each one starts in FILE.idx")
+    output.add_argument("--write-queue", type=int, metavar="N",
+                        help="save files from a background writer thread, "
+                        "queueing up to N documents for it")
+    parser.add_argument("--symlinks", action="store_true",
+                        help="with --content-store, link files with "
+                        "symbolic rather than hard links")
+    parser.add_argument("--fsync-interval", type=float, metavar="SECONDS",
+                        help="with --write-queue, fsync written files every "
+                        "SECONDS rather than leaving it to the OS")
+    parser.add_argument("--async", dest="use_async", action="store_true",
+                        help="crawl with the asyncio backend "
+                        "(requires aiohttp)")
+    parser.add_argument("--stats-file", metavar="FILE",
+                        help="write timings, counts and other statistics "
+                        "for the crawl to FILE as JSON")
+    parser.add_argument("--progress", type=float, metavar="SECONDS",
+                        default=DEFAULT_PROGRESS_INTERVAL,
+                        help="log crawl progress every SECONDS, or never if "
+                        "0 (default: %(default)s)")
+    parser.add_argument("--profile", metavar="FILE",
+                        help="profile the crawl and save the results to "
+                        "FILE")
+    parser.add_argument("--profiler", choices=PROFILERS, default="cprofile",
+                        help="cprofile: pstats file; sample: collapsed "
+                        "stacks sampled from every thread; memory: "
+                        "tracemalloc report of the top allocation sites "
+                        "at peak memory (default: %(default)s)")
+    parser.add_argument("--profile-urls", type=int, metavar="N",
+                        help="only profile the first N URLs")
+    verbosity = parser.add_mutually_exclusive_group()
+    verbosity.add_argument("-v", "--verbose", action="store_const",
+                           dest="log_level", const=logging.DEBUG,
+                           default=logging.INFO,
+                           help="log every URL fetched")
+    verbosity.add_argument("-q", "--quiet", action="store_const",
+                           dest="log_level", const=logging.WARNING,
+                           help="only log warnings and errors")
     args = parser.parse_args()
+    if args.resume and not args.journal:
+        parser.error("--resume requires --journal")
+    if args.skip_unchanged and not (args.sitemaps and args.incremental):
+        parser.error("--skip-unchanged requires --sitemaps and "
+                     "--incremental")
+    if args.retries < 0:
+        parser.error("--retries can't be negative")
+    timeout = (args.connect_timeout, args.read_timeout)
+    if args.processes is not None:
+        if args.processes < 1:
+            parser.error("--processes must be at least 1")
+        for option in ['journal', 'warc', 'pack', 'profile', 'max_pages',
+                       'max_bytes']:
+            if getattr(args, option) is not None:
+                parser.error("--{} can't be used with --processes".format(
+                    option.replace('_', '-')))
+    elif args.partition is not None:
+        parser.error("--partition requires --processes")
+    partitioned = args.partition is not None
+    scorer = None
+    if (args.score_depth is not None or args.score_links is not None or
+            args.score_path):
+        if args.spill_dir:
+            parser.error("--score options can't be used with --spill-dir")
+        scorer = Scorer(depth_weight=(1.0 if args.score_depth is None
+                                      else args.score_depth),
+                        link_weight=args.score_links or 0.0,
+                        path_weights=args.score_path or ())
+
+    seeds = list(args.urls)
+    if args.seeds:
+        seeds.extend(read_seed_file(args.seeds))
+    if not seeds:
+        parser.error("no URLs to crawl")
+    seeds = [ensure_scheme(url) for url in seeds]
+    try:
+        scope = CrawlScope.from_seeds(
+            seeds, hosts=args.allow_host, suffixes=args.allow_suffix,
+            include=args.include, exclude=args.exclude,
+            deny_extensions=[ext for exts in args.deny_ext
+                             for ext in exts.split(',') if ext],
+            content_types=args.accept_type)
+    except re.error as e:
+        parser.error("bad regular expression: {}".format(e))
+    if args.processes is not None and not partitioned:
+        stop_logging = start_logging(args.log_level)
+        stats = CrawlStats()
+        try:
+            crawl_distributed(sys.argv, args.processes,
+                              mailbox_path=args.mailbox, stats=stats)
+        finally:
+            log.info("done: %s", stats.progress_line())
+            if args.stats_file:
+                stats.write(args.stats_file)
+            stop_logging()
+        return
+    robots_cache_path = args.robots_cache
+    if partitioned and robots_cache_path:
+        robots_cache_path = get_partition_path(robots_cache_path,
+                                               args.partition)
+    robots_cache = RobotsCache(ttl=args.robots_ttl, path=robots_cache_path)
+    journal = None
+    if args.journal:
+        journal = CrawlJournal(args.journal)
+        name = get_crawl_name([get_canonical_url(url) for url in seeds])
+        if args.resume and journal.root_url() != name:
+            parser.error("{} records a crawl of {}, not {}".format(
+                args.journal, journal.root_url(), name))
+        install_checkpoint_handlers(journal)
+    manifest = None
+    if args.incremental:
+        manifest_path = args.manifest or get_manifest_path(seeds[0])
+        if partitioned:
+            manifest_path = get_partition_path(manifest_path, args.partition)
+        manifest = Manifest(manifest_path)
+    frontier = make_frontier(args.seen_set,
+                             bloom_capacity=args.bloom_capacity,
+                             bloom_error_rate=args.bloom_error_rate,
+                             spill_dir=args.spill_dir,
+                             memory_queue_size=args.queue_memory,
+                             scorer=scorer)
+    mailbox = None
+    if partitioned:
+        mailbox = Mailbox(args.mailbox)
+        frontier = PartitionedFrontier(frontier, mailbox, args.partition,
+                                       args.processes, args.partition_by)
+    store = MirrorStore()
+    if args.content_store:
+        store = ContentStore(args.content_store, symlinks=args.symlinks)
+    elif args.warc:
+        store = WarcStore(args.warc)
+    elif args.pack:
+        store = PackStore(args.pack)
+    elif args.write_queue:
+        store = QueuedMirrorStore(queue_size=args.write_queue,
+                                  fsync_interval=args.fsync_interval)
+    parse_pool = None
+    if args.parse_processes:
+        from pycrawl.parsepool import ParsePool
+        parse_pool = ParsePool(args.parse_processes)
+    budget = None
+    if (args.max_pages is not None or args.max_bytes is not None or
+            args.max_time is not None):
+        budget = CrawlBudget(max_pages=args.max_pages,
+                             max_bytes=args.max_bytes,
+                             max_time=args.max_time)
+    stats = CrawlStats()
+    if isinstance(store, QueuedMirrorStore):
+        stats.gauge('write_queue', store.queued)
+    retry = RetryPolicy(retries=args.retries, backoff=args.retry_backoff,
+                        max_delay=args.max_retry_delay)
+    breakers = None
+    if args.breaker_threshold:
+        breakers = CircuitBreakers(threshold=args.breaker_threshold,
+                                   cooldown=args.breaker_cooldown,
+                                   stats=stats)
+    stop_logging = start_logging(args.log_level)
+    reporter = None
+    if args.progress:
+        reporter = ProgressReporter(stats, args.progress).start()
+    profiler = None
+    if args.profile:
+        profiler = make_profiler(args.profiler, args.profile_urls)
+        stats.add_hook(profiler.on_stat)
+        profiler.start()
+
+    def crawl(urls):
+        if args.use_async:
+            import asyncio
+            from pycrawl.aio import download_site_async
+            asyncio.run(download_site_async(urls, args.max_depth,
+                                            concurrency=args.workers,
+                                            per_host_limit=args.per_host,
+                                            robots_cache=robots_cache,
+                                            max_body_size=args.max_body_size,
+                                            max_html_size=args.max_html_size,
+                                            journal=journal,
+                                            resume=args.resume,
+                                            manifest=manifest,
+                                            frontier=frontier,
+                                            html_parser=args.html_parser,
+                                            parse_pool=parse_pool,
+                                            store=store, stats=stats,
+                                            crawl_delay=args.crawl_delay,
+                                            max_crawl_delay=(
+                                                args.max_crawl_delay),
+                                            burst=args.burst, scope=scope,
+                                            budget=budget,
+                                            sitemaps=args.sitemaps,
+                                            skip_unchanged=(
+                                                args.skip_unchanged),
+                                            head_probe=args.head_probe,
+                                            timeout=timeout,
+                                            total_timeout=(
+                                                args.total_timeout),
+                                            retry=retry, breakers=breakers))
+        else:
+            download_site(urls, args.max_depth, workers=args.workers,
+                          per_host_limit=args.per_host,
+                          pool_size=args.pool_size,
+                          robots_cache=robots_cache,
+                          max_body_size=args.max_body_size,
+                          max_html_size=args.max_html_size,
+                          journal=journal, resume=args.resume,
+                          manifest=manifest, frontier=frontier,
+                          html_parser=args.html_parser,
+                          parse_pool=parse_pool, store=store, stats=stats,
+                          crawl_delay=args.crawl_delay,
+                          max_crawl_delay=args.max_crawl_delay,
+                          burst=args.burst, scope=scope, budget=budget,
+                          sitemaps=args.sitemaps,
+                          skip_unchanged=args.skip_unchanged,
+                          head_probe=args.head_probe, timeout=timeout,
+                          total_timeout=args.total_timeout, retry=retry,
+                          breakers=breakers)
+
+    try:
+        if partitioned:
+            run_partition(frontier, seeds, crawl)
+        else:
+            crawl(seeds)
+    finally:
+        if profiler is not None:
+            profiler.stop()
+        if reporter is not None:
+            reporter.stop()
+        if partitioned:
+            log.info("partition %d done: %s", args.partition,
+                     stats.progress_line())
+        else:
+            log.info("done: %s", stats.progress_line())
+        store.close()
+        if parse_pool is not None:
+            parse_pool.close()
+        if manifest is not None:
+            manifest.close()
+        if journal is not None:
+            journal.close()
+        if args.robots_cache:
+            robots_cache.save()
+        if mailbox is not None:
+            # the coordinator merges these and writes the stats file
+            mailbox.put_stats(args.partition, stats.snapshot())
+            mailbox.close()
+        elif args.stats_file:
+            stats.write(args.stats_file)
+        if profiler is not None:
+            # after shutting down, so no profiled thread is still running
+            profiler.save(args.profile)
+        stop_logging()
 
-    url = ensure_scheme(args.url)
-    download_site(url, args.max_depth)
+
+def start_logging(level):
+    """Send pycrawl's log messages to stderr at the given level.
+
+    Messages are queued by the crawling threads and written out by a
+    listener thread, so a slow terminal doesn't hold up the crawl.
+
+    :return: a function that flushes and removes the handler
+    """
+    logger = logging.getLogger('pycrawl')
+    logger.setLevel(level)
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    if QueueHandler is None:
+        logger.addHandler(handler)
+        return lambda: logger.removeHandler(handler)
+
+    records = queue.Queue()
+    queue_handler = QueueHandler(records)
+    listener = QueueListener(records, handler)
+    logger.addHandler(queue_handler)
+    listener.start()
+
+    def stop():
+        logger.removeHandler(queue_handler)
+        listener.stop()
+    return stop
+
+
+def install_checkpoint_handlers(journal):
+    """Checkpoint the journal on SIGUSR1, and before exiting on SIGTERM.
+
+    (SIGINT already raises KeyboardInterrupt, which closes the journal
+    on the way out.)
+    """
+    def on_term(signum, frame):
+        sys.exit(128 + signum)
+
+    def on_usr1(signum, frame):
+        journal.request_checkpoint()
+
+    signal.signal(signal.SIGTERM, on_term)
+    if hasattr(signal, 'SIGUSR1'):
+        signal.signal(signal.SIGUSR1, on_usr1)
+
+
+def parse_size(size):
+    """Parse a byte count such as ``512``, ``64K`` or ``2G``.
+
+    :param size: a string
+    :return: the number of bytes, as an int
+    """
+    multipliers = {'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+    size = size.strip().upper()
+    if size and size[-1] in multipliers:
+        return int(float(size[:-1]) * multipliers[size[-1]])
+    return int(size)
+
+
+def parse_path_weight(value):
+    """Parse a ``REGEX=WEIGHT`` option into a ``(regex, weight)`` pair."""
+    pattern, sep, weight = value.rpartition('=')
+    if not sep or not pattern:
+        raise ValueError("expected REGEX=WEIGHT")
+    try:
+        re.compile(pattern)
+    except re.error as e:
+        raise ValueError("bad regular expression: {}".format(e))
+    return (pattern, float(weight))
 
 
 def ensure_scheme(url):
@@ -37,7 +594,7 @@ def ensure_scheme(url):
     :param url: URL as a string
     :return: URL string including a scheme
     """
-    if re.compile("//").search(url):
+    if '//' in url:
         # urlparse will work as expected
         parsed = urlparse(url)
         if parsed.scheme:
@@ -49,38 +606,322 @@ def ensure_scheme(url):
         return ''.join(['http://', url])
 
 
-def download_site(root_url, max_depth=None):
+def download_site(root_url, max_depth=None, workers=None,
+                  per_host_limit=None, pool_size=None, session=None,
+                  robots_cache=None, max_body_size=None,
+                  max_html_size=DEFAULT_MAX_HTML_SIZE, journal=None,
+                  resume=False, manifest=None, frontier=None,
+                  html_parser=DEFAULT_HTML_PARSER, parse_pool=None,
+                  store=None, stats=None, crawl_delay=None,
+                  max_crawl_delay=DEFAULT_MAX_DELAY, burst=1, scope=None,
+                  budget=None, sitemaps=False, skip_unchanged=False,
+                  head_probe=False, on_result=None, timeout=None,
+                  total_timeout=None, retry=None, breakers=None):
     """Crawl and download a website, starting with root_url.
 
-    :param root_url: URL to start from, as a string
+    Several sites can be crawled at once, sharing connection pools,
+    robots.txt cache and output, by giving a list of seed URLs; the
+    scheduler takes turns between their hosts, so a slow host doesn't
+    hold up the others.
+
+    :param root_url: URL to start from, as a string, or a list of them
     :param max_depth: if set, follow links only this many levels deep
+    :param workers: if greater than 1, fetch concurrently with this many
+        worker threads
+    :param per_host_limit: with ``workers``, the maximum number of
+        concurrent requests to any one host
+    :param pool_size: number of keep-alive connections to keep per host;
+        defaults to enough for every worker
+    :param session: a :class:`~pycrawl.session.CrawlSession` to fetch
+        with, instead of creating one for this crawl
+    :param robots_cache: a :class:`~pycrawl.robots.RobotsCache` to use
+        instead of the shared one
+    :param max_body_size: if set, skip documents larger than this many
+        bytes
+    :param max_html_size: parse and rewrite at most this many bytes of
+        each HTML document
+    :param journal: a :class:`~pycrawl.journal.CrawlJournal` to record
+        progress in
+    :param resume: if true, continue the crawl recorded in ``journal``
+        rather than starting a new one
+    :param manifest: a :class:`~pycrawl.manifest.Manifest`, to re-crawl
+        incrementally using conditional requests
+    :param frontier: a :class:`~pycrawl.frontier.Frontier` to queue URLs
+        in, instead of a default one
+    :param html_parser: how to find and rewrite links; one of
+        ``HTML_PARSERS``
+    :param parse_pool: a :class:`~pycrawl.parsepool.ParsePool` to
+        rewrite HTML in, so that parsing can use several cores
+    :param store: where to write documents (default: a
+        :class:`~pycrawl.storage.MirrorStore`)
+    :param stats: a :class:`~pycrawl.metrics.CrawlStats` to record
+        timings and counts in
+    :param crawl_delay: minimum seconds between requests to one host;
+        a longer ``Crawl-delay`` or ``Request-rate`` in robots.txt
+        takes precedence
+    :param max_crawl_delay: cut robots.txt delays longer than this many
+        seconds to this
+    :param burst: requests a host may receive at once before delays
+        apply
+    :param scope: a :class:`~pycrawl.scope.CrawlScope` of the hosts and
+        URLs to follow links to, and the content types to download
+        (default: the hosts of the seed URLs, and any type)
+    :param budget: a :class:`~pycrawl.scheduler.CrawlBudget`; once it
+        is spent, the crawl finishes the requests in flight and stops,
+        leaving the rest of the frontier in the journal
+    :param sitemaps: if true, also start from the URLs in the sitemaps
+        of the seed URLs' hosts
+    :param skip_unchanged: with ``sitemaps`` and a manifest, don't fetch
+        pages whose sitemap ``lastmod`` is no newer than their
+        ``Last-Modified`` when last downloaded
+    :param head_probe: if true, send a HEAD request before each new
+        document, and skip it if the headers show an unwanted type or
+        size
+    :param on_result: if given, called with a
+        :class:`~pycrawl.results.CrawlResult` for each response, from
+        the crawling threads
+    :param timeout: ``(connect, read)`` timeouts in seconds (default:
+        the session's)
+    :param total_timeout: if set, give up on a response still
+        downloading after this many seconds
+    :param retry: a :class:`~pycrawl.retry.RetryPolicy`, to retry URLs
+        that fail in ways that may not last
+    :param breakers: :class:`~pycrawl.retry.CircuitBreakers`, to pause
+        hosts that keep failing, and give up on them if they don't
+        recover
     """
-    root_netloc = urlparse(root_url).netloc
-    pending_urls = [get_canonical_url(root_url)]
-    done_urls = set()
+    if isinstance(root_url, (list, tuple)):
+        seed_urls = [get_canonical_url(url) for url in root_url]
+    else:
+        seed_urls = [get_canonical_url(root_url)]
+    if scope is None:
+        scope = CrawlScope.from_seeds(seed_urls)
+    if session is None:
+        session = CrawlSession(pool_size=pool_size or workers,
+                               max_hosts=max(DEFAULT_MAX_HOSTS,
+                                             len(scope.hosts)),
+                               timeout=timeout or DEFAULT_TIMEOUT)
+    if robots_cache is None:
+        robots_cache = robots_txt_cache
+    if budget is not None:
+        if stats is None:
+            stats = CrawlStats()
+        stats.add_hook(budget.on_stat)
+    threaded = workers is not None and workers > 1
+
+    def accept_link(link):
+        return link if scope.allows(link) else None
+
+    def process_url(url):
+        links = process_url_and_get_links(url, session=session,
+                                          robots_cache=robots_cache,
+                                          max_body_size=max_body_size,
+                                          max_html_size=max_html_size,
+                                          manifest=manifest,
+                                          html_parser=html_parser,
+                                          parse_pool=parse_pool,
+                                          store=store, stats=stats,
+                                          scope=scope,
+                                          head_probe=head_probe,
+                                          on_result=on_result,
+                                          timeout=timeout,
+                                          total_timeout=total_timeout,
+                                          retry=retry, breakers=breakers)
+        return get_absolute_links(links, url, stats)
+
+    if frontier is None:
+        frontier = Frontier()
+    if threaded:
+        per_host_limit = per_host_limit or DEFAULT_PER_HOST_LIMIT
+    else:
+        per_host_limit = None
+    scheduler = HostScheduler(frontier, delay=crawl_delay, burst=burst,
+                              per_host_limit=per_host_limit,
+                              robots_cache=robots_cache,
+                              max_delay=max_crawl_delay, budget=budget,
+                              breakers=breakers)
+    if stats is not None:
+        stats.gauge('frontier', scheduler.__len__)
+    if journal is not None and resume:
+        frontier.restore(journal.pending(), journal.seen())
+    else:
+        if journal is not None:
+            journal.reset(get_crawl_name(seed_urls))
+        for url in seed_urls:
+            add_to_frontier(frontier, journal, url, 0)
+        if sitemaps:
+            for root in get_site_roots(seed_urls):
+                parser = get_robots_parser(root, session, robots_cache)
+                pages = read_sitemaps(get_sitemap_urls(root, parser),
+                                      session)
+                queue_sitemap_pages(pages, frontier, journal, scope,
+                                    manifest=(manifest if skip_unchanged
+                                              else None),
+                                    store=store, stats=stats,
+                                    max_depth=max_depth)
 
-    at_depth = 0
-    while len(pending_urls) > 0:
-        # at each level of recursion, we take all pending urls out of
-        # the queue and loop over them
-        urls = pending_urls
-        pending_urls = []
-        for url in urls:
-            done_urls.add(url)
+    try:
+        if threaded:
+            crawl = ThreadedCrawl(process_url, accept_link,
+                                  workers, max_depth=max_depth,
+                                  journal=journal, scheduler=scheduler)
+            crawl.run()
+            return
+
+        # each pending URL is tagged with its depth, so the depth limit
+        # can be checked per URL rather than level by level
+        while True:
+            item, wait = scheduler.take()
+            if item is None:
+                if wait is None:
+                    break
+                # every host with URLs waiting is within its crawl delay
+                time.sleep(wait)
+                continue
+            url, depth, host = item
 
             # process the URL
-            links = process_url_and_get_links(url)
+            try:
+                links = process_url(url)
+            except RetryLater as e:
+                scheduler.retry(url, depth, host, e.delay)
+                continue
+            finally:
+                scheduler.done(host)
 
             # no need to add pending links if we're at max recursion depth
-            if max_depth is not None and at_depth >= max_depth:
-                continue
-            # normalize links from this URL and add to pending as appropriate
+            if max_depth is not None and depth >= max_depth:
+                links = []
+            # normalize links from this URL and add to pending as
+            # appropriate
             for raw_link in links:
-                link = get_canonical_url(raw_link, root_netloc=root_netloc)
-                if (urlparse(link).netloc == root_netloc and
-                        link not in done_urls):
-                    pending_urls.append(link)
-        at_depth += 1
+                link = accept_link(raw_link)
+                if link is not None:
+                    add_to_frontier(frontier, journal, link, depth + 1)
+            if journal is not None:
+                journal.done(url)
+    finally:
+        frontier.close()
+
+
+def add_to_frontier(frontier, journal, url, depth):
+    """Add url to the frontier, recording it in the journal if it's new.
+
+    :return: True if the URL was new
+    """
+    added = frontier.add(url, depth)
+    if added and journal is not None:
+        journal.add(url, depth)
+    return added
+
+
+def get_site_roots(urls):
+    """Return the root URL of each distinct site among urls."""
+    roots = []
+    for url in urls:
+        root = urlparse(url)._replace(path='/', params='', query='',
+                                      fragment='').geturl()
+        if root not in roots:
+            roots.append(root)
+    return roots
+
+
+def get_robots_parser(url, session, robots_cache):
+    """Return the parser for url's robots.txt."""
+    return robots_cache.get_parser(get_robots_url(url), session)
+
+
+def queue_sitemap_pages(pages, frontier, journal, scope, manifest=None,
+                        store=None, stats=None, max_depth=None):
+    """Add pages listed in sitemaps to the frontier, as seed URLs.
+
+    :param pages: ``(url, lastmod)`` pairs, from
+        :func:`~pycrawl.sitemaps.read_sitemaps`
+    :param scope: a :class:`~pycrawl.scope.CrawlScope`; pages outside
+        it are ignored
+    :param manifest: if given, pages whose lastmod is no newer than
+        the ``Last-Modified`` of the local copy recorded in it are
+        marked as seen instead of being queued, and the links recorded
+        for them are queued instead
+    :param store: the store local copies were saved in
+    :param stats: a :class:`~pycrawl.metrics.CrawlStats` to count
+        queued and unchanged pages in
+    :param max_depth: the crawl's depth limit, if any
+    """
+    if stats is None:
+        stats = NULL_STATS
+    for url, lastmod in pages:
+        try:
+            url = get_canonical_url(url)
+        except ValueError as e:
+            log.debug("skipping sitemap URL %r: %s", url, e)
+            stats.count('bad_links')
+            continue
+        if not scope.allows(url):
+            continue
+        if (manifest is not None and
+                is_unchanged_since(url, lastmod, manifest, store)):
+            frontier.seen.add(url)
+            stats.count('sitemap_unchanged')
+            # pages it links to may still have changed
+            if max_depth is None or max_depth > 0:
+                previous = get_previous_download(url, manifest, store)
+                for link in get_absolute_links(previous.links, url, stats):
+                    if scope.allows(link):
+                        add_to_frontier(frontier, journal, link, 1)
+        elif add_to_frontier(frontier, journal, url, 0):
+            stats.count('sitemap_urls')
+
+
+def is_unchanged_since(url, lastmod, manifest, store=None):
+    """Is the local copy of url at least as new as lastmod?
+
+    :param lastmod: a timestamp, or None if unknown
+    :param manifest: the :class:`~pycrawl.manifest.Manifest` of earlier
+        downloads
+    :return: False unless both lastmod and the copy's
+        ``Last-Modified`` are known
+    """
+    if lastmod is None:
+        return False
+    previous = get_previous_download(url, manifest, store)
+    if previous is None or not previous.last_modified:
+        return False
+    parsed = parsedate_tz(previous.last_modified)
+    if parsed is None:
+        return False
+    return lastmod <= mktime_tz(parsed)
+
+
+def get_crawl_name(seed_urls):
+    """Name a crawl by its seeds, for checking a journal is resumable."""
+    return ' '.join(seed_urls)
+
+
+def get_absolute_links(raw_links, url, stats=None):
+    """Canonicalize the links found in the document at url.
+
+    Relative links are resolved against url.  Malformed links (such as
+    ``http://[::1/``) are dropped.
+
+    :param raw_links: links as found in the document
+    :param url: URL of the document
+    :param stats: a :class:`~pycrawl.metrics.CrawlStats` to count
+        dropped links in, as ``bad_links``
+    :return: a list of canonical URL strings
+    """
+    links = []
+    for link in raw_links:
+        try:
+            # urljoin is not cached, so only resolve relative links
+            if not parse_url(link).scheme:
+                link = urljoin(url, link)
+            links.append(canonical_url(link))
+        except ValueError as e:
+            log.debug("skipping link %r in %s: %s", link, url, e)
+            if stats is not None:
+                stats.count('bad_links')
+    return links
 
 
 def get_canonical_url(url, root_netloc=None):
@@ -94,53 +935,494 @@ def get_canonical_url(url, root_netloc=None):
     :param root_netloc: network location to add if URL has none
     :return: a canonical URL string
     """
-    parsed = urlparse(url)._replace(params='',
-                                    query='',
-                                    fragment='')
-    if root_netloc is not None and parsed.hostname is None:
-        parsed = parsed._replace(scheme='http', netloc=root_netloc)
-    return parsed.geturl()
+    return canonical_url(url, root_netloc)
 
 
-def process_url_and_get_links(url):
+def process_url_and_get_links(url, session=None, robots_cache=None,
+                              max_body_size=None,
+                              max_html_size=DEFAULT_MAX_HTML_SIZE,
+                              manifest=None, html_parser=DEFAULT_HTML_PARSER,
+                              parse_pool=None, store=None, stats=None,
+                              scope=None, head_probe=False, on_result=None,
+                              timeout=None, total_timeout=None, retry=None,
+                              breakers=None):
     """Download and save url, and if it's HTML, update links and return them.
 
+    The body is streamed to disk, so memory use doesn't depend on the
+    size of the document.  Documents of content types outside scope, or
+    larger than max_body_size, are dropped as soon as their headers
+    arrive, before any of the body is read.
+
+    With a manifest, a URL saved on an earlier crawl is requested
+    conditionally; if the server says it hasn't changed, the local copy
+    is kept and the links recorded last time are returned.
+
     :param url: a URL string
+    :param session: CrawlSession to fetch with (default: a shared one)
+    :param robots_cache: RobotsCache to use (default: a shared one)
+    :param max_body_size: if set, skip documents larger than this many
+        bytes
+    :param max_html_size: parse and rewrite at most this many bytes of
+        each HTML document
+    :param manifest: a :class:`~pycrawl.manifest.Manifest` of earlier
+        downloads, to be updated with this one
+    :param html_parser: how to find and rewrite links; one of
+        ``HTML_PARSERS``
+    :param parse_pool: a :class:`~pycrawl.parsepool.ParsePool` to
+        rewrite HTML in, instead of this process
+    :param store: where to write the document (default: a
+        :class:`~pycrawl.storage.MirrorStore`)
+    :param stats: a :class:`~pycrawl.metrics.CrawlStats` to record
+        timings and counts in
+    :param scope: a :class:`~pycrawl.scope.CrawlScope` whose content
+        types to download
+    :param head_probe: if true, check the headers with a HEAD request
+        before fetching the document (unless it is in the manifest)
+    :param on_result: if given, called with a
+        :class:`~pycrawl.results.CrawlResult` for the response
+    :param timeout: ``(connect, read)`` timeouts in seconds (default:
+        the session's)
+    :param total_timeout: if set, give up on the response if it's still
+        downloading after this many seconds
+    :param retry: a :class:`~pycrawl.retry.RetryPolicy`; if given, a
+        fetch that fails in a way that may not last raises RetryLater
+        until the URL has been retried enough
+    :param breakers: :class:`~pycrawl.retry.CircuitBreakers` to record
+        the outcome in
     :return: a list of URLs linked to in the document
+    :raise: :class:`~pycrawl.retry.RetryLater`, if the URL should be
+        fetched again later
     """
-    if not can_robots_fetch(url):
+    if session is None:
+        session = get_default_session()
+    if stats is None:
+        stats = NULL_STATS
+    stats.count('urls')
+    with stats.time('robots'):
+        allowed = can_robots_fetch(url, session=session,
+                                   robots_cache=robots_cache)
+    if not allowed:
+        stats.count('robots_denied')
         return []
-    print("fetching {}".format(url))
+    previous = get_previous_download(url, manifest, store)
+    headers = previous.conditional_headers() if previous else {}
     try:
-        response = requests.get(url)
-    except ConnectionError:
+        if head_probe and previous is None:
+            with stats.time('head'):
+                probe_url(url, session, scope, max_body_size,
+                          timeout=timeout)
+    except UnwantedContentType as e:
+        log.info("skipping %s: %s", url, e)
+        stats.count('unwanted_type')
+        return []
+    except BodyTooLarge as e:
+        log.info("skipping %s: %s", url, e)
+        stats.count('too_large')
         return []
+    log.debug("fetching %s", url)
+    deadline = None
+    if total_timeout is not None:
+        deadline = time.time() + total_timeout
+    try:
+        with stats.time('request'):
+            response = session.get(url, stream=True, headers=headers,
+                                   timeout=timeout)
+    except (ConnectionError, Timeout) as e:
+        fetch_failed(url, e, retry, breakers, stats)
+        stats.count('fetch_errors')
+        return []
+    except RequestException as e:
+        log.warning("can't fetch %s: %s", url, e)
+        stats.count('fetch_errors')
+        return []
+
+    with closing(response):
+        stats.status(response.status_code)
+        check_response(url, response.status_code, response.headers, retry,
+                       breakers, stats)
+        if previous is not None and response.status_code == 304:
+            stats.count('not_modified')
+            report_result(on_result, url, response.status_code,
+                          response.headers, previous.links)
+            return previous.links
+        content_type = response.headers.get('content-type', '')
+        body = None
+        try:
+            check_content_type(content_type, scope)
+            check_content_length(response.headers.get('content-length'),
+                                 max_body_size)
+            digest = BodyDigest()
+            chunks = stats.time_iter('download',
+                                     response.iter_content(CHUNK_SIZE))
+            if deadline is not None:
+                chunks = limit_time(chunks, deadline)
+            chunks = digest.wrap(limit_size(chunks, max_body_size))
+            if on_result is not None:
+                body = BodyBuffer()
+                chunks = body.wrap(chunks)
+            links = save_stream_and_get_links(
+                url, content_type, chunks,
+                encoding=response.encoding, max_html_size=max_html_size,
+                html_parser=html_parser, parse_pool=parse_pool, store=store,
+                stats=stats)
+            stats.count('documents')
+            stats.count('bytes_downloaded', digest.size)
+            if manifest is not None:
+                manifest.put(url, ManifestEntry(
+                    etag=response.headers.get('etag'),
+                    last_modified=response.headers.get('last-modified'),
+                    length=digest.size, sha1=digest.hexdigest(),
+                    links=links))
+            report_result(on_result, url, response.status_code,
+                          response.headers, links, body)
+            return links
+        except UnwantedContentType as e:
+            log.info("skipping %s: %s", url, e)
+            stats.count('unwanted_type')
+        except BodyTooLarge as e:
+            log.info("skipping %s: %s", url, e)
+            stats.count('too_large')
+        except (ChunkedEncodingError, ConnectionError, Timeout) as e:
+            if body is not None:
+                body.close()
+            fetch_failed(url, e, retry, breakers, stats)
+            stats.count('fetch_errors')
+            return []
+        except RequestException as e:
+            if body is not None:
+                body.close()
+            log.warning("can't fetch %s: %s", url, e)
+            stats.count('fetch_errors')
+            return []
+        except BaseException:
+            if body is not None:
+                body.close()
+            raise
+        # skipped once the headers were in
+        if body is not None:
+            body.close()
+        report_result(on_result, url, response.status_code,
+                      response.headers, [])
+        return []
+
+
+def report_result(on_result, url, status, headers, links, body=None):
+    """Pass a response's :class:`~pycrawl.results.CrawlResult` to
+    on_result, if given.
+
+    :param links: links as found in the document
+    :param body: the :class:`~pycrawl.results.BodyBuffer` holding its
+        body, if read
+    """
+    if on_result is None:
+        return
+    on_result(CrawlResult(url, status, headers,
+                          get_absolute_links(links, url),
+                          body.detach() if body is not None else None))
 
+
+def fetch_failed(url, reason, retry=None, breakers=None, stats=NULL_STATS,
+                 retry_after=None):
+    """Record a failed fetch of url, of a kind that may not last.
+
+    :param reason: what went wrong: an exception, or a description
+    :param retry: a :class:`~pycrawl.retry.RetryPolicy`, or None not to
+        retry
+    :param breakers: :class:`~pycrawl.retry.CircuitBreakers`, or None
+    :param retry_after: seconds the server asked us to wait, if any
+    :raise: :class:`~pycrawl.retry.RetryLater`, if the URL should be
+        fetched again later
+    """
+    if breakers is not None:
+        breakers.record(parse_url(url).netloc, False)
+    if retry is not None:
+        try:
+            retry.check(url, str(reason), retry_after)
+        except RetryLater:
+            stats.count('retries')
+            raise
+
+
+def check_response(url, status, headers, retry=None, breakers=None,
+                   stats=NULL_STATS):
+    """Record the outcome of a request from its status.
+
+    A status worth retrying (such as 503) is a failure, passed on to
+    :func:`fetch_failed`; once the URL has been retried enough, the
+    response is kept like any other.
+
+    :param headers: the response headers
+    :raise: :class:`~pycrawl.retry.RetryLater`, if the URL should be
+        fetched again later
+    """
+    statuses = retry.statuses if retry is not None else RETRY_STATUSES
+    if status in statuses:
+        fetch_failed(url, "HTTP status {}".format(status), retry, breakers,
+                     stats, parse_retry_after(headers.get('retry-after')))
+        return
+    if breakers is not None:
+        breakers.record(parse_url(url).netloc, True)
+    if retry is not None:
+        retry.succeeded(url)
+
+
+def get_previous_download(url, manifest, store=None):
+    """Return the manifest entry for url, if its local copy still exists.
+
+    :param url: a URL string
+    :param manifest: a Manifest, or None
+    :param store: the store the copy was saved in (default: a
+        :class:`~pycrawl.storage.MirrorStore`)
+    :return: a ManifestEntry, or None
+    """
+    if manifest is None:
+        return None
+    entry = manifest.get(url)
+    if entry is None:
+        return None
+    if store is None:
+        store = MirrorStore()
+    _, filename = get_host_and_filename(url)
+    if not store.exists(filename, url):
+        return None
+    return entry
+
+
+def probe_url(url, session, scope=None, max_body_size=None, timeout=None):
+    """Check a document's headers with a HEAD request.
+
+    A GET can be dropped as soon as its headers arrive, but by then the
+    server has started sending the body, and the connection can't be
+    reused; a HEAD request avoids both.  If the server doesn't answer
+    the HEAD request with a 200, the GET is left to find out.
+
+    :param url: a URL string
+    :param session: CrawlSession to fetch with
+    :param scope: a :class:`~pycrawl.scope.CrawlScope` whose content
+        types to download
+    :param max_body_size: maximum size in bytes, or None for no limit
+    :param timeout: ``(connect, read)`` timeouts in seconds (default:
+        the session's)
+    :raise: UnwantedContentType or BodyTooLarge, if the document isn't
+        worth fetching
+    """
+    try:
+        response = session.head(url, allow_redirects=True, timeout=timeout)
+    except RequestException:
+        return
+    with closing(response):
+        if response.status_code != 200:
+            return
+        check_content_type(response.headers.get('content-type'), scope)
+        check_content_length(response.headers.get('content-length'),
+                             max_body_size)
+
+
+class UnwantedContentType(Exception):
+    """A document's content type was not one to download."""
+
+
+def check_content_type(content_type, scope):
+    """Raise UnwantedContentType if scope doesn't allow a Content-Type.
+
+    :param content_type: the header value, or None if absent
+    :param scope: a :class:`~pycrawl.scope.CrawlScope`, or None to
+        allow any type
+    """
+    if scope is not None and not scope.allows_type(content_type):
+        raise UnwantedContentType("content type {!r} not wanted".format(
+            content_type))
+
+
+class BodyTooLarge(Exception):
+    """A document was larger than the configured maximum size."""
+
+
+def check_content_length(content_length, max_size):
+    """Raise BodyTooLarge if a Content-Length header exceeds max_size.
+
+    :param content_length: the header value, or None if absent
+    :param max_size: maximum size in bytes, or None for no limit
+    """
+    if max_size is None or content_length is None:
+        return
+    try:
+        length = int(content_length)
+    except ValueError:
+        return
+    if length > max_size:
+        raise BodyTooLarge("Content-Length {} exceeds {} bytes".format(
+            length, max_size))
+
+
+def limit_size(chunks, max_size):
+    """Pass byte chunks through, raising BodyTooLarge past max_size bytes."""
+    size = 0
+    for chunk in chunks:
+        size += len(chunk)
+        if max_size is not None and size > max_size:
+            raise BodyTooLarge("body exceeds {} bytes".format(max_size))
+        yield chunk
+
+
+def limit_time(chunks, deadline):
+    """Pass byte chunks through, raising Timeout if any arrive after
+    deadline, a ``time.time()`` value."""
+    for chunk in chunks:
+        if time.time() > deadline:
+            raise Timeout("download took too long")
+        yield chunk
+
+
+def read_prefix(chunks, limit):
+    """Read byte chunks until more than limit bytes have been read.
+
+    :param chunks: an iterable of byte strings
+    :param limit: number of bytes, or None to read everything
+    :return: ``(prefix, rest)``, where prefix holds the bytes read and
+        rest is an iterator over the remaining chunks, or None if the
+        whole input fitted within limit
+    """
+    chunks = iter(chunks)
+    buf = []
+    size = 0
+    for chunk in chunks:
+        buf.append(chunk)
+        size += len(chunk)
+        if limit is not None and size > limit:
+            return b''.join(buf), chunks
+    return b''.join(buf), None
+
+
+def decode_html(raw, encoding):
+    """Decode an HTML document's bytes, replacing undecodable ones."""
+    return raw.decode(encoding or 'utf-8', 'replace')
+
+
+def encode_html(html, encoding):
+    """Encode a rewritten HTML document with the encoding it was read in.
+
+    Characters the encoding can't represent become character references.
+    """
+    return html.encode(encoding or 'utf-8', 'xmlcharrefreplace')
+
+
+def is_html(content_type):
+    """Should a document with this content type be parsed for links?
+
+    :param content_type: a Content-Type header, which may have
+        parameters such as a charset
+    """
+    return parse_content_type(content_type)[0] in HTML_TYPES
+
+
+def save_stream_and_get_links(url, content_type, chunks, encoding=None,
+                              max_html_size=DEFAULT_MAX_HTML_SIZE,
+                              html_parser=DEFAULT_HTML_PARSER,
+                              parse_pool=None, store=None, stats=None):
+    """Save a document read in chunks, returning the links in it if HTML.
+
+    Non-HTML documents are written to disk chunk by chunk.  HTML is
+    read into memory to be rewritten, unless it's larger than
+    max_html_size, in which case it's saved unchanged and links are
+    taken from the first max_html_size bytes only.  Stores that keep
+    documents as served (see :mod:`pycrawl.storage`) get HTML
+    unchanged too.
+
+    :param url: the URL the document was fetched from
+    :param content_type: the document's content type
+    :param chunks: iterable of byte strings making up the document
+    :param encoding: character encoding of HTML documents
+    :param max_html_size: parse and rewrite at most this many bytes
+    :param html_parser: how to find and rewrite links
+    :param parse_pool: a :class:`~pycrawl.parsepool.ParsePool` to
+        rewrite HTML in, instead of this process
+    :param store: where to write the document (default: a
+        :class:`~pycrawl.storage.MirrorStore`)
+    :param stats: a :class:`~pycrawl.metrics.CrawlStats` to record
+        parse and write times in
+    :return: a list of URLs linked to in the document
+    """
+    if store is None:
+        store = MirrorStore()
+    if stats is None:
+        stats = NULL_STATS
     hostname, filename = get_host_and_filename(url)
+    if not is_html(content_type):
+        with stats.time('write'):
+            size = write_chunks(store, filename, chunks, url=url,
+                                content_type=content_type)
+        stats.count('bytes_written', size)
+        return []
 
-    if response.headers['content-type'] == 'text/html':
-        filemode = 'w'
-        file_content, links = get_content_and_links(response.text, hostname)
-    else:
-        filemode = 'wb'
-        file_content = response.content
-        links = []
-    if not os.path.exists(os.path.dirname(filename)):
-        os.makedirs(os.path.dirname(filename))
-    with open(filename, filemode) as f:
-        f.write(file_content)
+    prefix, rest = read_prefix(chunks, max_html_size)
+    if rest is None and store.rewrites_links:
+        with stats.time('parse'):
+            file_content, links = rewrite_html(prefix, encoding, hostname,
+                                               html_parser, parse_pool)
+        with stats.time('write'):
+            size = write_chunks(store, filename,
+                                [encode_html(file_content, encoding)],
+                                url=url, content_type=content_type)
+        stats.count('bytes_written', size)
+        return links
+    # too big to rewrite, or not to be rewritten: save it as it is
+    with stats.time('write'):
+        size = write_chunks(store, filename,
+                            itertools.chain([prefix], rest or []),
+                            url=url, content_type=content_type)
+    stats.count('bytes_written', size)
+    with stats.time('parse'):
+        _, links = rewrite_html(prefix[:max_html_size], encoding, hostname,
+                                html_parser, parse_pool)
     return links
 
 
+def rewrite_html(raw, encoding, hostname, html_parser=DEFAULT_HTML_PARSER,
+                 parse_pool=None):
+    """Decode an HTML document, then update and return its local links.
+
+    :param raw: the document, as bytes
+    :param encoding: its character encoding
+    :param hostname: hostname from which the document came
+    :param html_parser: how to find and rewrite links
+    :param parse_pool: a ParsePool to do the work in, if given
+    :return: tuple of replacement HTML and list of linked URLs
+    """
+    if parse_pool is not None:
+        return parse_pool.get_content_and_links(raw, encoding, hostname,
+                                                html_parser)
+    return get_content_and_links(decode_html(raw, encoding), hostname,
+                                 parser=html_parser)
+
+
+def get_manifest_path(url):
+    """Return the default manifest filename for a crawl from url.
+
+    The manifest sits next to the directory the site is saved in.
+    """
+    hostname, _ = get_host_and_filename(url)
+    return hostname + '.manifest'
+
+
+def get_partition_path(path, partition):
+    """Return the name of one partition's copy of the file path.
+
+    Each process of a ``--processes`` crawl keeps its own manifest and
+    robots cache, since each fetches a different share of the URLs.
+    """
+    return '{}.{}'.format(path, partition)
+
+
 def get_host_and_filename(url):
-    parsed_url = urlparse(url)
+    parsed_url = parse_url(url)
     hostname = parsed_url.hostname
     path_str = parsed_url.path or '__root__'
     path = path_str.split('/')
     return (hostname, os.path.join(hostname, *path))
 
 
-def get_content_and_links(html, hostname):
+def get_content_and_links(html, hostname, parser=DEFAULT_HTML_PARSER):
     """Update and return local links in HTML.
 
     ie. return an HTML document equivalent to the input, but with
@@ -149,9 +1431,15 @@ def get_content_and_links(html, hostname):
 
     :param html: original HTML document
     :param hostname: hostname from which the document came
+    :param parser: ``'stream'`` to rewrite links in place (see
+        :mod:`pycrawl.links`), or the name of a BeautifulSoup parser to
+        rebuild the document with
     :return: tuple of replacement HTML and list of linked URLs
     """
-    soup = bs4.BeautifulSoup(html)
+    if parser == 'stream':
+        return rewrite_links(html, hostname)
+
+    soup = bs4.BeautifulSoup(html, parser)
     links = []
 
     def process_attrs(tagname, attrname):
@@ -160,17 +1448,15 @@ def get_content_and_links(html, hostname):
                 attr = tag[attrname]
             except KeyError:
                 continue
-            parsed_attr = urlparse(attr)
-            if parsed_attr.scheme == 'mailto':
+            new_attr = localize_link(attr, hostname)
+            if new_attr is None:
                 continue
-            if parsed_attr.hostname == hostname:
-                parsed_attr = parsed_attr._replace(scheme='', netloc='')
-                attr = parsed_attr.geturl()
-                tag[attrname] = attr
-            links.append(attr)
-
-    process_attrs('a', 'href')
-    process_attrs('img', 'src')
+            if new_attr != attr:
+                tag[attrname] = new_attr
+            links.append(new_attr)
+
+    for tagname, attrname in LINK_ATTRS.items():
+        process_attrs(tagname, attrname)
     try:
         return (str(soup), links)
     except RuntimeError:
@@ -179,50 +1465,22 @@ def get_content_and_links(html, hostname):
         return (html, links)
 
 
-robots_txt_cache = {}
-
+robots_txt_cache = RobotsCache()
 
-class AllowAllRobots(object):
-    """Dummy RobotFileParser-alike that allows all paths"""
-    def can_fetch(self, robot, path):
-        return True
 
-
-def can_robots_fetch(url):
+def can_robots_fetch(url, session=None, robots_cache=None):
     """According to the site's robots.txt, may we access this URL?
 
     :param url: a URL string
+    :param session: CrawlSession to fetch with (default: a shared one)
+    :param robots_cache: RobotsCache to use (default: a shared one)
     :rtype: bool
-    :raise: RuntimeError, when robots.txt is found but unparseable
     """
-    parsed_url = urlparse(url)
-    robots_url_obj = parsed_url._replace(path='/robots.txt')
-    robots_url = robots_url_obj.geturl()
-
-    try:
-        rp = robots_txt_cache[robots_url]
-        return rp.can_fetch("*", url)
-    except KeyError:
-        try:
-            response = requests.get(robots_url)
-        except ConnectionError:
-            # no robots.txt => assume robots are OK
-            robots_txt_cache[robots_url] = AllowAllRobots()
-            return True
-        if response.status_code != 200:
-            robots_txt_cache[robots_url] = AllowAllRobots()
-            return True
-
-        try:
-            rp = robotparser.RobotFileParser(robots_url)
-            rp.read()
-            if not rp.can_fetch("*", url):
-                robots_txt_cache[robots_url] = rp
-                return False
-        except:
-            raise RuntimeError("unreadable robots.txt")
-        robots_txt_cache[robots_url] = rp
-        return True
+    if session is None:
+        session = get_default_session()
+    if robots_cache is None:
+        robots_cache = robots_txt_cache
+    return robots_cache.can_fetch(url, session)
 
 
 if __name__ == '__main__':
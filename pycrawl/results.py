@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+
+"""What a crawl hands back for each response, as it happens.
+
+Give the crawler an ``on_result`` callback and it is called with a
+:class:`CrawlResult` for every response received: its URL, status,
+headers, the links found in it and a copy of the body.  The copy is
+taken as the body streams past on its way to the store, so results can
+be processed while the crawl goes on, without reading anything back
+from disk.
+"""
+
+from __future__ import absolute_import
+
+import tempfile
+
+from pycrawl.scope import parse_content_type
+from pycrawl.storage import DEFAULT_SPOOL_SIZE
+
+
+class CrawlResult(object):
+    """One response from a crawl.
+
+    :ivar url: the canonical URL fetched
+    :ivar status: the HTTP status code
+    :ivar headers: the response headers, a case-insensitive mapping
+    :ivar links: canonical URLs of the links found in the document
+        (for HTML only)
+    :ivar body: a binary file object holding the body as served,
+        positioned at the start, or None if the body wasn't read (for
+        a ``304 Not Modified``, or a document of a type or size the
+        crawl skips)
+    """
+
+    __slots__ = ('url', 'status', 'headers', 'links', 'body')
+
+    def __init__(self, url, status, headers, links=(), body=None):
+        self.url = url
+        self.status = status
+        self.headers = headers
+        self.links = list(links)
+        self.body = body
+
+    def __repr__(self):
+        return 'CrawlResult({!r}, {!r})'.format(self.url, self.status)
+
+    @property
+    def content_type(self):
+        """The media type, without parameters, e.g. ``'text/html'``."""
+        return parse_content_type(self.headers.get('content-type'))[0]
+
+    def read(self):
+        """Return the whole body as bytes (empty if there is none)."""
+        if self.body is None:
+            return b''
+        return self.body.read()
+
+    def close(self):
+        """Discard the copy of the body."""
+        if self.body is not None:
+            self.body.close()
+
+
+class BodyBuffer(object):
+    """Keep a copy of a body as it streams past, for a CrawlResult.
+
+    Bodies up to ``spool_size`` bytes are kept in memory; larger ones
+    go to a temporary file.
+    """
+
+    def __init__(self, spool_size=DEFAULT_SPOOL_SIZE):
+        self.file = tempfile.SpooledTemporaryFile(spool_size)
+
+    def wrap(self, chunks):
+        """Pass byte chunks through, copying each one."""
+        for chunk in chunks:
+            self.update(chunk)
+            yield chunk
+
+    def update(self, chunk):
+        self.file.write(chunk)
+
+    def detach(self):
+        """Return the copy, rewound, for the caller to close."""
+        self.file.seek(0)
+        return self.file
+
+    def close(self):
+        self.file.close()
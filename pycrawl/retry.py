@@ -0,0 +1,244 @@
+# -*- coding: utf-8 -*-
+
+"""Retrying failed fetches, and giving up on hosts that keep failing.
+
+A fetch that fails in a way that may not last (a connection error, a
+timeout, a ``429 Too Many Requests`` or a 5xx status) is tried again
+after a delay, rather than the URL being lost.  Fetchers never sleep:
+they raise :class:`RetryLater`, and the crawl engine puts the URL back
+in the frontier and tells the scheduler not to send anything to its
+host until the delay is up.  The delays grow exponentially, with
+jitter so that retries from many URLs don't arrive together, and a
+``Retry-After`` header is honoured.
+
+:class:`CircuitBreakers` track each host's run of failures.  After
+``threshold`` failures in a row, a host's circuit opens: the scheduler
+sends it nothing for a cooldown period, then a single request to see
+whether it has recovered.  A success closes the circuit again; a
+failure reopens it for twice as long.  A host whose circuit opens
+``max_opens`` times without a success in between is given up on, and
+the rest of its URLs are dropped, so that a dead host can't hold up
+the end of a crawl or tie up workers.
+"""
+
+from email.utils import mktime_tz, parsedate_tz
+import logging
+import random
+import threading
+import time
+
+
+log = logging.getLogger(__name__)
+
+RETRY_STATUSES = frozenset([429, 500, 502, 503, 504])
+
+DEFAULT_RETRIES = 2
+DEFAULT_BACKOFF = 1.0  # seconds before the first retry
+DEFAULT_MAX_RETRY_DELAY = 60.0  # longest wait before a retry, in seconds
+
+DEFAULT_THRESHOLD = 5  # failures in a row that open a host's circuit
+DEFAULT_COOLDOWN = 30.0  # seconds a circuit first stays open
+DEFAULT_MAX_COOLDOWN = 600.0
+DEFAULT_MAX_OPENS = 3
+
+
+class RetryLater(Exception):
+    """A fetch failed, but the URL should be tried again after a delay.
+
+    :ivar delay: seconds to wait before trying the URL's host again
+    """
+
+    def __init__(self, message, delay):
+        Exception.__init__(self, message)
+        self.delay = delay
+
+
+def parse_retry_after(value, now=None):
+    """Parse a ``Retry-After`` header into a number of seconds.
+
+    :param value: the header value: seconds, or an HTTP date
+    :param now: the current time (default: ``time.time()``)
+    :return: seconds from now, at least 0, or None if value is missing
+        or invalid
+    """
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    parsed = parsedate_tz(value)
+    if parsed is None:
+        return None
+    if now is None:
+        now = time.time()
+    return max(0.0, mktime_tz(parsed) - now)
+
+
+class RetryPolicy(object):
+    """How often, and after how long, to retry a failed URL.
+
+    The nth retry of a URL waits between half and all of
+    ``backoff * 2 ** (n - 1)`` seconds, chosen at random, up to
+    ``max_delay``.  A ``Retry-After`` from the server is waited for
+    instead, if longer; if it's longer than ``max_delay``, the URL is
+    given up on.
+
+    Safe to use from several threads at once.
+
+    :param retries: most times to retry one URL
+    :param backoff: seconds before the first retry
+    :param max_delay: longest wait before a retry
+    :param statuses: HTTP statuses to retry
+    """
+
+    def __init__(self, retries=DEFAULT_RETRIES, backoff=DEFAULT_BACKOFF,
+                 max_delay=DEFAULT_MAX_RETRY_DELAY,
+                 statuses=RETRY_STATUSES, random=random.random):
+        self.retries = retries
+        self.backoff = backoff
+        self.max_delay = max_delay
+        self.statuses = statuses
+        self.random = random
+        self._lock = threading.Lock()
+        self._attempts = {}  # url -> retries so far, for failing URLs
+
+    def delay(self, attempt, retry_after=None):
+        """Return the seconds to wait before the given retry.
+
+        :param attempt: 1 for the first retry, 2 for the second...
+        :param retry_after: seconds the server asked us to wait, if any
+        :return: the delay, or None if retry_after is too long to wait
+        """
+        if retry_after is not None and retry_after > self.max_delay:
+            return None
+        delay = min(self.max_delay, self.backoff * 2 ** (attempt - 1))
+        delay *= 0.5 + self.random() / 2
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return delay
+
+    def check(self, url, reason, retry_after=None):
+        """Decide whether to retry a URL that has just failed.
+
+        :param reason: what went wrong, for the log
+        :param retry_after: seconds the server asked us to wait, if any
+        :raise: RetryLater, if the URL should be retried
+        """
+        with self._lock:
+            attempt = self._attempts.get(url, 0) + 1
+            delay = None
+            if attempt <= self.retries:
+                delay = self.delay(attempt, retry_after)
+            if delay is None:
+                self._attempts.pop(url, None)
+                log.info("giving up on %s: %s", url, reason)
+                return
+            self._attempts[url] = attempt
+        log.debug("retrying %s in %.1fs: %s", url, delay, reason)
+        raise RetryLater(reason, delay)
+
+    def succeeded(self, url):
+        """Forget any failures of a URL, now that it has been fetched."""
+        if self._attempts:
+            with self._lock:
+                self._attempts.pop(url, None)
+
+
+class _Circuit(object):
+    __slots__ = ('failures', 'opens', 'open_until')
+
+    def __init__(self):
+        self.failures = 0
+        self.opens = 0
+        self.open_until = None
+
+
+class CircuitBreakers(object):
+    """A circuit breaker for each host.
+
+    Fetchers report each outcome with :meth:`record`; the scheduler
+    asks :meth:`open_until` and :meth:`is_tripped` before sending a host
+    more requests, and drops the URLs of hosts that
+    :meth:`is_abandoned`.
+
+    Safe to use from several threads at once.
+
+    :param threshold: failures in a row that open a host's circuit
+    :param cooldown: seconds the circuit first stays open; each time it
+        reopens, this doubles, up to ``max_cooldown``
+    :param max_opens: give up on a host once its circuit has opened
+        this many times in a row
+    :param stats: a :class:`~pycrawl.metrics.CrawlStats` to count
+        circuits opened in
+    """
+
+    def __init__(self, threshold=DEFAULT_THRESHOLD, cooldown=DEFAULT_COOLDOWN,
+                 max_cooldown=DEFAULT_MAX_COOLDOWN,
+                 max_opens=DEFAULT_MAX_OPENS, stats=None, clock=time.time):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.max_opens = max_opens
+        self.stats = stats
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._circuits = {}  # host -> _Circuit, for hosts that have failed
+
+    def record(self, host, ok):
+        """Record the outcome of a request to host.
+
+        :param host: the host's network location, as in the frontier
+        :param ok: False if the request failed in a way worth retrying
+        """
+        if ok and host not in self._circuits:
+            return
+        with self._lock:
+            if ok:
+                self._circuits.pop(host, None)
+                return
+            now = self.clock()
+            circuit = self._circuits.get(host)
+            if circuit is None:
+                circuit = self._circuits[host] = _Circuit()
+            elif circuit.open_until is not None and now < circuit.open_until:
+                # a request sent before the circuit opened
+                return
+            circuit.failures += 1
+            # once open, one more failure (of the trial request) reopens
+            if circuit.opens == 0 and circuit.failures < self.threshold:
+                return
+            circuit.failures = 0
+            circuit.opens += 1
+            opens = circuit.opens
+            cooldown = min(self.max_cooldown,
+                           self.cooldown * 2 ** (opens - 1))
+            circuit.open_until = now + cooldown
+        if opens > self.max_opens:
+            log.warning("giving up on %s after repeated failures", host)
+        else:
+            log.warning("%s keeps failing; pausing it for %.0fs", host,
+                        cooldown)
+        if self.stats is not None:
+            self.stats.count('circuits_opened')
+
+    def _get(self, host):
+        # a lock-free read, like dict.get
+        return self._circuits.get(host)
+
+    def open_until(self, host):
+        """Return the time host's circuit stays open until, or None."""
+        circuit = self._get(host)
+        return circuit.open_until if circuit is not None else None
+
+    def is_tripped(self, host):
+        """Has host's circuit opened since its last success?
+
+        A tripped host should be sent one request at a time.
+        """
+        circuit = self._get(host)
+        return circuit is not None and circuit.opens > 0
+
+    def is_abandoned(self, host):
+        """Has host failed so often that its URLs should be dropped?"""
+        circuit = self._get(host)
+        return circuit is not None and circuit.opens > self.max_opens
@@ -0,0 +1,276 @@
+# -*- coding: utf-8 -*-
+
+"""robots.txt fetching and caching.
+
+Each robots.txt is downloaded once and parsed from the text already in
+hand.  Parsed entries expire after a TTL, and the cache can be saved to
+and loaded from disk so that repeat crawls skip the request entirely.
+
+A 4xx status means a site has no robots.txt, and anything may be
+crawled.  When a robots.txt can't be fetched for a reason that may not
+last (a connection error, timeout or 5xx status), everything is allowed
+for now, but only for a short time, and the failure is not saved.  A
+robots.txt that can't be parsed disallows everything on its host, for
+the same short time.
+"""
+
+from __future__ import absolute_import
+
+import json
+import logging
+import os
+import threading
+import time
+try:  # Python 3
+    from urllib import robotparser
+except ImportError:  # Python 2
+    import robotparser
+
+from requests.exceptions import RequestException
+
+from pycrawl.urls import parse_url
+
+
+log = logging.getLogger(__name__)
+
+DEFAULT_TTL = 24 * 60 * 60  # seconds
+DEFAULT_FAILURE_TTL = 5 * 60  # seconds before a failed fetch is retried
+
+
+class AllowAllRobots(object):
+    """Dummy RobotFileParser-alike that allows all paths"""
+    def can_fetch(self, robot, path):
+        return True
+
+
+class DisallowAllRobots(object):
+    """Dummy RobotFileParser-alike that disallows all paths"""
+    def can_fetch(self, robot, path):
+        return False
+
+
+def get_robots_url(url):
+    """Return the URL of the robots.txt governing the given URL."""
+    return parse_url(url).robots_url
+
+
+def parse_robots_txt(robots_url, text):
+    """Build a robots.txt parser from an already-downloaded robots.txt.
+
+    :param robots_url: URL the robots.txt was fetched from
+    :param text: contents of the robots.txt, or None if the site has
+        none (in which case everything is allowed)
+    :return: a RobotFileParser or AllowAllRobots
+    :raise: RuntimeError, when robots.txt is unparseable
+    """
+    if text is None:
+        return AllowAllRobots()
+    try:
+        rp = robotparser.RobotFileParser(robots_url)
+        rp.parse(text.splitlines())
+    except Exception as e:
+        raise RuntimeError("unreadable robots.txt: {}".format(e))
+    return rp
+
+
+def get_crawl_delay(parser, useragent="*"):
+    """Return the seconds a robots.txt asks us to leave between requests.
+
+    Both ``Crawl-delay`` and ``Request-rate`` are understood; if both
+    are given, the longer delay applies.  Python 2's robotparser reads
+    neither, so there this always returns None.
+
+    :param parser: a parser from :func:`parse_robots_txt`
+    :return: a delay in seconds, or None if the robots.txt sets none
+    """
+    delays = []
+    crawl_delay = getattr(parser, 'crawl_delay', None)
+    if crawl_delay is not None:
+        delay = crawl_delay(useragent)
+        if delay is not None:
+            delays.append(float(delay))
+    request_rate = getattr(parser, 'request_rate', None)
+    if request_rate is not None:
+        rate = request_rate(useragent)
+        if rate is not None and rate.requests > 0:
+            delays.append(float(rate.seconds) / rate.requests)
+    return max(delays) if delays else None
+
+
+class RobotsUnavailable(Exception):
+    """A robots.txt couldn't be fetched, for a reason that may not last."""
+
+
+def fetch_robots_txt(robots_url, session):
+    """Download a robots.txt.
+
+    :param robots_url: URL of the robots.txt
+    :param session: requests-style session to fetch with
+    :return: the text of the robots.txt, or None if there isn't one
+    :raise: RobotsUnavailable, on a connection error, timeout or status
+        other than 200 or 4xx
+    """
+    try:
+        response = session.get(robots_url)
+    except RequestException as e:
+        raise RobotsUnavailable(str(e))
+    if 400 <= response.status_code < 500:
+        # no robots.txt => assume robots are OK
+        return None
+    if response.status_code != 200:
+        raise RobotsUnavailable("HTTP status {}".format(
+            response.status_code))
+    return response.text
+
+
+class RobotsCache(object):
+    """Thread-safe cache of parsed robots.txt files, keyed by URL.
+
+    When several threads want the same robots.txt at once, only one of
+    them fetches it while the others wait for the result.
+
+    :param ttl: seconds after which an entry is fetched again
+    :param path: if given, a JSON file to load entries from and save
+        them to
+    :param failure_ttl: seconds after which a robots.txt that couldn't
+        be fetched is tried again
+    """
+
+    def __init__(self, ttl=DEFAULT_TTL, path=None,
+                 failure_ttl=DEFAULT_FAILURE_TTL):
+        self.ttl = ttl
+        self.path = path
+        self.failure_ttl = failure_ttl
+        self._lock = threading.Lock()
+        # robots_url -> (fetched_at, text, parser, failed)
+        self._entries = {}
+        self._fetching = {}  # robots_url -> threading.Event
+        if path is not None and os.path.exists(path):
+            self.load()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def lookup(self, robots_url):
+        """Return the cached parser for robots_url, or None if absent or stale.
+        """
+        with self._lock:
+            return self._lookup(robots_url)
+
+    def _lookup(self, robots_url):
+        # caller must hold self._lock
+        try:
+            fetched_at, text, parser, failed = self._entries[robots_url]
+        except KeyError:
+            return None
+        ttl = self.failure_ttl if failed else self.ttl
+        if ttl is not None and time.time() - fetched_at > ttl:
+            return None
+        return parser
+
+    def store(self, robots_url, text, fetched_at=None):
+        """Parse and cache a robots.txt.
+
+        If it can't be parsed, a disallow-all parser is cached instead,
+        like a failed fetch: it expires after ``failure_ttl`` and is
+        never saved.
+
+        :param robots_url: URL the robots.txt was fetched from
+        :param text: its contents, or None if the site has none
+        :param fetched_at: when it was fetched (default: now)
+        :return: the parser
+        """
+        failed = False
+        try:
+            parser = parse_robots_txt(robots_url, text)
+        except RuntimeError as e:
+            log.warning("can't parse %s, disallowing everything for now: "
+                        "%s", robots_url, e)
+            parser = DisallowAllRobots()
+            failed = True
+        if fetched_at is None:
+            fetched_at = time.time()
+        with self._lock:
+            self._entries[robots_url] = (fetched_at, text, parser, failed)
+        return parser
+
+    def store_failure(self, robots_url, reason):
+        """Cache an allow-all parser for a robots.txt that couldn't be
+        fetched.
+
+        The entry expires after ``failure_ttl`` and is never saved, so
+        a passing failure doesn't turn robots.txt off for long.
+
+        :param reason: what went wrong, for the log
+        :return: the parser
+        """
+        log.info("can't fetch %s, allowing everything for now: %s",
+                 robots_url, reason)
+        parser = parse_robots_txt(robots_url, None)
+        with self._lock:
+            self._entries[robots_url] = (time.time(), None, parser, True)
+        return parser
+
+    def get_parser(self, robots_url, session):
+        """Return a parser for robots_url, fetching it if necessary.
+
+        :param robots_url: URL of the robots.txt
+        :param session: requests-style session to fetch with
+        """
+        while True:
+            with self._lock:
+                parser = self._lookup(robots_url)
+                if parser is not None:
+                    return parser
+                event = self._fetching.get(robots_url)
+                if event is None:
+                    event = threading.Event()
+                    self._fetching[robots_url] = event
+                    break
+            # another thread is fetching it; wait, then look again
+            event.wait()
+
+        try:
+            try:
+                text = fetch_robots_txt(robots_url, session)
+            except RobotsUnavailable as e:
+                return self.store_failure(robots_url, e)
+            return self.store(robots_url, text)
+        finally:
+            with self._lock:
+                del self._fetching[robots_url]
+            event.set()
+
+    def can_fetch(self, url, session, useragent="*"):
+        """According to the site's robots.txt, may we access this URL?"""
+        parser = self.get_parser(get_robots_url(url), session)
+        return parser.can_fetch(useragent, url)
+
+    def load(self, path=None):
+        """Add entries from a file written by :meth:`save`."""
+        path = path or self.path
+        with open(path) as f:
+            data = json.load(f)
+        for robots_url, entry in data.items():
+            self.store(robots_url, entry['text'], entry['fetched_at'])
+
+    def save(self, path=None):
+        """Write all unexpired entries, except failed fetches, to a JSON
+        file."""
+        path = path or self.path
+        now = time.time()
+        with self._lock:
+            data = dict(
+                (robots_url, {'fetched_at': fetched_at, 'text': text})
+                for robots_url, (fetched_at, text, _, failed)
+                in self._entries.items()
+                if not failed and
+                (self.ttl is None or now - fetched_at <= self.ttl))
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f)
+        os.rename(tmp_path, path)
@@ -0,0 +1,348 @@
+# -*- coding: utf-8 -*-
+
+"""Per-host politeness: decide which queued URL may be fetched next.
+
+A :class:`HostScheduler` sits between the frontier and the fetchers,
+and hands out the next URL from whichever host is ready soonest,
+taking it from that host's queue in the frontier.  A host is ready
+when it has fewer than ``per_host_limit`` requests in flight and a
+token in its :class:`TokenBucket`: buckets refill at one token per
+``delay`` seconds, where the delay is the larger of the one configured
+and the ``Crawl-delay`` or ``Request-rate`` in the host's robots.txt.
+
+Until a host's robots.txt is in the robots cache, only one request to
+it is made at a time, so a crawl-delay is known before any burst.
+
+A :class:`CrawlBudget` can also stop the scheduler handing out URLs
+once a number of pages, bytes or seconds has been spent, so that the
+crawl winds down cleanly once the requests in flight are done.
+
+URLs whose fetch failed are handed back with :meth:`HostScheduler.retry`,
+which holds off their host for the retry delay.  With
+:class:`~pycrawl.retry.CircuitBreakers`, a host whose circuit is open
+gets no requests until it closes (then one at a time until a request
+succeeds), and the URLs of hosts given up on are dropped.
+
+Like frontiers, schedulers are not thread-safe.
+"""
+
+from __future__ import absolute_import
+
+import heapq
+import itertools
+import logging
+import threading
+import time
+
+from pycrawl.robots import get_crawl_delay, get_robots_url
+
+
+log = logging.getLogger(__name__)
+
+# longest robots.txt delay honoured, in seconds
+DEFAULT_MAX_DELAY = 60.0
+
+
+class TokenBucket(object):
+    """Allow one request per ``interval`` seconds, in bursts of ``burst``.
+
+    :param interval: seconds for one token to be replenished; 0 for
+        no limit
+    :param burst: most tokens the bucket holds
+    """
+
+    __slots__ = ('interval', 'burst', 'tokens', 'updated')
+
+    def __init__(self, interval=0.0, burst=1, now=None):
+        self.interval = interval
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.time() if now is None else now
+
+    def _refill(self, now):
+        if now > self.updated:
+            if self.interval:
+                self.tokens = min(self.burst, self.tokens +
+                                  (now - self.updated) / self.interval)
+            else:
+                self.tokens = float(self.burst)
+            self.updated = now
+
+    def ready_at(self, now):
+        """Return the time at which a token will be available."""
+        self._refill(now)
+        if self.tokens >= 1 or not self.interval:
+            return now
+        return now + (1 - self.tokens) * self.interval
+
+    def take(self, now):
+        """Use up a token; it may go negative if none was ready."""
+        self._refill(now)
+        if self.interval:
+            self.tokens -= 1
+
+
+class CrawlBudget(object):
+    """Limits on how much a crawl may fetch.
+
+    Pages are counted as the scheduler hands them out; bytes are
+    counted from the ``bytes_downloaded`` statistic, so register
+    :meth:`on_stat` as a :class:`~pycrawl.metrics.CrawlStats` hook.
+
+    :param max_pages: most URLs to fetch
+    :param max_bytes: stop starting new fetches once this many bytes
+        have been downloaded
+    :param max_time: stop starting new fetches after this many seconds
+    """
+
+    def __init__(self, max_pages=None, max_bytes=None, max_time=None,
+                 clock=time.time):
+        self.max_pages = max_pages
+        self.max_bytes = max_bytes
+        self.max_time = max_time
+        self.clock = clock
+        self.start_time = clock()
+        self.pages = 0
+        self.bytes = 0
+        self.exhausted = None
+        self._lock = threading.Lock()
+
+    def on_stat(self, name, value):
+        if name == 'bytes_downloaded':
+            with self._lock:
+                self.bytes += value
+
+    def take_page(self):
+        """Spend a page if the budget allows it.
+
+        :return: False once any limit has been reached
+        """
+        with self._lock:
+            if self.exhausted is None:
+                self.exhausted = self._spent()
+                if self.exhausted is not None:
+                    log.info("crawl budget of %s spent; stopping",
+                             self.exhausted)
+            if self.exhausted is not None:
+                return False
+            self.pages += 1
+            return True
+
+    def stop(self, reason="stop requested"):
+        """Spend the whole budget now, so that no more URLs are started."""
+        with self._lock:
+            if self.exhausted is None:
+                log.info("crawl stopping: %s", reason)
+                self.exhausted = reason
+
+    def _spent(self):
+        # caller must hold self._lock
+        if self.max_pages is not None and self.pages >= self.max_pages:
+            return "{} pages".format(self.max_pages)
+        if self.max_bytes is not None and self.bytes >= self.max_bytes:
+            return "{} bytes".format(self.max_bytes)
+        if (self.max_time is not None and
+                self.clock() - self.start_time >= self.max_time):
+            return "{} seconds".format(self.max_time)
+        return None
+
+
+class _Host(object):
+    __slots__ = ('name', 'robots_url', 'bucket', 'active', 'scheduled',
+                 'robots_known', 'not_before')
+
+    def __init__(self, name, bucket):
+        self.name = name
+        self.robots_url = None
+        self.bucket = bucket
+        self.active = 0
+        self.scheduled = False
+        self.robots_known = False
+        self.not_before = None  # while waiting to retry
+
+
+class HostScheduler(object):
+    """Hand out URLs from a frontier, politely.
+
+    :param frontier: the :class:`~pycrawl.frontier.Frontier` URLs are
+        added to
+    :param delay: minimum seconds between the starts of requests to
+        one host
+    :param burst: requests a host may receive at once before delays
+        apply
+    :param per_host_limit: if set, most requests to one host in flight
+        at the same time
+    :param robots_cache: a :class:`~pycrawl.robots.RobotsCache` to read
+        delays from
+    :param max_delay: longest robots.txt delay to honour; longer ones
+        are cut to this
+    :param budget: a :class:`CrawlBudget`; once it is spent, no more
+        URLs are handed out
+    :param breakers: :class:`~pycrawl.retry.CircuitBreakers` to hold off
+        failing hosts with
+    :param clock: function returning the current time in seconds
+    """
+
+    def __init__(self, frontier, delay=None, burst=1, per_host_limit=None,
+                 robots_cache=None, max_delay=DEFAULT_MAX_DELAY,
+                 budget=None, breakers=None, clock=time.time):
+        self.frontier = frontier
+        self.delay = delay or 0.0
+        self.burst = burst
+        self.per_host_limit = per_host_limit
+        self.robots_cache = robots_cache
+        self.max_delay = max_delay
+        self.budget = budget
+        self.breakers = breakers
+        self.clock = clock
+        self.dropped = 0
+        self._active = 0  # requests in flight, to every host
+        self._hosts = {}
+        self._heap = []  # (ready_at, seq, host)
+        self._seq = itertools.count()
+
+    def __len__(self):
+        return len(self.frontier)
+
+    def hosts(self):
+        """Return the number of hosts seen so far."""
+        return len(self._hosts)
+
+    def take(self):
+        """Choose the next URL to fetch.
+
+        :return: ``((url, depth, host), None)`` for a URL that may be
+            fetched now, which must be passed to :meth:`done` when
+            finished; otherwise ``(None, wait)``, where ``wait`` is the
+            seconds until a host will be ready, or None if there is
+            nothing to wait for except requests in flight (or the
+            budget is spent).  With nothing queued or in flight, the
+            wait is up to the frontier's
+            :meth:`~pycrawl.frontier.Frontier.idle`
+        """
+        if self.budget is not None and self.budget.exhausted is not None:
+            return (None, None)
+        now = self.clock()
+        self._add_new_hosts(now)
+        heap = self._heap
+        while heap:
+            ready_at, _, host = heap[0]
+            if ready_at > now:
+                return (None, ready_at - now)
+            heapq.heappop(heap)
+            host.scheduled = False
+            # the host may have become busy, or its delay changed, since
+            # it was pushed
+            self._check_robots(host)
+            if (self.breakers is not None and
+                    self.breakers.is_abandoned(host.name)):
+                self._drop(host)
+                continue
+            if not self._has_capacity(host):
+                continue
+            ready_at = self._ready_at(host, now)
+            if ready_at > now:
+                self._push(host, ready_at)
+                continue
+            if self.budget is not None and not self.budget.take_page():
+                self._push(host, ready_at)
+                return (None, None)
+            url, depth = self.frontier.pop(host.name)
+            if host.robots_url is None:
+                host.robots_url = get_robots_url(url)
+                self._check_robots(host)
+            host.bucket.take(now)
+            host.active += 1
+            self._active += 1
+            self._schedule(host, now)
+            return ((url, depth, host.name), None)
+        if self._active == 0:
+            # more URLs may yet come from outside the crawl, as in a
+            # distributed one
+            return (None, self.frontier.idle())
+        return (None, None)
+
+    def retry(self, url, depth, host, delay):
+        """Queue a URL again after a failed fetch.
+
+        Nothing more is sent to its host until delay seconds from now.
+        The URL must still be passed to :meth:`done`.
+        """
+        now = self.clock()
+        record = self._hosts[host]
+        not_before = now + delay
+        if record.not_before is None or not_before > record.not_before:
+            record.not_before = not_before
+        self.frontier.requeue(url, depth)
+
+    def done(self, host):
+        """Record that a URL from host has been fetched."""
+        now = self.clock()
+        self._add_new_hosts(now)
+        host = self._hosts[host]
+        host.active -= 1
+        self._active -= 1
+        self._check_robots(host)
+        self._schedule(host, now)
+
+    def _add_new_hosts(self, now):
+        for name in self.frontier.pop_new_hosts():
+            host = self._hosts.get(name)
+            if host is None:
+                host = self._hosts[name] = _Host(
+                    name, TokenBucket(self.delay, self.burst, now))
+            self._schedule(host, now)
+
+    def _drop(self, host):
+        # give up on a host's queued URLs
+        dropped = 0
+        while self.frontier.pending(host.name):
+            self.frontier.pop(host.name)
+            dropped += 1
+        if dropped:
+            log.warning("dropped %d URLs queued for %s", dropped, host.name)
+        self.dropped += dropped
+
+    def _ready_at(self, host, now):
+        ready_at = host.bucket.ready_at(now)
+        if host.not_before is not None:
+            if host.not_before > now:
+                ready_at = max(ready_at, host.not_before)
+            else:
+                host.not_before = None
+        if self.breakers is not None:
+            open_until = self.breakers.open_until(host.name)
+            if open_until is not None and open_until > ready_at:
+                ready_at = open_until
+        return ready_at
+
+    def _has_capacity(self, host):
+        limit = self.per_host_limit
+        if ((self.robots_cache is not None and not host.robots_known) or
+                (self.breakers is not None and
+                 self.breakers.is_tripped(host.name))):
+            limit = 1
+        return (self.frontier.pending(host.name) > 0 and
+                (limit is None or host.active < limit))
+
+    def _push(self, host, ready_at):
+        host.scheduled = True
+        heapq.heappush(self._heap, (ready_at, next(self._seq), host))
+
+    def _schedule(self, host, now):
+        # put host in the heap if it has work and capacity
+        if not host.scheduled and self._has_capacity(host):
+            self._push(host, self._ready_at(host, now))
+
+    def _check_robots(self, host):
+        if (host.robots_known or host.robots_url is None or
+                self.robots_cache is None):
+            return
+        parser = self.robots_cache.lookup(host.robots_url)
+        if parser is None:
+            return
+        host.robots_known = True
+        delay = get_crawl_delay(parser)
+        if delay is not None:
+            host.bucket.interval = max(self.delay,
+                                       min(delay, self.max_delay))
@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+
+"""Which URLs a crawl may follow links to, and which documents it keeps.
+
+A crawl starts from one or more seed URLs and, by default, stays on
+the hosts they are on.  A :class:`CrawlScope` can instead allow any
+of a set of hosts, or any host under given domain suffixes.
+
+A scope can also filter URLs before they are queued, by regular
+expression and by file extension, and documents by content type once
+their headers arrive, before any of the body is read.
+"""
+
+from __future__ import absolute_import
+
+import posixpath
+import re
+
+from pycrawl.urls import parse_url
+
+
+DEFAULT_CONTENT_TYPE = 'application/octet-stream'
+
+
+def parse_content_type(value):
+    """Split a Content-Type header into its media type and parameters.
+
+    :param value: e.g. ``'text/html; charset="UTF-8"'``, or None
+    :return: ``(media_type, params)``: the media type in lower case
+        (``''`` if value is empty) and a dict of parameters, with
+        lower-case names and quotes removed from values
+    """
+    if not value:
+        return ('', {})
+    parts = _split_params(value)
+    media_type = parts[0].strip().lower()
+    params = {}
+    for part in parts[1:]:
+        name, sep, param = part.partition('=')
+        name = name.strip().lower()
+        if not sep or not name:
+            continue
+        param = param.strip()
+        if len(param) >= 2 and param[0] == param[-1] == '"':
+            param = re.sub(r'\\(.)', r'\1', param[1:-1])
+        params[name] = param
+    return (media_type, params)
+
+
+def _split_params(value):
+    # split on semicolons outside quoted strings
+    parts = []
+    start = 0
+    quoted = escaped = False
+    for i, char in enumerate(value):
+        if escaped:
+            escaped = False
+        elif char == '\\' and quoted:
+            escaped = True
+        elif char == '"':
+            quoted = not quoted
+        elif char == ';' and not quoted:
+            parts.append(value[start:i])
+            start = i + 1
+    parts.append(value[start:])
+    return parts
+
+
+class CrawlScope(object):
+    """The hosts a crawl is allowed to visit.
+
+    :param hosts: allowed hosts: a ``host:port`` network location
+        allows only that port, a bare host name allows any port
+    :param suffixes: domain suffixes whose hosts are allowed; the
+        suffix ``example.com`` allows ``example.com`` and any host
+        ending in ``.example.com``
+    :param include: regular expressions; if any are given, only URLs
+        matching one of them are allowed
+    :param exclude: regular expressions matching URLs not to allow
+    :param deny_extensions: file extensions (with or without a leading
+        dot, in any case) of URLs not to allow
+    :param content_types: media types of documents to download, such
+        as ``text/html``, ``image/*`` or ``*/*`` (default: any); a
+        document without a Content-Type is taken to be
+        ``application/octet-stream``
+    """
+
+    def __init__(self, hosts=(), suffixes=(), include=(), exclude=(),
+                 deny_extensions=(), content_types=None):
+        self.hosts = set(host.lower() for host in hosts)
+        self.suffixes = tuple(suffix.lower().strip('.')
+                              for suffix in suffixes)
+        self._dotted = tuple('.' + suffix for suffix in self.suffixes)
+        self.include = [re.compile(pattern) for pattern in include]
+        self.exclude = [re.compile(pattern) for pattern in exclude]
+        self.deny_extensions = frozenset(
+            '.' + ext.lower().lstrip('.') for ext in deny_extensions)
+        self.content_types = None
+        if content_types is not None:
+            self.content_types = frozenset(
+                content_type.strip().lower()
+                for content_type in content_types)
+
+    @classmethod
+    def from_seeds(cls, seed_urls, hosts=(), suffixes=(), **kwargs):
+        """Allow the seeds' hosts, as well as any others given.
+
+        Other keyword arguments are passed to the constructor.
+        """
+        seed_hosts = [parse_url(url).netloc for url in seed_urls]
+        return cls(list(hosts) + seed_hosts, suffixes, **kwargs)
+
+    def allows_host(self, netloc):
+        """Is a network location (``host`` or ``host:port``) in scope?"""
+        netloc = netloc.lower()
+        if netloc in self.hosts:
+            return True
+        hostname = netloc
+        if ':' in netloc and not netloc.endswith(']'):
+            hostname = netloc.rsplit(':', 1)[0]
+        if hostname in self.hosts:
+            return True
+        return hostname in self.suffixes or hostname.endswith(self._dotted)
+
+    def allows(self, url):
+        """Is a (canonical, absolute) URL in scope?"""
+        parsed = parse_url(url)
+        if not self.allows_host(parsed.netloc):
+            return False
+        if self.deny_extensions:
+            ext = posixpath.splitext(parsed.path)[1].lower()
+            if ext in self.deny_extensions:
+                return False
+        if self.include and not any(pattern.search(url)
+                                    for pattern in self.include):
+            return False
+        return not any(pattern.search(url) for pattern in self.exclude)
+
+    @property
+    def filters_types(self):
+        """Are documents filtered by content type?"""
+        return self.content_types is not None
+
+    def allows_type(self, content_type):
+        """Should a document with this Content-Type header be downloaded?
+
+        :param content_type: the header value, or None if absent
+        """
+        if self.content_types is None:
+            return True
+        media_type = (parse_content_type(content_type)[0] or
+                      DEFAULT_CONTENT_TYPE)
+        major = media_type.split('/', 1)[0]
+        return (media_type in self.content_types or
+                major + '/*' in self.content_types or
+                '*/*' in self.content_types)
+
+
+def read_seed_file(path):
+    """Read seed URLs from a file, one per line.
+
+    Blank lines and lines starting with ``#`` are skipped.
+
+    :return: a list of URL strings
+    """
+    seeds = []
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith('#'):
+                seeds.append(line)
+    return seeds
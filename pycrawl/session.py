@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+
+"""Shared HTTP session for all of a crawl's network I/O.
+
+A single :class:`CrawlSession` keeps a pool of keep-alive connections
+per host, so successive fetches from the same site reuse an open TCP
+connection instead of setting up a new one each time.
+"""
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+DEFAULT_POOL_SIZE = 10
+DEFAULT_MAX_HOSTS = 100
+DEFAULT_TIMEOUT = (10, 30)  # (connect, read) in seconds
+
+
+class CrawlSession(requests.Session):
+    """A requests Session with connection pooling and default timeouts.
+
+    :param pool_size: maximum idle connections kept open per host;
+        should be at least the number of concurrent requests to a host
+    :param max_hosts: number of per-host pools to keep
+    :param timeout: default timeout for requests that don't specify
+        one, as for ``requests.get``: a number of seconds, or a
+        ``(connect, read)`` tuple
+    """
+
+    def __init__(self, pool_size=None, max_hosts=None,
+                 timeout=DEFAULT_TIMEOUT):
+        super(CrawlSession, self).__init__()
+        self.pool_size = pool_size or DEFAULT_POOL_SIZE
+        self.timeout = timeout
+        adapter = HTTPAdapter(pool_connections=max_hosts or DEFAULT_MAX_HOSTS,
+                              pool_maxsize=self.pool_size)
+        self.mount('http://', adapter)
+        self.mount('https://', adapter)
+
+    def request(self, method, url, **kwargs):
+        if kwargs.get('timeout') is None:
+            kwargs['timeout'] = self.timeout
+        return super(CrawlSession, self).request(method, url, **kwargs)
+
+
+_default_session = None
+
+
+def get_default_session():
+    """Return a process-wide CrawlSession, creating it on first use."""
+    global _default_session
+    if _default_session is None:
+        _default_session = CrawlSession()
+    return _default_session
@@ -0,0 +1,334 @@
+# -*- coding: utf-8 -*-
+
+"""Sitemap discovery and parsing.
+
+A site's sitemaps are those listed on ``Sitemap:`` lines in its
+robots.txt, or ``/sitemap.xml`` if it lists none.  Sitemaps are parsed
+as they download, a chunk at a time, so a 50,000 URL sitemap needs no
+more memory than one entry; gzipped sitemaps are recognised by their
+first bytes and inflated on the way.  Sitemap indexes are followed to
+the sitemaps they list.
+
+The parser only deals in bytes, so each crawl engine fetches sitemaps
+its own way: :func:`read_sitemaps` with a requests-style session, and
+:mod:`pycrawl.aio` with aiohttp.
+"""
+
+import calendar
+from collections import deque
+import logging
+import re
+import zlib
+from xml.etree.ElementTree import ParseError, TreeBuilder, XMLParser
+try:  # Python 3
+    from urllib.parse import urlparse
+except ImportError:  # Python 2
+    from urlparse import urlparse
+
+from requests.exceptions import RequestException
+
+
+log = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+# the sitemap protocol's limit on the uncompressed size of one sitemap
+MAX_SITEMAP_SIZE = 50 * 1024 * 1024
+# most sitemap files read for one site, counting those in indexes
+DEFAULT_MAX_SITEMAPS = 1000
+
+GZIP_MAGIC = b'\x1f\x8b'
+
+_W3C_DATETIME = re.compile(
+    r'(\d{4})(?:-(\d\d)(?:-(\d\d)'
+    r'(?:T(\d\d):(\d\d)(?::(\d\d)(?:\.\d+)?)?'
+    r'(Z|([+-])(\d\d):?(\d\d))?)?)?)?$')
+
+
+class SitemapError(Exception):
+    """A sitemap couldn't be parsed, or was too large."""
+
+
+def parse_lastmod(text):
+    """Parse a sitemap ``<lastmod>`` (a W3C datetime) into a timestamp.
+
+    Dates and times without a time zone are taken to be in UTC.
+
+    :param text: e.g. ``2024-05-01`` or ``2024-05-01T12:30:00+02:00``
+    :return: seconds since the epoch, or None if text isn't a datetime
+    """
+    if text is None:
+        return None
+    match = _W3C_DATETIME.match(text.strip())
+    if match is None:
+        return None
+    (year, month, day, hour, minute, second,
+     zone, sign, zone_hours, zone_minutes) = match.groups()
+    try:
+        timestamp = calendar.timegm((int(year), int(month or 1),
+                                     int(day or 1), int(hour or 0),
+                                     int(minute or 0), int(second or 0),
+                                     0, 0, 0))
+    except ValueError:
+        return None
+    if sign is not None:
+        offset = int(zone_hours) * 3600 + int(zone_minutes) * 60
+        timestamp -= offset if sign == '+' else -offset
+    return float(timestamp)
+
+
+def get_sitemap_urls(root_url, robots_parser=None):
+    """Return the URLs of a site's sitemaps.
+
+    :param root_url: any URL on the site
+    :param robots_parser: a parser for the site's robots.txt, from
+        :func:`pycrawl.robots.parse_robots_txt`, or None
+    :return: the sitemaps listed in robots.txt, or else the site's
+        ``/sitemap.xml`` if robots.txt allows fetching it
+    """
+    site_maps = getattr(robots_parser, 'site_maps', None)
+    listed = site_maps() if site_maps is not None else None
+    if listed:
+        return list(listed)
+    default = urlparse(root_url)._replace(path='/sitemap.xml', params='',
+                                          query='', fragment='').geturl()
+    if (robots_parser is not None and
+            not robots_parser.can_fetch('*', default)):
+        return []
+    return [default]
+
+
+def _local_name(tag):
+    return tag.rsplit('}', 1)[-1]
+
+
+class _EventBuilder(TreeBuilder):
+    # records start and end events, like Python 3's XMLPullParser
+
+    def __init__(self):
+        TreeBuilder.__init__(self)
+        self.events = []
+
+    def start(self, tag, attrs):
+        elem = TreeBuilder.start(self, tag, attrs)
+        self.events.append(('start', elem))
+        return elem
+
+    def end(self, tag):
+        elem = TreeBuilder.end(self, tag)
+        self.events.append(('end', elem))
+        return elem
+
+
+class SitemapParser(object):
+    """Incremental parser for one sitemap or sitemap index.
+
+    Feed it the sitemap's bytes as they arrive; each call returns the
+    entries completed so far, as ``(kind, loc, lastmod)`` tuples, where
+    kind is ``'url'`` for a page or ``'sitemap'`` for a sitemap listed
+    in an index, and lastmod is a timestamp or None.
+
+    :param max_size: raise SitemapError after this many uncompressed
+        bytes
+    """
+
+    def __init__(self, max_size=MAX_SITEMAP_SIZE):
+        self.max_size = max_size
+        self.size = 0
+        self._builder = _EventBuilder()
+        self._parser = XMLParser(target=self._builder)
+        self._root = None
+        self._head = b''  # first bytes, until gzip can be ruled out
+        self._inflater = None
+        self._loc = None
+        self._lastmod = None
+
+    def feed(self, data):
+        """Parse the next bytes of the sitemap.
+
+        :return: a list of the entries they complete
+        :raise: SitemapError
+        """
+        if self._head is not None:
+            data = self._head + data
+            if len(data) < len(GZIP_MAGIC):
+                self._head = data
+                return []
+            self._head = None
+            if data.startswith(GZIP_MAGIC):
+                self._inflater = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        if self._inflater is None:
+            return self._parse(data)
+        entries = []
+        try:
+            while data:
+                # inflate a chunk at a time, so the size limit applies
+                # before a compressed bomb is expanded
+                entries.extend(self._parse(
+                    self._inflater.decompress(data, CHUNK_SIZE)))
+                data = self._inflater.unconsumed_tail
+        except zlib.error as e:
+            raise SitemapError("bad gzip data: {}".format(e))
+        return entries
+
+    def close(self):
+        """Finish parsing, returning any remaining entries.
+
+        :raise: SitemapError if the sitemap was incomplete
+        """
+        entries = []
+        if self._head:
+            entries.extend(self._parse(self._head))
+        elif self._inflater is not None:
+            try:
+                entries.extend(self._parse(self._inflater.flush()))
+            except zlib.error as e:
+                raise SitemapError("bad gzip data: {}".format(e))
+        try:
+            self._parser.close()
+        except ParseError as e:
+            raise SitemapError("bad XML: {}".format(e))
+        entries.extend(self._read_events())
+        return entries
+
+    def _parse(self, data):
+        if not data:
+            return []
+        self.size += len(data)
+        if self.size > self.max_size:
+            raise SitemapError("sitemap exceeds {} bytes".format(
+                self.max_size))
+        try:
+            self._parser.feed(data)
+        except ParseError as e:
+            raise SitemapError("bad XML: {}".format(e))
+        return self._read_events()
+
+    def _read_events(self):
+        entries = []
+        events = self._builder.events
+        self._builder.events = []
+        for event, elem in events:
+            name = _local_name(elem.tag)
+            if event == 'start':
+                if self._root is None:
+                    if name not in ('urlset', 'sitemapindex'):
+                        raise SitemapError(
+                            "<{}> is not a sitemap".format(name))
+                    self._root = elem
+            elif name == 'loc':
+                self._loc = (elem.text or '').strip()
+            elif name == 'lastmod':
+                self._lastmod = parse_lastmod(elem.text)
+            elif name in ('url', 'sitemap'):
+                if self._loc:
+                    entries.append((name, self._loc, self._lastmod))
+                self._loc = self._lastmod = None
+                # drop finished entries, so memory use stays flat
+                del self._root[:]
+        return entries
+
+
+class SitemapWalk(object):
+    """The sitemaps of a site still to be read, following indexes.
+
+    Iterate over it for the URL of each sitemap to fetch, and pass the
+    entries parsed from each through :meth:`pages`, which queues any
+    sitemaps they list.  Each sitemap is read at most once.
+
+    :param sitemap_urls: the site's sitemaps, from
+        :func:`get_sitemap_urls`
+    :param max_sitemaps: stop after this many sitemaps
+    """
+
+    def __init__(self, sitemap_urls, max_sitemaps=DEFAULT_MAX_SITEMAPS):
+        self.max_sitemaps = max_sitemaps
+        self.read = 0
+        self._pending = deque()
+        self._seen = set()
+        for url in sitemap_urls:
+            self._queue(url)
+
+    def __iter__(self):
+        while self._pending:
+            if self.read >= self.max_sitemaps:
+                log.warning("read %d sitemaps; skipping %d more",
+                            self.read, len(self._pending))
+                return
+            self.read += 1
+            yield self._pending.popleft()
+
+    def _queue(self, url):
+        if url not in self._seen:
+            self._seen.add(url)
+            self._pending.append(url)
+
+    def pages(self, entries):
+        """Return ``(url, lastmod)`` for each page among entries."""
+        pages = []
+        for kind, loc, lastmod in entries:
+            if kind == 'sitemap':
+                self._queue(loc)
+            else:
+                pages.append((loc, lastmod))
+        return pages
+
+
+def fetch_sitemap(sitemap_url, session):
+    """Download a sitemap, a chunk at a time.
+
+    :param sitemap_url: URL of the sitemap
+    :param session: requests-style session to fetch with
+    :return: an iterator over the sitemap's bytes, or None if it
+        couldn't be fetched
+    """
+    try:
+        response = session.get(sitemap_url, stream=True)
+    except RequestException:
+        return None
+    if response.status_code != 200:
+        response.close()
+        return None
+
+    def chunks():
+        try:
+            for chunk in response.iter_content(CHUNK_SIZE):
+                yield chunk
+        finally:
+            response.close()
+    return chunks()
+
+
+def read_sitemaps(sitemap_urls, session, max_sitemaps=DEFAULT_MAX_SITEMAPS,
+                  max_size=MAX_SITEMAP_SIZE):
+    """Yield the pages in a site's sitemaps, following sitemap indexes.
+
+    A sitemap that can't be fetched is skipped, as is the rest of one
+    that turns out to be malformed or too large.
+
+    :param sitemap_urls: the site's sitemaps, from
+        :func:`get_sitemap_urls`
+    :param session: requests-style session to fetch with
+    :param max_sitemaps: read at most this many sitemaps
+    :param max_size: largest uncompressed size of one sitemap
+    :return: an iterator of ``(url, lastmod)`` pairs, where lastmod is
+        a timestamp or None
+    """
+    walk = SitemapWalk(sitemap_urls, max_sitemaps)
+    for sitemap_url in walk:
+        chunks = fetch_sitemap(sitemap_url, session)
+        if chunks is None:
+            continue
+        log.debug("reading sitemap %s", sitemap_url)
+        parser = SitemapParser(max_size)
+        try:
+            for chunk in chunks:
+                for page in walk.pages(parser.feed(chunk)):
+                    yield page
+            for page in walk.pages(parser.close()):
+                yield page
+        except SitemapError as e:
+            log.warning("skipping rest of sitemap %s: %s", sitemap_url, e)
+        except RequestException:
+            log.warning("lost connection reading sitemap %s", sitemap_url)
+        finally:
+            chunks.close()
@@ -0,0 +1,523 @@
+# -*- coding: utf-8 -*-
+
+"""Where downloaded documents are written.
+
+A store hands out writers: call ``write`` with each chunk of a
+document, then ``commit`` to make it visible (or ``abort`` to discard
+it).  Writers are context managers that commit on success and abort on
+error, so a document is either saved complete or not at all.
+
+Stores have the same few methods, so the crawler doesn't care which
+one it's given:
+
+``open(filename, url=None, content_type=None)``
+    return a writer for a document
+``exists(filename, url=None)``
+    is a copy of this document already saved?
+``close()``
+    finish writing
+
+A store's ``rewrites_links`` attribute says whether HTML should have
+its local links rewritten before being saved.  That only makes sense
+for a mirror tree; archives keep documents as they were served.
+"""
+
+from __future__ import absolute_import
+
+import base64
+import errno
+import hashlib
+import json
+import mmap
+import os
+import threading
+import time
+import uuid
+
+from pycrawl.fileio import (atomic_open, commit_temp_file, discard_temp_file,
+                            ensure_parent_dir, make_temp_file)
+
+
+DEFAULT_SPOOL_SIZE = 1024 * 1024
+DEFAULT_BUFFER_SIZE = 1024 * 1024
+DEFAULT_BATCH_SIZE = 100
+
+
+class _Writer(object):
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.abort()
+
+
+class _FileWriter(_Writer):
+    """Writes to a temporary file, renamed into place on commit."""
+
+    def __init__(self, filename):
+        self.filename = filename
+        self._tmp_path, self._file = make_temp_file(filename)
+
+    def write(self, chunk):
+        self._file.write(chunk)
+
+    def commit(self):
+        self._file.close()
+        commit_temp_file(self._tmp_path, self.filename)
+
+    def abort(self):
+        self._file.close()
+        discard_temp_file(self._tmp_path)
+
+
+class _SpooledWriter(_Writer):
+    """Collects a document, then hands it to its store on commit.
+
+    Documents up to the store's spool size are kept in memory; larger
+    ones go to a temporary file next to ``spool_path``.  If ``hash`` is
+    given, it is updated with the document as it's written.
+    """
+
+    def __init__(self, store, spool_path, filename, url=None,
+                 content_type=None, hash=None):
+        self.store = store
+        self.spool_path = spool_path
+        self.filename = filename
+        self.url = url
+        self.content_type = content_type
+        self.hash = hash
+        self.size = 0
+        self._buf = []
+        self._tmp = None
+        self._tmp_path = None
+
+    def write(self, chunk):
+        if self.hash is not None:
+            self.hash.update(chunk)
+        self.size += len(chunk)
+        if self._tmp is not None:
+            self._tmp.write(chunk)
+            return
+        self._buf.append(chunk)
+        if self.size > self.store.spool_size:
+            self._tmp_path, self._tmp = make_temp_file(self.spool_path)
+            for buffered in self._buf:
+                self._tmp.write(buffered)
+            self._buf = []
+
+    def chunks(self):
+        """Iterate over the document written so far."""
+        if self._tmp_path is None:
+            for chunk in self._buf:
+                yield chunk
+            return
+        with open(self._tmp_path, 'rb') as f:
+            while True:
+                chunk = f.read(DEFAULT_BUFFER_SIZE)
+                if not chunk:
+                    break
+                yield chunk
+
+    def commit(self):
+        if self._tmp is not None:
+            self._tmp.close()
+        try:
+            self.store._commit(self)
+        finally:
+            if self._tmp_path is not None:
+                discard_temp_file(self._tmp_path)
+
+    def abort(self):
+        if self._tmp is not None:
+            self._tmp.close()
+            discard_temp_file(self._tmp_path)
+
+
+class _NullWriter(_Writer):
+
+    def write(self, chunk):
+        pass
+
+    def commit(self):
+        pass
+
+    def abort(self):
+        pass
+
+
+class MirrorStore(object):
+    """Write each document to its own file in the mirror tree."""
+
+    rewrites_links = True
+
+    def open(self, filename, url=None, content_type=None):
+        """Return a writer for the document to be saved as filename."""
+        return _FileWriter(filename)
+
+    def exists(self, filename, url=None):
+        return os.path.isfile(filename)
+
+    def close(self):
+        pass
+
+
+class NullStore(object):
+    """Save nothing, for crawls whose results are used as they arrive.
+
+    See :class:`~pycrawl.crawler.Crawler`.
+    """
+
+    rewrites_links = False
+
+    def open(self, filename, url=None, content_type=None):
+        return _NullWriter()
+
+    def exists(self, filename, url=None):
+        return False
+
+    def close(self):
+        pass
+
+
+class ContentStore(MirrorStore):
+    """Store each distinct body once, and link mirror paths to it.
+
+    Bodies are kept under ``root/blobs``, named by their SHA-256
+    digest.  Each file in the mirror tree is a hard link (or, if
+    ``symlinks`` is set, a relative symbolic link) to its blob.  An
+    index of stored digests, ``root/index``, lets later crawls skip
+    bodies they already have.
+
+    Safe to use from several threads at once.
+
+    :param root: directory for blobs and the index
+    :param symlinks: link mirror files with symlinks, not hard links
+    :param spool_size: bodies up to this size are hashed in memory
+        before anything is written
+    """
+
+    def __init__(self, root, symlinks=False, spool_size=DEFAULT_SPOOL_SIZE):
+        self.root = root
+        self.symlinks = symlinks
+        self.spool_size = spool_size
+        self._lock = threading.Lock()
+        self._digests = set()
+        self._index_path = os.path.join(root, 'index')
+        ensure_parent_dir(os.path.join(root, 'blobs', 'x'))
+        if os.path.exists(self._index_path):
+            with open(self._index_path) as f:
+                self._digests.update(line.split()[0] for line in f
+                                     if line.strip())
+        self._index = open(self._index_path, 'a')
+
+    def __len__(self):
+        return len(self._digests)
+
+    def open(self, filename, url=None, content_type=None):
+        """Return a writer for the document to be saved as filename."""
+        return _SpooledWriter(self, os.path.join(self.root, 'blobs', 'blob'),
+                              filename, hash=hashlib.sha256())
+
+    def blob_path(self, digest):
+        return os.path.join(self.root, 'blobs', digest[:2], digest)
+
+    def _commit(self, writer):
+        digest = writer.hash.hexdigest()
+        blob = self.blob_path(digest)
+        with self._lock:
+            if digest not in self._digests or not os.path.exists(blob):
+                if writer._tmp_path is not None:
+                    ensure_parent_dir(blob)
+                    commit_temp_file(writer._tmp_path, blob)
+                    writer._tmp_path = None
+                else:
+                    with atomic_open(blob, 'wb') as f:
+                        for chunk in writer.chunks():
+                            f.write(chunk)
+                if digest not in self._digests:
+                    self._digests.add(digest)
+                    self._index.write('{} {}\n'.format(digest, writer.size))
+                    self._index.flush()
+        self._link(blob, writer.filename)
+
+    def _link(self, blob, filename):
+        """Atomically make filename a link to blob."""
+        ensure_parent_dir(filename)
+        dirname, basename = os.path.split(filename)
+        tmp_link = os.path.join(dirname, '.{}.{}.link'.format(
+            basename, threading.current_thread().ident))
+        try:
+            os.remove(tmp_link)
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                raise
+        if self.symlinks:
+            os.symlink(os.path.relpath(blob, dirname or '.'), tmp_link)
+        else:
+            os.link(blob, tmp_link)
+        os.rename(tmp_link, filename)
+
+    def close(self):
+        self._index.close()
+
+
+class _ArchiveStore(object):
+    """Base for stores that append every document to one file.
+
+    Records are appended through a large write buffer, and the buffer
+    is flushed every ``batch_size`` records rather than after each one.
+    Safe to use from several threads at once.
+    """
+
+    rewrites_links = False
+
+    def __init__(self, path, spool_size=DEFAULT_SPOOL_SIZE,
+                 batch_size=DEFAULT_BATCH_SIZE):
+        self.path = path
+        self.spool_size = spool_size
+        self.batch_size = batch_size
+        self._lock = threading.RLock()
+        self._unflushed = 0
+        ensure_parent_dir(path)
+        self._file = open(path, 'ab', DEFAULT_BUFFER_SIZE)
+        self._offset = self._file.tell()
+
+    def open(self, filename, url=None, content_type=None):
+        """Return a writer for a document fetched from url."""
+        return _SpooledWriter(self, self.path, filename, url=url,
+                              content_type=content_type, hash=self._hash())
+
+    def _hash(self):
+        return None
+
+    def _commit(self, writer):
+        with self._lock:
+            self._append(writer)
+            self._unflushed += 1
+            if self._unflushed >= self.batch_size:
+                self.flush()
+
+    def _write(self, data):
+        self._file.write(data)
+        self._offset += len(data)
+
+    def flush(self):
+        with self._lock:
+            self._file.flush()
+            self._unflushed = 0
+
+    def close(self):
+        self.flush()
+        self._file.close()
+
+
+def _warc_date(timestamp=None):
+    return time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(timestamp))
+
+
+def read_warc_headers(path):
+    """Read the header block of each record in a WARC file.
+
+    :return: iterator over ``(offset, headers)``, where headers is a
+        dict with lower-cased names
+    """
+    with open(path, 'rb') as f:
+        while True:
+            offset = f.tell()
+            version = f.readline()
+            if not version:
+                return
+            if not version.startswith(b'WARC/'):
+                raise ValueError("no WARC record at offset {} of {}".format(
+                    offset, path))
+            headers = {}
+            for line in iter(f.readline, b'\r\n'):
+                if not line:
+                    return  # truncated record
+                name, _, value = line.decode('utf-8').partition(':')
+                headers[name.strip().lower()] = value.strip()
+            yield offset, headers
+            f.seek(int(headers['content-length']) + 4, os.SEEK_CUR)
+
+
+class WarcStore(_ArchiveStore):
+    """Append every document to a WARC file as a ``resource`` record.
+
+    A ``warcinfo`` record is written when the file is created.  If it
+    already exists, new records are appended to it.
+
+    :param path: the WARC file
+    :param spool_size: documents up to this size are collected in
+        memory before being appended
+    :param batch_size: flush the file after this many records
+    """
+
+    def __init__(self, path, spool_size=DEFAULT_SPOOL_SIZE,
+                 batch_size=DEFAULT_BATCH_SIZE):
+        self._urls = set()
+        if os.path.exists(path):
+            self._urls.update(headers.get('warc-target-uri')
+                              for _, headers in read_warc_headers(path))
+        super(WarcStore, self).__init__(path, spool_size, batch_size)
+        if self._offset == 0:
+            info = b'software: pycrawl\r\nformat: WARC File Format 1.1\r\n'
+            self._write_record([('WARC-Type', 'warcinfo'),
+                                ('Content-Type', 'application/warc-fields')],
+                               len(info), [info])
+
+    def exists(self, filename, url=None):
+        return url in self._urls
+
+    def _hash(self):
+        return hashlib.sha1()
+
+    def _append(self, writer):
+        digest = base64.b32encode(writer.hash.digest()).decode('ascii')
+        self._write_record([
+            ('WARC-Type', 'resource'),
+            ('WARC-Target-URI', writer.url),
+            ('Content-Type', writer.content_type or
+             'application/octet-stream'),
+            ('WARC-Block-Digest', 'sha1:' + digest),
+        ], writer.size, writer.chunks())
+        self._urls.add(writer.url)
+
+    def _write_record(self, fields, length, chunks):
+        lines = ['WARC/1.1',
+                 'WARC-Record-ID: <urn:uuid:{}>'.format(uuid.uuid4()),
+                 'WARC-Date: {}'.format(_warc_date())]
+        lines.extend('{}: {}'.format(name, value) for name, value in fields)
+        lines.append('Content-Length: {}'.format(length))
+        self._write(('\r\n'.join(lines) + '\r\n\r\n').encode('utf-8'))
+        for chunk in chunks:
+            self._write(chunk)
+        self._write(b'\r\n\r\n')
+
+
+class PackStore(_ArchiveStore):
+    """Append every document to one packed file, with an offset index.
+
+    Bodies are concatenated in ``path``; ``path + '.idx'`` holds one
+    JSON line per document giving its URL, offset and length.  Index
+    lines are only written once the bodies they point to have been
+    flushed, so a crash never leaves the index pointing past the data.
+    Read documents back with :class:`PackReader`.
+
+    :param path: the pack file
+    :param spool_size: documents up to this size are collected in
+        memory before being appended
+    :param batch_size: flush the file after this many records
+    """
+
+    def __init__(self, path, spool_size=DEFAULT_SPOOL_SIZE,
+                 batch_size=DEFAULT_BATCH_SIZE):
+        self._index_path = path + '.idx'
+        self._urls = set(url for url, _ in _read_pack_index(
+            self._index_path))
+        self._pending = []
+        super(PackStore, self).__init__(path, spool_size, batch_size)
+        self._index = open(self._index_path, 'a')
+
+    def exists(self, filename, url=None):
+        return url in self._urls
+
+    def _append(self, writer):
+        offset = self._offset
+        for chunk in writer.chunks():
+            self._write(chunk)
+        self._pending.append(json.dumps({
+            'url': writer.url, 'offset': offset, 'length': writer.size,
+            'content_type': writer.content_type}) + '\n')
+        self._urls.add(writer.url)
+
+    def flush(self):
+        with self._lock:
+            self._file.flush()
+            self._index.writelines(self._pending)
+            self._index.flush()
+            self._pending = []
+            self._unflushed = 0
+
+    def close(self):
+        super(PackStore, self).close()
+        self._index.close()
+
+
+def _read_pack_index(index_path):
+    if not os.path.exists(index_path):
+        return
+    with open(index_path) as f:
+        for line in f:
+            if line.strip():
+                entry = json.loads(line)
+                yield entry['url'], entry
+
+
+class PackReader(object):
+    """Read documents back from a :class:`PackStore` file.
+
+    The pack is memory-mapped, so looking up a document reads only
+    that document, however large the pack.  If a URL was stored more
+    than once, the latest copy is returned.
+
+    :param path: the pack file
+    """
+
+    def __init__(self, path):
+        self._entries = dict(_read_pack_index(path + '.idx'))
+        self._file = open(path, 'rb')
+        self._mmap = None
+        if os.fstat(self._file.fileno()).st_size:
+            self._mmap = mmap.mmap(self._file.fileno(), 0,
+                                   access=mmap.ACCESS_READ)
+
+    def __contains__(self, url):
+        return url in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def urls(self):
+        return list(self._entries)
+
+    def content_type(self, url):
+        return self._entries[url]['content_type']
+
+    def get(self, url):
+        """Return the body stored for url, as bytes.
+
+        :raise KeyError: if url isn't in the pack
+        """
+        entry = self._entries[url]
+        if not entry['length']:
+            return b''
+        offset = entry['offset']
+        return self._mmap[offset:offset + entry['length']]
+
+    def close(self):
+        if self._mmap is not None:
+            self._mmap.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def write_chunks(store, filename, chunks, url=None, content_type=None):
+    """Save an iterable of byte strings as filename in store.
+
+    :return: the number of bytes written
+    """
+    size = 0
+    with store.open(filename, url=url, content_type=content_type) as writer:
+        for chunk in chunks:
+            writer.write(chunk)
+            size += len(chunk)
+    return size
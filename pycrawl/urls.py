@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+
+"""Parsing and canonicalizing URLs, once each.
+
+A link found on a page is looked at by several parts of the crawler:
+canonicalized, checked against the crawl scope, filed under its host
+in the frontier, and turned into a robots.txt URL and a filename when
+it's fetched.  Rather than each of them parsing it again, they share
+:func:`parse_url`, which keeps recent results in a bounded LRU cache.
+Links that appear on every page of a site (navigation, footers) are
+then parsed once per crawl rather than once per page.
+
+Canonical URLs and host names are interned, so the many references to
+them from the frontier, scheduler and caches share one string each.
+"""
+
+try:  # Python 3
+    from functools import lru_cache
+    from sys import intern
+    from urllib.parse import urlparse
+except ImportError:  # Python 2
+    lru_cache = None
+    from urlparse import urlparse
+
+
+# URLs kept parsed in the cache
+DEFAULT_CACHE_SIZE = 64 * 1024
+
+
+class ParsedURL(object):
+    """The parts of a canonical URL that the crawler uses.
+
+    :ivar url: the canonical URL, as a string
+    :ivar scheme: e.g. ``'http'``
+    :ivar netloc: network location, e.g. ``'example.com:8000'``
+    :ivar hostname: lower-case host name without the port, or None
+    :ivar path: the path, e.g. ``'/index.html'``
+    """
+
+    __slots__ = ('url', 'scheme', 'netloc', 'hostname', 'path')
+
+    def __init__(self, url, scheme, netloc, hostname, path):
+        self.url = url
+        self.scheme = scheme
+        self.netloc = netloc
+        self.hostname = hostname
+        self.path = path
+
+    def __repr__(self):
+        return 'ParsedURL({!r})'.format(self.url)
+
+    @property
+    def robots_url(self):
+        """URL of the robots.txt governing this URL."""
+        return '{}://{}/robots.txt'.format(self.scheme, self.netloc)
+
+
+def _intern(string):
+    try:
+        return intern(string)
+    except TypeError:  # a unicode string, on Python 2
+        return string
+
+
+def _parse_url(url, root_netloc=None):
+    parsed = urlparse(url)._replace(params='', query='', fragment='')
+    if root_netloc is not None and parsed.hostname is None:
+        parsed = parsed._replace(scheme='http', netloc=root_netloc)
+    hostname = parsed.hostname
+    if hostname is not None:
+        hostname = _intern(hostname)
+    return ParsedURL(_intern(parsed.geturl()), parsed.scheme,
+                     _intern(parsed.netloc), hostname, parsed.path)
+
+
+def _memoize(maxsize):
+    # a stand-in for functools.lru_cache: forget everything when full
+    def decorator(func):
+        cache = {}
+
+        def wrapper(*args):
+            try:
+                return cache[args]
+            except KeyError:
+                pass
+            if len(cache) >= maxsize:
+                cache.clear()
+            result = cache[args] = func(*args)
+            return result
+        wrapper.cache_clear = cache.clear
+        return wrapper
+    return decorator
+
+
+if lru_cache is not None:
+    _cached_parse_url = lru_cache(maxsize=DEFAULT_CACHE_SIZE)(_parse_url)
+else:
+    _cached_parse_url = _memoize(DEFAULT_CACHE_SIZE)(_parse_url)
+
+
+def parse_url(url, root_netloc=None):
+    """Canonicalize and parse a URL, using the cache.
+
+    Parameters, query string and fragment are dropped (ie.
+    ``http://site.com/page;params?query#fragment`` becomes
+    ``http://site.com/page``).  Results are shared between callers, so
+    must not be changed.
+
+    :param url: URL string
+    :param root_netloc: network location to add if URL has none
+    :return: a :class:`ParsedURL`
+    """
+    return _cached_parse_url(url, root_netloc)
+
+
+def canonical_url(url, root_netloc=None):
+    """Return the canonical form of a URL; see :func:`parse_url`."""
+    return _cached_parse_url(url, root_netloc).url
+
+
+def clear_cache():
+    """Forget all parsed URLs."""
+    _cached_parse_url.cache_clear()
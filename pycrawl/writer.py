@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+
+"""A writer stage that saves the mirror tree from a background thread.
+
+Fetching threads hand finished documents to a bounded queue and carry
+on; a single writer thread takes them off in batches and writes them
+out, grouped by directory.  It remembers which directories it has
+already created, so it doesn't check for each file's directory every
+time, and it can ``fsync`` what it has written every so often rather
+than after every file.  Fetching only waits for the disk when the
+queue is full.
+"""
+
+from __future__ import absolute_import
+
+import os
+import threading
+import time
+try:  # Python 3
+    import queue
+except ImportError:  # Python 2
+    import Queue as queue
+
+from pycrawl.fileio import (commit_temp_file, discard_temp_file,
+                            ensure_parent_dir, make_temp_file)
+from pycrawl.storage import DEFAULT_SPOOL_SIZE, MirrorStore, _SpooledWriter
+
+
+DEFAULT_QUEUE_SIZE = 256
+DEFAULT_BATCH_SIZE = 64
+
+_STOP = object()
+
+
+def _fsync_path(path):
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return  # eg. directories can't be opened on Windows
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+class QueuedMirrorStore(MirrorStore):
+    """Write the mirror tree from a background writer thread.
+
+    Documents up to ``spool_size`` bytes are queued in memory; larger
+    ones are spooled to a temporary file beside their destination by
+    the fetching thread, and only the final rename is queued.  If the
+    writer thread fails, the error is raised from the next ``open``,
+    ``commit``, ``flush`` or ``close``.
+
+    :param queue_size: maximum documents waiting to be written; once
+        that many are queued, committing a document blocks
+    :param batch_size: maximum documents written per batch
+    :param fsync_interval: if set, ``fsync`` files written (and their
+        directories) once this many seconds have passed since the last
+        time, and when the store is closed
+    :param spool_size: larger documents are spooled to disk as they
+        are written rather than held in memory
+    """
+
+    def __init__(self, queue_size=DEFAULT_QUEUE_SIZE,
+                 batch_size=DEFAULT_BATCH_SIZE, fsync_interval=None,
+                 spool_size=DEFAULT_SPOOL_SIZE):
+        self.batch_size = batch_size
+        self.fsync_interval = fsync_interval
+        self.spool_size = spool_size
+        self._queue = queue.Queue(queue_size)
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._error = None
+        self._closed = False
+        # used only by the writer thread
+        self._dirs = set()
+        self._unsynced = []
+        self._last_sync = time.time()
+        self._thread = threading.Thread(target=self._run,
+                                        name='pycrawl-writer')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def open(self, filename, url=None, content_type=None):
+        """Return a writer for the document to be saved as filename."""
+        self._check()
+        return _SpooledWriter(self, filename, filename)
+
+    def queued(self):
+        """Return the number of documents waiting to be written."""
+        return self._queue.qsize()
+
+    def exists(self, filename, url=None):
+        with self._lock:
+            if filename in self._pending:
+                return True
+        return os.path.isfile(filename)
+
+    def _check(self):
+        if self._error is not None:
+            raise self._error
+
+    def _commit(self, writer):
+        self._check()
+        if writer._tmp_path is not None:
+            # already on disk; the writer thread only has to rename it
+            record = (writer.filename, None, writer._tmp_path)
+            writer._tmp_path = None
+        else:
+            record = (writer.filename, b''.join(writer._buf), None)
+        with self._lock:
+            self._pending[writer.filename] = (
+                self._pending.get(writer.filename, 0) + 1)
+        self._queue.put(record)
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.batch_size and batch[-1] is not _STOP:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = batch[-1] is _STOP
+            records = [record for record in batch if record is not _STOP]
+            # group by directory; the sort is stable, so later copies of
+            # a file are still written after earlier ones
+            records.sort(key=lambda record: os.path.dirname(record[0]))
+            for filename, data, tmp_path in records:
+                try:
+                    if self._error is None:
+                        self._write(filename, data, tmp_path)
+                    elif tmp_path is not None:
+                        discard_temp_file(tmp_path)
+                except Exception as e:
+                    self._error = e
+                finally:
+                    self._done(filename)
+            try:
+                if (self.fsync_interval is not None and self._error is None
+                        and time.time() - self._last_sync >=
+                        self.fsync_interval):
+                    self._sync()
+            except Exception as e:
+                self._error = e
+            for _ in batch:
+                self._queue.task_done()
+            if stop:
+                return
+
+    def _write(self, filename, data, tmp_path):
+        dirname = os.path.dirname(filename)
+        if dirname not in self._dirs:
+            ensure_parent_dir(filename)
+            self._dirs.add(dirname)
+        if tmp_path is None:
+            tmp_path, f = make_temp_file(filename, make_dirs=False)
+            try:
+                with f:
+                    f.write(data)
+            except BaseException:
+                discard_temp_file(tmp_path)
+                raise
+        commit_temp_file(tmp_path, filename)
+        if self.fsync_interval is not None:
+            self._unsynced.append(filename)
+
+    def _done(self, filename):
+        with self._lock:
+            count = self._pending.pop(filename) - 1
+            if count:
+                self._pending[filename] = count
+
+    def _sync(self):
+        dirs = set()
+        for filename in self._unsynced:
+            _fsync_path(filename)
+            dirs.add(os.path.dirname(filename) or '.')
+        for dirname in dirs:
+            _fsync_path(dirname)
+        self._unsynced = []
+        self._last_sync = time.time()
+
+    def flush(self):
+        """Wait until every queued document has been written."""
+        self._queue.join()
+        self._check()
+
+    def close(self):
+        """Write everything still queued, then stop the writer thread."""
+        if not self._closed:
+            self._closed = True
+            self._queue.put(_STOP)
+            self._thread.join()
+            if self.fsync_interval is not None and self._error is None:
+                self._sync()
+        self._check()
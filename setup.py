@@ -19,6 +19,10 @@ requirements = [
     'requests>=2.7.0,<3'
 ]
 
+extras_requirements = {
+    'async': ['aiohttp>=3.0'],
+}
+
 test_requirements = [
     # TODO: put package test requirements here
 ]
@@ -38,6 +42,7 @@ setup(
                  'pycrawl'},
     include_package_data=True,
     install_requires=requirements,
+    extras_require=extras_requirements,
     entry_points={
         'console_scripts': ['pycrawl = pycrawl.pycrawl:main']
     },
@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_crawler
+----------------------------------
+
+Tests for `pycrawl.crawler` module.
+"""
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+try:
+    import aiohttp
+except ImportError:  # optional dependency
+    aiohttp = None
+
+from tests.run_server import run_server, stop_server
+from pycrawl.crawler import CrawlConfig, Crawler
+from pycrawl.storage import MirrorStore
+
+
+class TestCrawlConfig(unittest.TestCase):
+
+    def test_options(self):
+        config = CrawlConfig(max_depth=2, workers=4)
+        self.assertEqual(config.max_depth, 2)
+        self.assertEqual(config.burst, 1)
+        self.assertEqual(repr(config), 'CrawlConfig(max_depth=2, workers=4)')
+        self.assertRaises(TypeError, CrawlConfig, max_dpeth=2)
+
+    def test_crawler_copies_config(self):
+        config = CrawlConfig(max_depth=2)
+        crawler = Crawler('localhost:8000', config, max_depth=3)
+        self.assertEqual(crawler.config.max_depth, 3)
+        self.assertEqual(config.max_depth, 2)
+        self.assertEqual(crawler.seeds, ['http://localhost:8000'])
+
+
+class TestCrawler(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = run_server()
+        time.sleep(0.5)  # give it time to start up
+
+    @classmethod
+    def tearDownClass(cls):
+        stop_server(cls.server)
+
+    def tearDown(self):
+        shutil.rmtree('localhost', ignore_errors=True)
+
+    def check_results(self, results):
+        by_url = dict((result.url, result) for result in results)
+        self.assertEqual(len(by_url), 8)
+        index = by_url['http://localhost:8000/index.html']
+        self.assertEqual(index.status, 200)
+        self.assertEqual(index.content_type, 'text/html')
+        self.assertIn('http://localhost:8000/local-relative.html',
+                      index.links)
+        with open('tests/example-site/index.html', 'rb') as f:
+            self.assertEqual(index.read(), f.read(),
+                             "bodies are as served")
+        self.assertEqual(
+            by_url['http://localhost:8000/depth3.html'].status, 404)
+        for result in results:
+            result.close()
+        self.assertFalse(os.path.exists('localhost'),
+                         "nothing saved without a store")
+
+    def test_iter_results(self):
+        for workers in [None, 4]:
+            crawler = Crawler('http://localhost:8000', workers=workers)
+            self.check_results(list(crawler.iter_results()))
+            self.assertEqual(crawler.stats.counter('documents'), 8)
+
+    def test_stop_early(self):
+        crawler = Crawler('http://localhost:8000', workers=2)
+        results = crawler.iter_results(queue_size=1)
+        next(results)
+        results.close()
+        self.assertLess(crawler.stats.counter('urls'), 8)
+
+    def test_run_with_store(self):
+        results = []
+        crawler = Crawler('http://localhost:8000', max_depth=1,
+                          store=MirrorStore())
+        crawler.run(on_result=results.append)
+        self.assertEqual(len(results), 5)
+        self.assertTrue(os.path.isfile('localhost/local-relative.html'))
+        self.assertFalse(os.path.isfile('localhost/depth2.html'))
+
+    def test_output_options(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            pack = os.path.join(tmpdir, 'crawl.pack')
+            Crawler('http://localhost:8000', pack=pack).run()
+            self.assertGreater(os.path.getsize(pack), 6000)
+        finally:
+            shutil.rmtree(tmpdir)
+
+    @unittest.skipIf(aiohttp is None, "requires aiohttp")
+    def test_aiter_results(self):
+        import asyncio
+
+        # "async for", without syntax Python 2 can't parse
+        def crawl(crawler, limit=None):
+            results = []
+            loop = asyncio.new_event_loop()
+            results_iter = crawler.aiter_results()
+            try:
+                while len(results) != limit:
+                    try:
+                        results.append(loop.run_until_complete(
+                            results_iter.__anext__()))
+                    except StopAsyncIteration:
+                        break
+                loop.run_until_complete(results_iter.aclose())
+            finally:
+                loop.close()
+            return results
+
+        self.check_results(crawl(Crawler('http://localhost:8000')))
+        crawler = Crawler('http://localhost:8000')
+        self.assertEqual(len(crawl(crawler, limit=1)), 1)
+        self.assertLess(crawler.stats.counter('documents'), 8)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,209 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_distributed
+----------------------------------
+
+Tests for `pycrawl.distributed` module.
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+try:  # Python 3
+    from urllib import robotparser
+except ImportError:  # Python 2
+    import robotparser
+
+from pycrawl.distributed import Mailbox, PartitionedFrontier, partition_of
+from pycrawl.frontier import Frontier
+from pycrawl.robots import RobotsCache
+from pycrawl.scheduler import HostScheduler
+
+
+class TestPartitionOf(unittest.TestCase):
+
+    def test_by_host(self):
+        partitions = set(partition_of('http://a.com/{}'.format(i), 8)
+                         for i in range(20))
+        self.assertEqual(len(partitions), 1)
+        self.assertEqual(partition_of('http://A.com/x', 8),
+                         partition_of('http://a.com/y', 8))
+
+    def test_by_url(self):
+        partitions = [partition_of('http://a.com/{}'.format(i), 8, 'url')
+                      for i in range(20)]
+        self.assertGreater(len(set(partitions)), 1)
+        self.assertTrue(all(0 <= n < 8 for n in partitions))
+        # stable from one run (and process) to the next
+        self.assertEqual(partition_of('http://a.com/', 8, 'url'),
+                         partition_of('http://a.com/#top', 8, 'url'))
+
+
+class MailboxTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'mailbox')
+        self.mailbox = Mailbox(self.path)
+        self.mailbox.reset(2)
+
+    def tearDown(self):
+        self.mailbox.close()
+        shutil.rmtree(self.tmpdir)
+
+
+class TestMailbox(MailboxTestCase):
+
+    def test_send_and_receive(self):
+        self.mailbox.send([(1, 'http://a/1', 2), (0, 'http://a/0', 1),
+                           (1, 'http://a/2', 3)])
+        other = Mailbox(self.path)
+        self.assertEqual(other.receive(1),
+                         [('http://a/1', 2), ('http://a/2', 3)])
+        self.assertEqual(other.receive(1), [])
+        self.assertEqual(self.mailbox.receive(0), [('http://a/0', 1)])
+        other.close()
+
+    def test_quiescence(self):
+        self.assertFalse(self.mailbox.is_quiescent(),
+                         "partitions start busy")
+        self.mailbox.receive(0, idle=True)
+        self.assertFalse(self.mailbox.is_quiescent())
+        self.mailbox.send([(1, 'http://a/1', 1)])
+        self.mailbox.receive(1, idle=True)
+        self.assertFalse(self.mailbox.is_quiescent(),
+                         "a partition receiving links stays busy")
+        self.mailbox.send([(0, 'http://a/0', 1)])
+        self.mailbox.receive(1, idle=True)
+        self.assertFalse(self.mailbox.is_quiescent(),
+                         "links are waiting for partition 0")
+        self.mailbox.receive(0, idle=True)
+        self.assertFalse(self.mailbox.is_quiescent())
+        self.mailbox.receive(0, idle=True)
+        self.assertTrue(self.mailbox.is_quiescent())
+
+    def test_finish_and_stats(self):
+        self.assertFalse(self.mailbox.is_finished())
+        self.mailbox.put_stats(1, {'counters': {'urls': 3}})
+        self.mailbox.finish()
+        self.assertTrue(self.mailbox.is_finished())
+        self.assertEqual(self.mailbox.stats(), [{'counters': {'urls': 3}}])
+        self.mailbox.reset(2)
+        self.assertFalse(self.mailbox.is_finished())
+        self.assertEqual(self.mailbox.stats(), [])
+
+
+class TestPartitionedFrontier(MailboxTestCase):
+
+    def make_frontier(self, partition, **kwargs):
+        return PartitionedFrontier(Frontier(), self.mailbox, partition, 2,
+                                   partition_by='url', **kwargs)
+
+    def urls_for(self, partition):
+        return [url for url in ('http://a/{}'.format(i) for i in range(20))
+                if partition_of(url, 2, 'url') == partition]
+
+    def test_forwards_others_urls(self):
+        frontier = self.make_frontier(0)
+        mine, theirs = self.urls_for(0)[0], self.urls_for(1)[0]
+        self.assertTrue(frontier.add(mine, 0))
+        self.assertFalse(frontier.add(theirs, 1))
+        self.assertFalse(frontier.add(theirs, 1))
+        self.assertEqual(len(frontier), 1)
+        frontier.flush()
+        self.assertEqual(self.mailbox.receive(1), [(theirs, 1)],
+                         "forwarded once")
+
+    def test_batches(self):
+        frontier = self.make_frontier(0, batch_size=2)
+        theirs = self.urls_for(1)
+        frontier.add(theirs[0], 1)
+        self.assertEqual(self.mailbox.receive(1), [])
+        frontier.add(theirs[1], 1)
+        self.assertEqual(len(self.mailbox.receive(1)), 2)
+
+    def test_polls_for_new_hosts(self):
+        now = [0.0]
+        frontier = self.make_frontier(1, poll_interval=1.0,
+                                      clock=lambda: now[0])
+        theirs = self.urls_for(1)
+        self.assertEqual(frontier.pop_new_hosts(), [])
+        self.mailbox.send([(1, theirs[0], 2)])
+        self.assertEqual(frontier.pop_new_hosts(), [],
+                         "polled at most every poll_interval")
+        now[0] = 1.0
+        self.assertEqual(frontier.pop_new_hosts(), ['a'])
+        self.assertEqual(frontier.pop('a'), (theirs[0], 2))
+
+    def test_idle(self):
+        now = [0.0]
+        frontier = self.make_frontier(1, poll_interval=1.0,
+                                      clock=lambda: now[0])
+        theirs = self.urls_for(1)
+        self.assertEqual(frontier.idle(), 1.0)
+        self.mailbox.receive(0, idle=True)
+        self.assertTrue(self.mailbox.is_quiescent())
+        self.mailbox.send([(1, theirs[0], 2)])
+        now[0] = 0.25
+        self.assertEqual(frontier.idle(), 0.75,
+                         "polled at most every poll_interval")
+        self.assertEqual(frontier.pop_new_hosts(), [],
+                         "nor polled for new hosts while idle")
+        now[0] = 1.0
+        self.assertEqual(frontier.idle(), 0.0)
+        self.assertEqual(frontier.pop_new_hosts(), ['a'])
+        self.assertEqual(frontier.pop('a'), (theirs[0], 2))
+        self.assertEqual(frontier.idle(), 1.0)
+        self.mailbox.finish()
+        now[0] = 2.0
+        self.assertIsNone(frontier.idle())
+
+    @unittest.skipIf(not hasattr(robotparser.RobotFileParser,
+                                 'crawl_delay'),
+                     "Python 2's robotparser ignores delays")
+    def test_crawl_delay_across_rounds(self):
+        now = [1000.0]
+
+        def clock():
+            return now[0]
+
+        partition = partition_of('http://a/', 2)
+        frontier = PartitionedFrontier(Frontier(), self.mailbox, partition,
+                                       2, poll_interval=1.0, clock=clock)
+        robots_cache = RobotsCache(ttl=None)
+        robots_cache.store('http://a/robots.txt',
+                           'User-agent: *\nCrawl-delay: 3\n')
+        scheduler = HostScheduler(frontier, robots_cache=robots_cache,
+                                  clock=clock)
+        frontier.add('http://a/1', 0)
+        # links from the other partition, and when they're sent
+        arrivals = [(1001.0, ['http://a/2']),
+                    (1002.0, ['http://a/3', 'http://a/4']),
+                    (1010.0, ['http://a/5'])]
+        fetched = []
+        while True:
+            while arrivals and arrivals[0][0] <= now[0]:
+                self.mailbox.send([(partition, url, 1)
+                                   for url in arrivals.pop(0)[1]])
+            item, wait = scheduler.take()
+            if item is not None:
+                fetched.append((item[0], now[0]))
+                scheduler.done(item[2])
+                continue
+            if wait is None:
+                break
+            if not arrivals and wait > 0:
+                self.mailbox.finish()
+            now[0] += wait
+        self.assertEqual(fetched, [('http://a/1', 1000.0),
+                                   ('http://a/2', 1003.0),
+                                   ('http://a/3', 1006.0),
+                                   ('http://a/4', 1009.0),
+                                   ('http://a/5', 1012.0)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_engine
+----------------------------------
+
+Tests for `pycrawl.engine` module.
+"""
+
+import threading
+import time
+import unittest
+
+from pycrawl.engine import ThreadedCrawl
+from pycrawl.retry import RetryLater
+
+
+class FakeSite(object):
+    """A link graph standing in for the network."""
+
+    def __init__(self, graph, delay=0.01):
+        self.graph = graph
+        self.delay = delay
+        self.fetched = []
+        self.active = {}
+        self.max_active = {}
+        self.lock = threading.Lock()
+
+    def process_url(self, url):
+        host = url.split('/')[2]
+        with self.lock:
+            self.fetched.append(url)
+            self.active[host] = self.active.get(host, 0) + 1
+            self.max_active[host] = max(self.max_active.get(host, 0),
+                                        self.active[host])
+        time.sleep(self.delay)
+        with self.lock:
+            self.active[host] -= 1
+        return self.graph.get(url, [])
+
+
+def accept_all(link):
+    return link
+
+
+class TestThreadedCrawl(unittest.TestCase):
+
+    def setUp(self):
+        self.site = FakeSite({
+            'http://a/': ['http://a/1', 'http://a/2', 'http://b/1'],
+            'http://a/1': ['http://a/', 'http://a/3'],
+            'http://a/2': ['http://a/3'],
+            'http://a/3': ['http://a/4'],
+        })
+
+    def test_fetches_each_url_once(self):
+        ThreadedCrawl(self.site.process_url, accept_all, 4).run(['http://a/'])
+        self.assertEqual(sorted(self.site.fetched),
+                         ['http://a/', 'http://a/1', 'http://a/2',
+                          'http://a/3', 'http://a/4', 'http://b/1'])
+
+    def test_max_depth(self):
+        ThreadedCrawl(self.site.process_url, accept_all, 4,
+                      max_depth=1).run(['http://a/'])
+        self.assertEqual(sorted(self.site.fetched),
+                         ['http://a/', 'http://a/1', 'http://a/2',
+                          'http://b/1'])
+
+    def test_accept_link_filters(self):
+        def local_only(link):
+            return link if link.startswith('http://a/') else None
+        ThreadedCrawl(self.site.process_url, local_only, 4).run(['http://a/'])
+        self.assertNotIn('http://b/1', self.site.fetched)
+
+    def test_per_host_limit(self):
+        site = FakeSite({'http://a/': ['http://a/{}'.format(i)
+                                       for i in range(20)]})
+        ThreadedCrawl(site.process_url, accept_all, 8,
+                      per_host_limit=2).run(['http://a/'])
+        self.assertEqual(len(site.fetched), 21)
+        self.assertLessEqual(site.max_active['a'], 2)
+
+    def test_retry_later(self):
+        failures = {'http://a/1': 2}
+
+        def flaky(url):
+            if failures.get(url):
+                failures[url] -= 1
+                raise RetryLater("unavailable", 0.01)
+            return self.site.process_url(url)
+
+        ThreadedCrawl(flaky, accept_all, 4).run(['http://a/'])
+        self.assertEqual(sorted(self.site.fetched),
+                         ['http://a/', 'http://a/1', 'http://a/2',
+                          'http://a/3', 'http://a/4', 'http://b/1'])
+
+    def test_worker_error_is_raised(self):
+        def process_url(url):
+            raise RuntimeError("boom")
+        crawl = ThreadedCrawl(process_url, accept_all, 3)
+        self.assertRaises(RuntimeError, crawl.run, ['http://a/'])
+
+
+if __name__ == '__main__':
+    unittest.main()
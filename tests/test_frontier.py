@@ -0,0 +1,211 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_frontier
+----------------------------------
+
+Tests for `pycrawl.frontier` module.
+"""
+
+import shutil
+import tempfile
+import unittest
+
+from pycrawl.frontier import (BloomFilter, ExactSet, FingerprintSet,
+                              Frontier, PriorityQueue, Scorer, SpillPool,
+                              SpillQueue, make_frontier)
+
+
+class TestSeenSets(unittest.TestCase):
+
+    def check_set(self, seen):
+        self.assertNotIn('http://a/1', seen)
+        seen.add('http://a/1')
+        seen.add(u'http://a/é')
+        self.assertIn('http://a/1', seen)
+        self.assertIn(u'http://a/é', seen)
+        self.assertNotIn('http://a/2', seen)
+        self.assertEqual(len(seen), 2)
+
+    def test_exact(self):
+        self.check_set(ExactSet())
+
+    def test_fingerprint(self):
+        self.check_set(FingerprintSet())
+
+    def test_bloom(self):
+        self.check_set(BloomFilter(capacity=100, error_rate=0.01))
+
+    def test_bloom_error_rate(self):
+        bloom = BloomFilter(capacity=2000, error_rate=0.01)
+        for i in range(2000):
+            bloom.add('http://a/{}'.format(i))
+        for i in range(2000):
+            self.assertIn('http://a/{}'.format(i), bloom)
+        false_positives = sum(1 for i in range(10000)
+                              if 'http://b/{}'.format(i) in bloom)
+        self.assertLess(false_positives, 300)
+
+
+class TestSpillQueue(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_fifo_across_spill(self):
+        queue = SpillQueue(memory_size=3, spill_dir=self.tmpdir)
+        items = [('http://a/{}'.format(i), i) for i in range(10)]
+        for item in items[:6]:
+            queue.append(item)
+        self.assertEqual(len(queue), 6)
+        self.assertEqual(len(queue._head), 3)
+        out = [queue.popleft() for _ in range(4)]
+        for item in items[6:]:
+            queue.append(item)
+        while len(queue):
+            out.append(queue.popleft())
+        self.assertEqual(out, items)
+        self.assertRaises(IndexError, queue.popleft)
+        queue.close()
+
+    def test_shared_pool(self):
+        pool = SpillPool(memory_size=5, spill_dir=self.tmpdir)
+        queues = [SpillQueue(pool=pool) for _ in range(20)]
+        items = [[('http://{}/{}'.format(host, i), i) for i in range(10)]
+                 for host in range(20)]
+        for i in range(10):
+            for queue, host_items in zip(queues, items):
+                queue.append(host_items[i])
+        self.assertEqual(pool.in_memory, 5,
+                         "memory is bounded over all the queues")
+        self.assertEqual(pool.spilled, 195)
+        for queue, host_items in zip(queues, items):
+            self.assertEqual(len(queue), 10)
+            out = []
+            while len(queue):
+                out.append(queue.popleft())
+                self.assertLessEqual(pool.in_memory, 6)
+            self.assertEqual(out, host_items)
+        self.assertEqual((pool.in_memory, pool.spilled), (0, 0))
+        self.assertIsNone(pool._file, "the spill file is closed once empty")
+
+    def test_close_releases(self):
+        pool = SpillPool(memory_size=2, spill_dir=self.tmpdir)
+        queue = SpillQueue(pool=pool)
+        for i in range(5):
+            queue.append(('http://a/{}'.format(i), 0))
+        queue.close()
+        self.assertEqual((pool.in_memory, pool.spilled), (0, 0))
+        self.assertIsNone(pool._file)
+
+
+class TestFrontier(unittest.TestCase):
+
+    def test_deduplicates_at_enqueue(self):
+        frontier = Frontier()
+        self.assertTrue(frontier.add('http://a/', 0))
+        self.assertTrue(frontier.add('http://a/1', 1))
+        for _ in range(500):
+            self.assertFalse(frontier.add('http://a/1', 1))
+        self.assertEqual(len(frontier), 2)
+        self.assertEqual(frontier.pop(), ('http://a/', 0))
+        self.assertFalse(frontier.add('http://a/', 2),
+                         "URLs stay seen after they're popped")
+        self.assertEqual(frontier.pop(), ('http://a/1', 1))
+        self.assertIsNone(frontier.pop())
+
+    def test_restore(self):
+        frontier = Frontier()
+        frontier.restore([('http://a/2', 1)], ['http://a/', 'http://a/1'])
+        self.assertFalse(frontier.add('http://a/1', 1))
+        self.assertFalse(frontier.add('http://a/2', 1))
+        self.assertEqual(frontier.pop(), ('http://a/2', 1))
+        self.assertIsNone(frontier.pop())
+
+    def test_hosts_take_turns(self):
+        frontier = Frontier()
+        for url in ['http://a/1', 'http://a/2', 'http://a/3', 'http://b/1',
+                    'http://c/1']:
+            frontier.add(url, 0)
+        self.assertEqual(frontier.pop_new_hosts(), ['a', 'b', 'c'])
+        self.assertEqual(frontier.pending('a'), 3)
+        self.assertEqual(frontier.pop('a'), ('http://a/1', 0))
+        self.assertEqual([frontier.pop()[0] for _ in range(4)],
+                         ['http://a/2', 'http://b/1', 'http://c/1',
+                          'http://a/3'])
+        self.assertIsNone(frontier.pop())
+        self.assertIsNone(frontier.pop('a'))
+        frontier.add('http://b/2', 1)
+        self.assertEqual(frontier.pop_new_hosts(), ['b'])
+        self.assertEqual(frontier.pop(), ('http://b/2', 1))
+        self.assertEqual(len(frontier), 0)
+
+    def test_make_frontier(self):
+        self.assertIsInstance(make_frontier('exact').seen, ExactSet)
+        frontier = make_frontier('bloom', bloom_error_rate=0.05,
+                                 spill_dir=tempfile.gettempdir())
+        self.assertIsInstance(frontier.seen, BloomFilter)
+        self.assertEqual(frontier.seen.error_rate, 0.05)
+        frontier.add('http://a/', 0)
+        self.assertIsInstance(frontier.queues['a'], SpillQueue)
+        frontier.close()
+        self.assertRaises(ValueError, make_frontier, 'bogus')
+        frontier = make_frontier(scorer=Scorer(link_weight=1.0))
+        self.assertTrue(frontier.count_links)
+        frontier.add('http://a/', 0)
+        self.assertIsInstance(frontier.queues['a'], PriorityQueue)
+        self.assertRaises(ValueError, make_frontier, scorer=Scorer(),
+                          spill_dir=tempfile.gettempdir())
+
+
+class TestPriority(unittest.TestCase):
+
+    def test_scorer(self):
+        scorer = Scorer(depth_weight=2.0, link_weight=0.5,
+                        path_weights=[('^/docs/', 10.0), (r'\.pdf$', -5.0)])
+        self.assertEqual(scorer('http://a/x', 1, 1), -1.5)
+        self.assertEqual(scorer('http://a/docs/x.pdf?q=/docs/', 1, 1), 3.5)
+        self.assertTrue(scorer.uses_links)
+        self.assertFalse(Scorer().uses_links)
+
+    def test_shallow_first(self):
+        queue = PriorityQueue(Scorer())
+        for item in [('http://a/2', 2), ('http://a/1a', 1),
+                     ('http://a/0', 0), ('http://a/1b', 1)]:
+            queue.append(item)
+        self.assertEqual([queue.popleft() for _ in range(4)],
+                         [('http://a/0', 0), ('http://a/1a', 1),
+                          ('http://a/1b', 1), ('http://a/2', 2)])
+        self.assertRaises(IndexError, queue.popleft)
+
+    def test_links_raise_priority(self):
+        frontier = make_frontier(scorer=Scorer(depth_weight=0.0,
+                                               link_weight=1.0))
+        for url in ['http://a/1', 'http://a/2', 'http://a/3', 'http://a/3',
+                    'http://a/2', 'http://a/3']:
+            frontier.add(url, 1)
+        self.assertEqual(len(frontier), 3)
+        self.assertEqual([frontier.pop()[0] for _ in range(3)],
+                         ['http://a/3', 'http://a/2', 'http://a/1'])
+        # links to URLs already crawled change nothing
+        frontier.add('http://a/1', 1)
+        self.assertIsNone(frontier.pop())
+
+    def test_compaction(self):
+        queue = PriorityQueue(Scorer(depth_weight=0.0, link_weight=1.0))
+        queue.append(('http://a/1', 0))
+        queue.append(('http://a/2', 0))
+        for _ in range(3000):
+            queue.bump('http://a/1')
+        self.assertLess(len(queue._heap), 1100)
+        self.assertEqual(queue.popleft(), ('http://a/1', 0))
+        self.assertEqual(queue.popleft(), ('http://a/2', 0))
+        self.assertEqual(len(queue), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_journal
+----------------------------------
+
+Tests for `pycrawl.journal` module.
+"""
+
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+from pycrawl.journal import CrawlJournal
+
+
+class TestCrawlJournal(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'journal.sqlite')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def count_rows(self):
+        db = sqlite3.connect(self.path)
+        try:
+            return db.execute("SELECT COUNT(*) FROM urls").fetchone()[0]
+        finally:
+            db.close()
+
+    def test_pending_and_done(self):
+        journal = CrawlJournal(self.path)
+        journal.reset('http://a/')
+        journal.add('http://a/', 0)
+        journal.add('http://a/1', 1)
+        journal.add('http://a/2', 1)
+        journal.done('http://a/')
+        self.assertEqual(journal.pending(),
+                         [('http://a/1', 1), ('http://a/2', 1)])
+        self.assertEqual(journal.done_urls(), set(['http://a/']))
+        self.assertEqual(journal.seen(),
+                         set(['http://a/', 'http://a/1', 'http://a/2']))
+
+    def test_survives_reopening(self):
+        journal = CrawlJournal(self.path)
+        journal.reset('http://a/')
+        journal.add('http://a/', 0)
+        journal.add('http://a/1', 1)
+        journal.done('http://a/')
+        journal.close()
+
+        journal = CrawlJournal(self.path)
+        self.assertEqual(journal.root_url(), 'http://a/')
+        self.assertEqual(journal.pending(), [('http://a/1', 1)])
+
+    def test_updates_are_batched(self):
+        journal = CrawlJournal(self.path, batch_size=10, interval=3600)
+        journal.reset('http://a/')
+        for i in range(9):
+            journal.add('http://a/{}'.format(i), 1)
+        self.assertEqual(self.count_rows(), 0)
+        journal.add('http://a/9', 1)
+        self.assertEqual(self.count_rows(), 10)
+
+    def test_requested_checkpoint(self):
+        journal = CrawlJournal(self.path, batch_size=1000, interval=3600)
+        journal.reset('http://a/')
+        journal.add('http://a/', 0)
+        self.assertEqual(self.count_rows(), 0)
+        journal.request_checkpoint()
+        journal.add('http://a/1', 1)
+        self.assertEqual(self.count_rows(), 2)
+
+    def test_reset(self):
+        journal = CrawlJournal(self.path)
+        journal.reset('http://a/')
+        journal.add('http://a/', 0)
+        journal.reset('http://b/')
+        self.assertEqual(journal.root_url(), 'http://b/')
+        self.assertEqual(journal.seen(), set())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_links
+----------------------------------
+
+Tests for `pycrawl.links` module.
+"""
+
+import unittest
+
+from pycrawl.links import find_links, localize_link, rewrite_links
+
+
+class TestLocalizeLink(unittest.TestCase):
+
+    def test_local_link_made_relative(self):
+        self.assertEqual(localize_link('http://h:8000/a/b?q=1#f', 'h'),
+                         '/a/b?q=1#f')
+
+    def test_other_links_unchanged(self):
+        self.assertEqual(localize_link('http://other/a', 'h'),
+                         'http://other/a')
+        self.assertEqual(localize_link('a/b.html', 'h'), 'a/b.html')
+        # malformed: left for get_absolute_links to drop
+        self.assertEqual(localize_link('http://[::1/x', 'h'),
+                         'http://[::1/x')
+
+    def test_mailto_skipped(self):
+        self.assertIsNone(localize_link('mailto:x@h', 'h'))
+
+
+class TestRewriteLinks(unittest.TestCase):
+
+    def test_find_links_spans(self):
+        html = '<p><a href="x.html">x</a><img alt=a src=y.png></p>'
+        spans = find_links(html)
+        self.assertEqual([html[start:end] for start, end, _ in spans],
+                         ['x.html', 'y.png'])
+        self.assertEqual([link for _, _, link in spans],
+                         ['x.html', 'y.png'])
+
+    def test_only_links_change(self):
+        html = (u'<!DOCTYPE html>\n<HTML><body class=x>caf\xe9 &amp; '
+                u'<A HREF="http://h/one">1</A>\n'
+                u"<img\n  alt='q' src='http://h/i.png'/>"
+                u'<a href=http://other/two>2</a>'
+                u'<a href="mailto:m@h">m</a><a name="no-href">'
+                u'<!-- <a href="http://h/comment"> -->'
+                u'</body></HTML>\n')
+        new_html, links = rewrite_links(html, 'h')
+        self.assertEqual(new_html, html.replace('http://h/', '/', 2))
+        self.assertEqual(links, ['/one', '/i.png', 'http://other/two'])
+
+    def test_entities_in_links(self):
+        html = '<a href="http://h/p?a=1&amp;b=2">p</a>'
+        new_html, links = rewrite_links(html, 'h')
+        self.assertEqual(links, ['/p?a=1&b=2'])
+        self.assertEqual(new_html, '<a href="/p?a=1&amp;b=2">p</a>')
+
+    def test_script_contents_ignored(self):
+        html = '<script>var s = \'<a href="http://h/x">\';</script>'
+        self.assertEqual(rewrite_links(html, 'h'), (html, []))
+
+
+if __name__ == '__main__':
+    unittest.main()
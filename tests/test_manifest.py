@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_manifest
+----------------------------------
+
+Tests for `pycrawl.manifest` module.
+"""
+
+import hashlib
+import os
+import shutil
+import tempfile
+import unittest
+
+from pycrawl.manifest import BodyDigest, Manifest, ManifestEntry
+
+
+class TestManifest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'manifest')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_conditional_headers(self):
+        entry = ManifestEntry(etag='"abc"',
+                              last_modified='Thu, 21 May 2015 00:00:00 GMT')
+        self.assertEqual(entry.conditional_headers(), {
+            'If-None-Match': '"abc"',
+            'If-Modified-Since': 'Thu, 21 May 2015 00:00:00 GMT'})
+        self.assertEqual(ManifestEntry().conditional_headers(), {})
+
+    def test_roundtrip(self):
+        manifest = Manifest(self.path)
+        manifest.put('http://a/', ManifestEntry(
+            etag='"x"', length=10, sha1='00', links=['b.html', 'c.html']))
+        self.assertEqual(manifest.get('http://a/').etag, '"x"')
+        manifest.close()
+
+        manifest = Manifest(self.path)
+        entry = manifest.get('http://a/')
+        self.assertEqual(entry.etag, '"x"')
+        self.assertIsNone(entry.last_modified)
+        self.assertEqual(entry.length, 10)
+        self.assertEqual(entry.links, ['b.html', 'c.html'])
+        self.assertIsNone(manifest.get('http://a/missing'))
+        manifest.close()
+
+    def test_body_digest(self):
+        digest = BodyDigest()
+        self.assertEqual(list(digest.wrap([b'ab', b'cd'])), [b'ab', b'cd'])
+        self.assertEqual(digest.size, 4)
+        self.assertEqual(digest.hexdigest(), hashlib.sha1(b'abcd').hexdigest())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_metrics
+----------------------------------
+
+Tests for `pycrawl.metrics` module.
+"""
+
+import json
+import time
+import unittest
+
+from pycrawl.metrics import NULL_STATS, CrawlStats, Histogram
+
+
+class TestHistogram(unittest.TestCase):
+
+    def test_quantiles(self):
+        histogram = Histogram(bounds=[1, 2, 5])
+        for value in [0.5, 0.5, 1.5, 3, 10]:
+            histogram.add(value)
+        self.assertEqual(histogram.count, 5)
+        self.assertEqual(histogram.counts, [2, 1, 1, 1])
+        self.assertEqual(histogram.quantile(0.4), 1)
+        self.assertEqual(histogram.quantile(0.5), 2)
+        self.assertEqual(histogram.quantile(1.0), 10)
+        self.assertEqual(histogram.as_dict()['max'], 10)
+        self.assertIsNone(Histogram().quantile(0.5))
+
+
+class TestCrawlStats(unittest.TestCase):
+
+    def test_nested_phases_are_exclusive(self):
+        stats = CrawlStats()
+        with stats.time('write'):
+            time.sleep(0.02)
+            with stats.time('download'):
+                time.sleep(0.05)
+        phases = stats.snapshot()['phases']
+        self.assertEqual(phases['write']['count'], 1)
+        self.assertGreaterEqual(phases['download']['sum'], 0.05)
+        self.assertLess(phases['write']['sum'], 0.05)
+
+    def test_time_iter(self):
+        stats = CrawlStats()
+
+        def slow():
+            for i in range(3):
+                time.sleep(0.01)
+                yield i
+        self.assertEqual(list(stats.time_iter('download', slow())),
+                         [0, 1, 2])
+        download = stats.snapshot()['phases']['download']
+        self.assertEqual(download['count'], 1, "one observation per body")
+        self.assertGreaterEqual(download['sum'], 0.03)
+
+    def test_counters_and_hooks(self):
+        stats = CrawlStats()
+        seen = []
+        stats.add_hook(lambda name, value: seen.append((name, value)))
+        stats.count('documents')
+        stats.count('bytes_downloaded', 100)
+        stats.status(200)
+        stats.status(200)
+        stats.status(404)
+        stats.record_time('parse', 0.5)
+        snapshot = stats.snapshot()
+        self.assertEqual(snapshot['counters'],
+                         {'documents': 1, 'bytes_downloaded': 100})
+        self.assertEqual(snapshot['status_codes'], {'200': 2, '404': 1})
+        self.assertEqual(seen, [('documents', 1), ('bytes_downloaded', 100),
+                                ('status.200', 1), ('status.200', 1),
+                                ('status.404', 1), ('time.parse', 0.5)])
+
+    def test_gauges(self):
+        stats = CrawlStats()
+        queue = [1, 2, 3]
+        stats.gauge('frontier', queue.__len__)
+        self.assertEqual(stats.sample_gauges(), {'frontier': 3})
+        del queue[:]
+        snapshot = stats.snapshot()
+        self.assertEqual(snapshot['gauges'], {'frontier': 0})
+        self.assertEqual(snapshot['gauges_max'], {'frontier': 3})
+        self.assertIn('frontier 0', stats.progress_line())
+
+    def test_merge(self):
+        stats = CrawlStats()
+        stats.count('documents', 2)
+        stats.status(200)
+        stats.record_time('parse', 0.5)
+        other = CrawlStats()
+        other.count('documents', 3)
+        other.count('urls')
+        other.status(200)
+        other.status(404)
+        other.record_time('parse', 2.0)
+        other.record_time('head', 0.1)
+        queue = [1, 2]
+        other.gauge('frontier', queue.__len__)
+        stats.merge(json.loads(json.dumps(other.snapshot())))
+        snapshot = stats.snapshot()
+        self.assertEqual(snapshot['counters'], {'documents': 5, 'urls': 1})
+        self.assertEqual(snapshot['status_codes'], {'200': 2, '404': 1})
+        parse = snapshot['phases']['parse']
+        self.assertEqual((parse['count'], parse['sum']), (2, 2.5))
+        self.assertEqual((parse['min'], parse['max']), (0.5, 2.0))
+        self.assertEqual(snapshot['phases']['head']['count'], 1)
+        self.assertEqual(snapshot['gauges_max'], {'frontier': 2})
+
+    def test_snapshot_is_json(self):
+        stats = CrawlStats()
+        stats.record_time('request', 0.1)
+        json.dumps(stats.snapshot())
+
+    def test_null_stats(self):
+        with NULL_STATS.time('parse'):
+            pass
+        self.assertEqual(list(NULL_STATS.time_iter('download', [1, 2])),
+                         [1, 2])
+        NULL_STATS.count('documents')
+        NULL_STATS.status(200)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_parsepool
+----------------------------------
+
+Tests for `pycrawl.parsepool` module.
+"""
+
+import threading
+import unittest
+
+try:
+    from pycrawl.parsepool import ParsePool
+except ImportError:  # Python 2
+    ParsePool = None
+
+
+HTML = u'<p>caf\xe9 <a href="http://h/x.html">x</a> <img src="y.png"></p>'
+
+
+@unittest.skipIf(ParsePool is None, "requires Python 3")
+class TestParsePool(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.pool = ParsePool(processes=2, max_pending=3)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.pool.close()
+
+    def test_rewrite(self):
+        html, links = self.pool.get_content_and_links(
+            HTML.encode('utf-8'), 'utf-8', 'h', 'stream')
+        self.assertEqual(html, HTML.replace('http://h/', '/'))
+        self.assertEqual(links, ['/x.html', 'y.png'])
+
+    def test_pending_is_bounded(self):
+        results = []
+        high_water = [0]
+        lock = threading.Lock()
+
+        def submit():
+            future = self.pool.submit(HTML.encode('utf-8'), 'utf-8', 'h',
+                                      'stream')
+            with lock:
+                in_use = self.pool.max_pending - self.pool._slots._value
+                high_water[0] = max(high_water[0], in_use)
+            results.append(future.result())
+
+        threads = [threading.Thread(target=submit) for _ in range(12)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(len(results), 12)
+        self.assertLessEqual(high_water[0], 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_profiling
+----------------------------------
+
+Tests for `pycrawl.profiling` module.
+"""
+
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+from pycrawl.metrics import CrawlStats
+from pycrawl.profiling import (CProfiler, MemoryProfiler, SamplingProfiler,
+                               make_profiler, tracemalloc)
+
+
+def busy(seconds):
+    end = time.time() + seconds
+    while time.time() < end:
+        pass
+
+
+def allocate():
+    return [bytearray(1024) for _ in range(1000)]
+
+
+def in_thread(target, *args):
+    thread = threading.Thread(target=target, args=args)
+    thread.start()
+    thread.join()
+
+
+def function_names(stats):
+    return set(name for _, _, name in stats.stats)
+
+
+class TestProfilers(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_cprofile_sees_other_threads(self):
+        profiler = CProfiler()
+        with profiler:
+            in_thread(busy, 0.01)
+        self.assertIn('busy', function_names(profiler.stats()))
+        path = os.path.join(self.tmpdir, 'crawl.pstats')
+        profiler.save(path)
+        self.assertGreater(os.path.getsize(path), 0)
+
+    def test_stop_after_max_urls(self):
+        stats = CrawlStats()
+        profiler = CProfiler(max_urls=2)
+        stats.add_hook(profiler.on_stat)
+        profiler.start()
+        stats.count('urls')
+        stats.count('urls')
+        busy(0.001)
+        stats.count('urls')
+        allocate()
+        profiler.stop()
+        names = function_names(profiler.stats())
+        self.assertIn('busy', names)
+        self.assertNotIn('allocate', names)
+
+    def test_sampling(self):
+        profiler = SamplingProfiler(interval=0.001)
+        with profiler:
+            in_thread(busy, 0.1)
+        labels = [label for label, _ in profiler.top()]
+        self.assertTrue(any(label.startswith('busy ') for label in labels))
+        path = os.path.join(self.tmpdir, 'crawl.stacks')
+        profiler.save(path)
+        with open(path) as f:
+            stack, count = f.readline().rsplit(' ', 1)
+        self.assertGreater(int(count), 0)
+
+    @unittest.skipIf(tracemalloc is None, "requires Python 3")
+    def test_memory(self):
+        profiler = MemoryProfiler(functions=[allocate], interval=0.01)
+        with profiler:
+            blocks = allocate()
+            time.sleep(0.05)
+            del blocks
+        sites = profiler.top_sites(allocate)
+        self.assertTrue(sites)
+        filename, lineno, size, count = sites[0]
+        self.assertEqual(filename, __file__.replace('.pyc', '.py'))
+        self.assertGreater(size, 500 * 1024)
+        self.assertIn('within allocate', profiler.report())
+
+    def test_make_profiler(self):
+        self.assertIsInstance(make_profiler('sample', 5), SamplingProfiler)
+        self.assertEqual(make_profiler('cprofile', 5).max_urls, 5)
+        self.assertRaises(ValueError, make_profiler, 'gprof')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -8,11 +8,16 @@ test_pycrawl
 Tests for `pycrawl` module.
 """
 
+from contextlib import contextmanager
 import errno
 from functools import wraps
+import hashlib
+import json
 import os
+import pstats
 import re
 import shutil
+import tempfile
 import time
 import unittest
 try:  # Python 3
@@ -21,12 +26,27 @@ except:  # Python 2
     from urlparse import urlparse
 
 import bs4
+try:
+    import aiohttp
+except ImportError:  # optional dependency
+    aiohttp = None
+try:
+    import concurrent.futures
+except ImportError:  # Python 2
+    concurrent = None
 
 from tests.run_server import run_server, stop_server
 from pycrawl import pycrawl
+from pycrawl.journal import CrawlJournal
+from pycrawl.manifest import Manifest
+from pycrawl.metrics import CrawlStats
+from pycrawl.profiling import tracemalloc
+from pycrawl.retry import CircuitBreakers, RetryLater, RetryPolicy
+from pycrawl.robots import RobotsCache
+from pycrawl.storage import ContentStore, PackReader, PackStore
 
 
-def run_main_with_url(url, max_depth=None):
+def run_main_with_url(url, max_depth=None, extra_args=()):
     """Run main on the given URL, then delete the downloaded files after."""
     def decorator(f):
         @wraps(f)
@@ -34,6 +54,7 @@ def run_main_with_url(url, max_depth=None):
             argv = ['pycrawl.py', url]
             if max_depth is not None:
                 argv.extend(['-d{}'.format(max_depth)])
+            argv.extend(extra_args)
             try:
                 pycrawl.main(argv)
                 f(*args, **kwargs)
@@ -54,6 +75,69 @@ def run_main_with_url(url, max_depth=None):
     return decorator
 
 
+class Engine(object):
+    """A crawl engine to run tests with.
+
+    :param name: what to call it in test failures
+    :param args: command line arguments selecting it
+    :param workers: the ``workers`` to call download_site with
+    :param use_async: call download_site_async instead
+    """
+
+    def __init__(self, name, args, workers=None, use_async=False):
+        self.name = name
+        self.args = args
+        self.workers = workers
+        self.use_async = use_async
+
+    def download_site(self, url, **kwargs):
+        if self.use_async:
+            import asyncio
+            from pycrawl.aio import download_site_async
+            asyncio.run(download_site_async(url, **kwargs))
+        else:
+            pycrawl.download_site(url, workers=self.workers, **kwargs)
+
+
+ENGINES = [Engine('sequential', []),
+           Engine('threaded', ['-w4'], workers=4),
+           Engine('async', ['--async'], use_async=True)]
+
+
+@contextmanager
+def no_subtest():
+    # Python 2's unittest has no subTest
+    yield
+
+
+def for_each_engine(f):
+    """Run a test with each engine, as ``f(self, engine, tmpdir)``.
+
+    Each run gets a new temporary directory, and the directory and any
+    downloaded files are deleted after.  Failures name the engine.
+    """
+    @wraps(f)
+    def wrapper(self):
+        for engine in ENGINES:
+            if engine.use_async and aiohttp is None:
+                continue
+            subtest = getattr(self, 'subTest', None)
+            with (subtest(engine=engine.name) if subtest is not None
+                  else no_subtest()):
+                tmpdir = tempfile.mkdtemp()
+                try:
+                    f(self, engine, tmpdir)
+                finally:
+                    shutil.rmtree(tmpdir)
+                    shutil.rmtree('localhost', ignore_errors=True)
+    return wrapper
+
+
+def file_sha256(filename):
+    with open(filename, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
 class TestPycrawl(unittest.TestCase):
 
     @classmethod
@@ -137,6 +221,28 @@ class TestPycrawl(unittest.TestCase):
         # mailto: links should not be downloaded
         self.assertFalse(os.path.isfile('localhost/nobody@nowhere.com'))
 
+    @run_main_with_url('http://localhost:8000', max_depth=1,
+                       extra_args=['--html-parser', 'html.parser'])
+    def test_beautifulsoup_parser(self):
+        with open('localhost/__root__') as f:
+            root = bs4.BeautifulSoup(f, 'html.parser')
+        abs_link = root.find('a', text=re.compile("explicit"))['href']
+        self.assertIsNone(urlparse(abs_link).hostname,
+                          "absolute local links are changed to relative")
+        self.assertTrue(os.path.isfile('localhost/local-explicit.html'))
+        self.assertTrue(os.path.isfile('localhost/Python_logo_100x100.jpg'))
+
+    @unittest.skipIf(concurrent is None, "requires Python 3")
+    @run_main_with_url('http://localhost:8000',
+                       extra_args=['-w4', '--parse-processes', '2'])
+    def test_parse_processes(self):
+        with open('localhost/__root__') as f:
+            root = bs4.BeautifulSoup(f, 'html.parser')
+        img_src = root.find('img')['src']
+        self.assertIsNone(urlparse(img_src).hostname,
+                          "img src URLs are changed to relative")
+        self.assertTrue(os.path.isfile('localhost/depth3.html'))
+
     @run_main_with_url('http://localhost:8000', max_depth=0)
     def test_max_depth_zero(self):
         self.assertTrue(os.path.isfile('localhost/__root__'),
@@ -157,5 +263,480 @@ class TestPycrawl(unittest.TestCase):
         self.assertFalse(os.path.isfile('localhost/depth3.html'),
                          "file linked from second linked file not downloaded")
 
+    @run_main_with_url('http://localhost:8000', extra_args=['-w4'])
+    def test_workers_downloads_site(self):
+        for name in ['__root__', 'local-explicit.html', 'local-relative.html',
+                     'depth2.html', 'depth3.html', 'subdir/subpage.html',
+                     'Python_logo_100x100.jpg']:
+            self.assertTrue(os.path.isfile(os.path.join('localhost', name)),
+                            "{} downloaded".format(name))
+
+    @run_main_with_url('http://localhost:8000', max_depth=2,
+                       extra_args=['--workers', '4', '--per-host', '2'])
+    def test_workers_max_depth_two(self):
+        self.assertTrue(os.path.isfile('localhost/depth2.html'),
+                        "file linked from first linked file downloaded")
+        self.assertFalse(os.path.isfile('localhost/depth3.html'),
+                         "file linked from second linked file not downloaded")
+
+    @unittest.skipIf(aiohttp is None, "requires aiohttp")
+    @run_main_with_url('http://localhost:8000', extra_args=['--async'])
+    def test_async_downloads_site(self):
+        for name in ['__root__', 'local-explicit.html', 'local-relative.html',
+                     'depth2.html', 'depth3.html', 'subdir/subpage.html',
+                     'Python_logo_100x100.jpg']:
+            self.assertTrue(os.path.isfile(os.path.join('localhost', name)),
+                            "{} downloaded".format(name))
+        with open('localhost/__root__') as f:
+            root = bs4.BeautifulSoup(f)
+        img_src = root.find('img')['src']
+        self.assertIsNone(urlparse(img_src).hostname,
+                          "img src URLs are changed to relative")
+
+    @unittest.skipIf(aiohttp is None, "requires aiohttp")
+    @run_main_with_url('http://localhost:8000', max_depth=2,
+                       extra_args=['--async', '-w8'])
+    def test_async_max_depth_two(self):
+        self.assertTrue(os.path.isfile('localhost/depth2.html'),
+                        "file linked from first linked file downloaded")
+        self.assertFalse(os.path.isfile('localhost/depth3.html'),
+                         "file linked from second linked file not downloaded")
+
+    @unittest.skipIf(aiohttp is None, "requires aiohttp")
+    def test_async_per_host_limit(self):
+        import asyncio
+        from pycrawl.aio import AsyncCrawl
+        from pycrawl.engine import DEFAULT_PER_HOST_LIMIT
+        robots_cache = RobotsCache(ttl=None)
+        robots_cache.store('http://a/robots.txt', 'User-agent: *\n')
+        urls = ['http://a/{}'.format(i) for i in range(50)]
+        for limit, expected in [(None, DEFAULT_PER_HOST_LIMIT), (3, 3)]:
+            crawl = AsyncCrawl(urls, concurrency=100, per_host_limit=limit,
+                               robots_cache=robots_cache)
+            in_flight = [0]
+            most = [0]
+
+            def finished(future):
+                in_flight[0] -= 1
+
+            def process_url_and_get_links(url):
+                # without "async def", so Python 2 can parse this
+                in_flight[0] += 1
+                most[0] = max(most[0], in_flight[0])
+                self.assertEqual(
+                    crawl._session.connector.limit_per_host, expected)
+                future = asyncio.ensure_future(
+                    asyncio.sleep(0.01, result=[]))
+                future.add_done_callback(finished)
+                return future
+
+            crawl.process_url_and_get_links = process_url_and_get_links
+            asyncio.run(crawl.run())
+            self.assertEqual(most[0], expected)
+
+    @run_main_with_url('http://localhost:8000',
+                       extra_args=['--seen-set', 'bloom',
+                                   '--spill-dir', tempfile.gettempdir(),
+                                   '--queue-memory', '1'])
+    def test_bloom_and_spilled_frontier(self):
+        for name in ['__root__', 'local-explicit.html', 'local-relative.html',
+                     'depth2.html', 'depth3.html', 'subdir/subpage.html',
+                     'Python_logo_100x100.jpg']:
+            self.assertTrue(os.path.isfile(os.path.join('localhost', name)),
+                            "{} downloaded".format(name))
+
+    @run_main_with_url('http://localhost:8000',
+                       extra_args=['--max-body-size', '2K'])
+    def test_max_body_size(self):
+        self.assertTrue(os.path.isfile('localhost/__root__'),
+                        "small file downloaded")
+        self.assertFalse(os.path.isfile('localhost/Python_logo_100x100.jpg'),
+                         "large file skipped")
+        self.assertEqual([name for name in os.listdir('localhost')
+                          if name.endswith('.part')], [],
+                         "no partial files left behind")
+
+    @run_main_with_url('http://localhost:8000', max_depth=1,
+                       extra_args=['--max-html-size', '200'])
+    def test_max_html_size(self):
+        with open('localhost/__root__') as f:
+            root = bs4.BeautifulSoup(f)
+        # the document is saved unchanged ...
+        img_src = root.find('img')['src']
+        self.assertEqual(urlparse(img_src).hostname, 'localhost',
+                         "large HTML is not rewritten")
+        # ... and links are taken only from the start of it
+        self.assertTrue(os.path.isfile('localhost/local-explicit.html'))
+        self.assertFalse(os.path.isfile('localhost/subdir/subpage.html'))
+
+    def resume_from_journal(self, workers=None):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            journal = CrawlJournal(os.path.join(tmpdir, 'journal'))
+            journal.reset('http://localhost:8000')
+            journal.add('http://localhost:8000', 0)
+            journal.add('http://localhost:8000/local-relative.html', 1)
+            journal.add('http://localhost:8000/local-explicit.html', 1)
+            journal.done('http://localhost:8000')
+            journal.done('http://localhost:8000/local-relative.html')
+            journal.add('http://localhost:8000/index.html', 2)
+            journal.add('http://localhost:8000/depth2.html', 2)
+            journal.done('http://localhost:8000/index.html')
+            pycrawl.download_site('http://localhost:8000', max_depth=2,
+                                  workers=workers, journal=journal,
+                                  resume=True)
+            self.assertEqual(journal.pending(), [])
+            journal.close()
+
+            self.assertFalse(os.path.isfile('localhost/__root__'),
+                             "done URLs are not fetched again")
+            self.assertTrue(os.path.isfile('localhost/local-explicit.html'),
+                            "pending URLs are fetched")
+            self.assertTrue(os.path.isfile('localhost/depth2.html'),
+                            "pending URLs are fetched")
+            self.assertFalse(os.path.isfile('localhost/depth3.html'),
+                             "depth of resumed URLs is respected")
+        finally:
+            shutil.rmtree(tmpdir)
+            shutil.rmtree('localhost', ignore_errors=True)
+
+    @run_main_with_url('http://localhost:8000',
+                       extra_args=['--workers', '4', '--write-queue', '2',
+                                   '--fsync-interval', '0'])
+    def test_write_queue(self):
+        with open('localhost/__root__') as f:
+            root = bs4.BeautifulSoup(f, 'html.parser')
+        self.assertTrue(bool(root.find(text=re.compile("Text"))))
+        self.assertTrue(os.path.isfile('localhost/subdir/subpage.html'))
+
+    def test_stats_file(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmpdir, 'stats.json')
+            pycrawl.main(['pycrawl.py', 'http://localhost:8000', '-q',
+                          '--stats-file', path])
+            with open(path) as f:
+                stats = json.load(f)
+            self.assertGreater(stats['counters']['documents'], 5)
+            self.assertGreater(stats['counters']['bytes_downloaded'], 0)
+            self.assertEqual(sum(stats['status_codes'].values()),
+                             stats['counters']['documents'])
+            self.assertEqual(stats['phases']['request']['count'],
+                             stats['counters']['documents'])
+            self.assertGreater(stats['phases']['parse']['count'], 0)
+            self.assertEqual(stats['gauges']['frontier'], 0)
+        finally:
+            shutil.rmtree(tmpdir)
+            shutil.rmtree('localhost', ignore_errors=True)
+
+    def test_profile(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmpdir, 'crawl.pstats')
+            pycrawl.main(['pycrawl.py', 'http://localhost:8000', '-q',
+                          '--workers', '2', '--profile', path,
+                          '--profile-urls', '3'])
+            names = set(name for _, _, name in pstats.Stats(path).stats)
+            self.assertIn('process_url_and_get_links', names)
+            if tracemalloc is None:  # Python 2
+                return
+
+            path = os.path.join(tmpdir, 'memory.txt')
+            pycrawl.main(['pycrawl.py', 'http://localhost:8000', '-q',
+                          '--profile', path, '--profiler', 'memory'])
+            with open(path) as f:
+                report = f.read()
+            self.assertIn('within get_content_and_links', report)
+            self.assertIn('within download_site', report)
+        finally:
+            shutil.rmtree(tmpdir)
+            shutil.rmtree('localhost', ignore_errors=True)
+
+    def test_crawl_delay(self):
+        for workers in [None, 4]:
+            stats = CrawlStats()
+            start = time.time()
+            try:
+                pycrawl.download_site('http://localhost:8000',
+                                      workers=workers, crawl_delay=0.05,
+                                      stats=stats)
+            finally:
+                shutil.rmtree('localhost', ignore_errors=True)
+            requests = stats.counter('documents')
+            self.assertGreater(requests, 5)
+            self.assertGreaterEqual(time.time() - start,
+                                    (requests - 1) * 0.05)
+
+    def test_several_seeds(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmpdir, 'seeds.txt')
+            with open(path, 'w') as f:
+                f.write("# two names for the test server\n"
+                        "http://127.0.0.1:8000/depth2.html\n")
+            for extra_args in [['-w4'], ['--async']]:
+                if '--async' in extra_args and aiohttp is None:
+                    continue
+                pycrawl.main(['pycrawl.py', 'http://localhost:8000', '-q',
+                              '--seeds', path] + extra_args)
+                self.assertTrue(os.path.isfile('localhost/depth3.html'))
+                self.assertTrue(os.path.isfile('127.0.0.1/depth3.html'))
+                self.assertFalse(os.path.isfile('127.0.0.1/__root__'),
+                                 "relative links resolve against their "
+                                 "own host")
+                shutil.rmtree('localhost')
+                shutil.rmtree('127.0.0.1')
+        finally:
+            shutil.rmtree(tmpdir)
+            shutil.rmtree('localhost', ignore_errors=True)
+            shutil.rmtree('127.0.0.1', ignore_errors=True)
+
+    @for_each_engine
+    def test_max_pages(self, engine, tmpdir):
+        stats_file = os.path.join(tmpdir, 'stats.json')
+        pycrawl.main(['pycrawl.py', 'http://localhost:8000', '-q',
+                      '--max-pages', '3', '--score-path', 'subdir=5',
+                      '--stats-file', stats_file] + engine.args)
+        with open(stats_file) as f:
+            counters = json.load(f)['counters']
+        self.assertEqual(counters['urls'], 3)
+        self.assertTrue(os.path.isfile('localhost/subdir/subpage.html'),
+                        "preferred paths are crawled first")
+
+    @for_each_engine
+    def test_retries(self, engine, tmpdir):
+        stats = CrawlStats()
+        # nothing listens on this port
+        engine.download_site('http://localhost:8009/', stats=stats,
+                             retry=RetryPolicy(retries=2, backoff=0.01),
+                             breakers=CircuitBreakers(threshold=10))
+        self.assertEqual(stats.counter('urls'), 3)
+        self.assertEqual(stats.counter('retries'), 2)
+        self.assertEqual(stats.counter('fetch_errors'), 1)
+
+    @for_each_engine
+    def test_bad_link(self, engine, tmpdir):
+        stats = CrawlStats()
+        engine.download_site('http://localhost:8000/bad-link.html',
+                             max_depth=1, stats=stats)
+        self.assertEqual(stats.counter('bad_links'), 1)
+        self.assertTrue(os.path.isfile('localhost/depth2.html'),
+                        "the page's other links are followed")
+
+    @for_each_engine
+    def test_processes(self, engine, tmpdir):
+        stats_file = os.path.join(tmpdir, 'stats.json')
+        # by URL, so that links are passed between processes
+        pycrawl.main(['pycrawl.py', 'http://localhost:8000', '-q',
+                      '--processes', '2', '--partition-by', 'url',
+                      '--stats-file', stats_file] + engine.args)
+        with open(stats_file) as f:
+            counters = json.load(f)['counters']
+        self.assertEqual(counters['urls'], 8)
+        self.assertTrue(os.path.isfile('localhost/depth3.html'))
+        self.assertTrue(os.path.isfile('localhost/subdir/subpage.html'))
+
+    def test_processes_options(self):
+        argv = ['pycrawl.py', 'http://localhost:8000', '-q']
+        for args in [['--processes', '2', '--journal', 'j'],
+                     ['--processes', '2', '--max-pages', '3'],
+                     ['--processes', '0'],
+                     ['--partition', '0']]:
+            self.assertRaises(SystemExit, pycrawl.main, argv + args)
+
+    @for_each_engine
+    def test_sitemaps(self, engine, tmpdir):
+        manifest = os.path.join(tmpdir, 'manifest')
+        stats_file = os.path.join(tmpdir, 'stats.json')
+        args = ['pycrawl.py', 'http://localhost:8000', '-q', '--sitemaps',
+                '--incremental', '--manifest', manifest,
+                '--stats-file', stats_file] + engine.args
+        pycrawl.main(args)
+        self.assertTrue(os.path.isfile('localhost/depth3.html'),
+                        "pages in the sitemap and their links are crawled")
+        self.assertFalse(os.path.exists('www.bbc.co.uk'))
+
+        with open('localhost/depth2.html', 'w') as f:
+            f.write('local copy')
+        # as if new: depth3.html is only linked from depth2.html
+        os.remove('localhost/depth3.html')
+        pycrawl.main(args + ['--skip-unchanged'])
+        with open('localhost/depth2.html') as f:
+            self.assertEqual(f.read(), 'local copy',
+                             "page older than its copy is skipped")
+        self.assertTrue(os.path.isfile('localhost/depth3.html'),
+                        "links of a skipped page are crawled")
+        with open(stats_file) as f:
+            counters = json.load(f)['counters']
+        self.assertEqual(counters['sitemap_unchanged'], 1)
+
+    @for_each_engine
+    def test_content_type_filter(self, engine, tmpdir):
+        stats_file = os.path.join(tmpdir, 'stats.json')
+        for head in [False, True]:
+            pycrawl.main(['pycrawl.py', 'http://localhost:8000', '-q',
+                          '--accept-type', 'text/*', '--exclude', 'subdir',
+                          '--stats-file', stats_file] + engine.args +
+                         (['--head'] if head else []))
+            self.assertTrue(os.path.isfile('localhost/__root__'))
+            self.assertFalse(
+                os.path.exists('localhost/Python_logo_100x100.jpg'))
+            self.assertFalse(os.path.exists('localhost/subdir'))
+            with open(stats_file) as f:
+                stats = json.load(f)
+            self.assertEqual(stats['counters']['unwanted_type'], 1)
+            if head:
+                self.assertGreater(stats['phases']['head']['count'], 0)
+                self.assertEqual(stats['counters']['documents'],
+                                 stats['counters']['urls'] - 1,
+                                 "the image is never fetched")
+            shutil.rmtree('localhost')
+
+    def test_resume(self):
+        self.resume_from_journal()
+
+    def test_resume_with_workers(self):
+        self.resume_from_journal(workers=4)
+
+    def test_incremental_recrawl(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            manifest = Manifest(os.path.join(tmpdir, 'manifest'))
+            pycrawl.download_site('http://localhost:8000', manifest=manifest)
+            entry = manifest.get('http://localhost:8000')
+            self.assertIsNotNone(entry.last_modified)
+            self.assertIn('local-relative.html', entry.links)
+
+            # mark the local copy, and remove a page linked from it
+            with open('localhost/__root__', 'w') as f:
+                f.write('local copy')
+            os.remove('localhost/local-relative.html')
+
+            pycrawl.download_site('http://localhost:8000', manifest=manifest)
+            manifest.close()
+            with open('localhost/__root__') as f:
+                self.assertEqual(f.read(), 'local copy',
+                                 "unmodified page is not downloaded again")
+            self.assertTrue(os.path.isfile('localhost/local-relative.html'),
+                            "links of unmodified page are still followed")
+        finally:
+            shutil.rmtree(tmpdir)
+            shutil.rmtree('localhost', ignore_errors=True)
+
+    def test_content_store(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            store = ContentStore(os.path.join(tmpdir, 'store'))
+            pycrawl.download_site('http://localhost:8000', store=store)
+            store.close()
+            root = 'localhost/__root__'
+            self.assertTrue(os.path.isfile(root))
+            self.assertTrue(os.path.samefile(
+                root, store.blob_path(file_sha256(root))))
+        finally:
+            shutil.rmtree(tmpdir)
+            shutil.rmtree('localhost', ignore_errors=True)
+
+    def test_pack_store(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmpdir, 'site.pack')
+            store = PackStore(path)
+            pycrawl.download_site('http://localhost:8000', store=store)
+            store.close()
+            self.assertFalse(os.path.exists('localhost'),
+                             "no files are written outside the pack")
+            with PackReader(path) as reader:
+                root = reader.get('http://localhost:8000')
+                self.assertIn(b'http://localhost:8000/local-explicit.html',
+                              root, "links are not rewritten")
+                self.assertIn('http://localhost:8000/local-relative.html',
+                              reader)
+        finally:
+            shutil.rmtree(tmpdir)
+
+
+class TestStreaming(unittest.TestCase):
+
+    def test_parse_size(self):
+        self.assertEqual(pycrawl.parse_size('512'), 512)
+        self.assertEqual(pycrawl.parse_size('64k'), 64 * 1024)
+        self.assertEqual(pycrawl.parse_size('1.5M'), 1536 * 1024)
+
+    def test_is_html(self):
+        self.assertTrue(pycrawl.is_html('text/html'))
+        self.assertTrue(pycrawl.is_html('text/html; charset=utf-8'))
+        self.assertTrue(pycrawl.is_html('Text/HTML;charset="UTF-8"'))
+        self.assertTrue(pycrawl.is_html('application/xhtml+xml'))
+        self.assertFalse(pycrawl.is_html('text/plain'))
+        self.assertFalse(pycrawl.is_html(''))
+
+    def test_parse_path_weight(self):
+        self.assertEqual(pycrawl.parse_path_weight('^/a=b/=2.5'),
+                         ('^/a=b/', 2.5))
+        self.assertRaises(ValueError, pycrawl.parse_path_weight, '2.5')
+        self.assertRaises(ValueError, pycrawl.parse_path_weight, '[=1')
+
+    def test_limit_size(self):
+        chunks = [b'abc', b'def', b'ghi']
+        self.assertEqual(list(pycrawl.limit_size(chunks, 9)), chunks)
+        self.assertRaises(pycrawl.BodyTooLarge, list,
+                          pycrawl.limit_size(chunks, 8))
+
+    def test_check_content_length(self):
+        pycrawl.check_content_length('100', 100)
+        pycrawl.check_content_length(None, 100)
+        pycrawl.check_content_length('100', None)
+        self.assertRaises(pycrawl.BodyTooLarge,
+                          pycrawl.check_content_length, '101', 100)
+
+    def test_limit_time(self):
+        chunks = [b'abc', b'def']
+        self.assertEqual(
+            list(pycrawl.limit_time(chunks, time.time() + 60)), chunks)
+        self.assertRaises(pycrawl.Timeout, list,
+                          pycrawl.limit_time(chunks, time.time() - 1))
+
+    def test_check_response(self):
+        retry = RetryPolicy(retries=1)
+        breakers = CircuitBreakers(threshold=2)
+        with self.assertRaises(RetryLater) as cm:
+            pycrawl.check_response('http://a/1', 503,
+                                   {'retry-after': '7'}, retry, breakers)
+        self.assertEqual(cm.exception.delay, 7.0)
+        # retried enough: kept as it is
+        pycrawl.check_response('http://a/1', 503, {}, retry, breakers)
+        self.assertTrue(breakers.is_tripped('a'))
+        pycrawl.check_response('http://a/1', 404, {}, retry, breakers)
+        self.assertFalse(breakers.is_tripped('a'))
+
+    def test_get_absolute_links(self):
+        stats = CrawlStats()
+        self.assertEqual(
+            pycrawl.get_absolute_links(['/a', 'http://[::1/x', 'b#c'],
+                                       'https://h/d/', stats),
+            ['https://h/a', 'https://h/d/b'])
+        self.assertEqual(
+            pycrawl.get_absolute_links(['../c', '//g/e', 'http://i/f?x'],
+                                       'http://h/d/page.html'),
+            ['http://h/c', 'http://g/e', 'http://i/f'])
+        self.assertEqual(stats.counter('bad_links'), 1)
+
+    def test_read_prefix(self):
+        prefix, rest = pycrawl.read_prefix([b'ab', b'cd'], 4)
+        self.assertEqual(prefix, b'abcd')
+        self.assertIsNone(rest)
+        prefix, rest = pycrawl.read_prefix([b'ab', b'cd', b'ef'], 3)
+        self.assertEqual(prefix, b'abcd')
+        self.assertEqual(list(rest), [b'ef'])
+
+    def test_encode_html(self):
+        self.assertEqual(pycrawl.encode_html(u'caf\xe9', None),
+                         b'caf\xc3\xa9')
+        self.assertEqual(pycrawl.encode_html(u'caf\xe9', 'latin-1'),
+                         b'caf\xe9')
+        self.assertEqual(pycrawl.encode_html(u'\u2603', 'latin-1'),
+                         b'&#9731;')
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_retry
+----------------------------------
+
+Tests for `pycrawl.retry` module.
+"""
+
+import unittest
+
+from pycrawl.metrics import CrawlStats
+from pycrawl.retry import (CircuitBreakers, RetryLater, RetryPolicy,
+                           parse_retry_after)
+
+
+class FakeClock(object):
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestParseRetryAfter(unittest.TestCase):
+
+    def test_seconds(self):
+        self.assertEqual(parse_retry_after('120'), 120.0)
+        self.assertEqual(parse_retry_after(' 0 '), 0.0)
+
+    def test_date(self):
+        # 1994-11-06 08:49:37 UTC
+        now = 784111777.0
+        self.assertEqual(
+            parse_retry_after('Sun, 06 Nov 1994 08:50:07 GMT', now), 30.0)
+        self.assertEqual(
+            parse_retry_after('Sun, 06 Nov 1994 08:49:07 GMT', now), 0.0)
+
+    def test_invalid(self):
+        self.assertIsNone(parse_retry_after(None))
+        self.assertIsNone(parse_retry_after(''))
+        self.assertIsNone(parse_retry_after('soon'))
+        self.assertIsNone(parse_retry_after('-5'))
+
+
+class TestRetryPolicy(unittest.TestCase):
+
+    def test_delay(self):
+        policy = RetryPolicy(backoff=2.0, max_delay=10.0,
+                             random=lambda: 1.0)
+        self.assertEqual([policy.delay(n) for n in range(1, 5)],
+                         [2.0, 4.0, 8.0, 10.0])
+        jittered = RetryPolicy(backoff=2.0, random=lambda: 0.0)
+        self.assertEqual(jittered.delay(2), 2.0)
+
+    def test_retry_after(self):
+        policy = RetryPolicy(backoff=1.0, max_delay=10.0,
+                             random=lambda: 1.0)
+        self.assertEqual(policy.delay(1, retry_after=5.0), 5.0)
+        self.assertEqual(policy.delay(3, retry_after=0.0), 4.0)
+        self.assertIsNone(policy.delay(1, retry_after=11.0))
+
+    def test_check(self):
+        policy = RetryPolicy(retries=2, backoff=1.0, random=lambda: 1.0)
+        delays = []
+        for _ in range(2):
+            with self.assertRaises(RetryLater) as cm:
+                policy.check('http://a/1', 'HTTP status 503')
+            delays.append(cm.exception.delay)
+        self.assertEqual(delays, [1.0, 2.0])
+        # out of retries
+        policy.check('http://a/1', 'HTTP status 503')
+        # and a later failure starts again
+        self.assertRaises(RetryLater, policy.check, 'http://a/1', 'again')
+
+    def test_succeeded(self):
+        policy = RetryPolicy(retries=1)
+        self.assertRaises(RetryLater, policy.check, 'http://a/1', 'error')
+        policy.succeeded('http://a/1')
+        self.assertRaises(RetryLater, policy.check, 'http://a/1', 'error')
+
+    def test_long_retry_after(self):
+        policy = RetryPolicy(max_delay=10.0)
+        policy.check('http://a/1', 'HTTP status 429', retry_after=3600.0)
+
+    def test_no_retries(self):
+        RetryPolicy(retries=0).check('http://a/1', 'error')
+
+
+class TestCircuitBreakers(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.stats = CrawlStats()
+        self.breakers = CircuitBreakers(threshold=3, cooldown=10.0,
+                                        max_cooldown=30.0, max_opens=3,
+                                        stats=self.stats, clock=self.clock)
+
+    def fail(self, times=1):
+        for _ in range(times):
+            self.breakers.record('a', False)
+
+    def test_opens(self):
+        self.fail(2)
+        self.assertIsNone(self.breakers.open_until('a'))
+        self.assertFalse(self.breakers.is_tripped('a'))
+        self.fail()
+        self.assertEqual(self.breakers.open_until('a'), 1010.0)
+        self.assertTrue(self.breakers.is_tripped('a'))
+        self.assertEqual(self.stats.counter('circuits_opened'), 1)
+        self.assertIsNone(self.breakers.open_until('b'))
+
+    def test_success_resets(self):
+        self.fail(2)
+        self.breakers.record('a', True)
+        self.fail(2)
+        self.assertIsNone(self.breakers.open_until('a'))
+        self.fail()
+        self.clock.now += 10.0
+        self.breakers.record('a', True)
+        self.assertFalse(self.breakers.is_tripped('a'))
+        self.assertIsNone(self.breakers.open_until('a'))
+
+    def test_reopens(self):
+        self.fail(3)
+        # failures of requests sent before it opened don't count
+        self.fail(5)
+        self.assertEqual(self.breakers.open_until('a'), 1010.0)
+        # the trial request fails: open for twice as long
+        self.clock.now = 1010.0
+        self.fail()
+        self.assertEqual(self.breakers.open_until('a'), 1030.0)
+        self.clock.now = 1030.0
+        self.fail()
+        self.assertEqual(self.breakers.open_until('a'), 1060.0)
+        self.assertFalse(self.breakers.is_abandoned('a'))
+        self.clock.now = 1060.0
+        self.fail()
+        self.assertTrue(self.breakers.is_abandoned('a'))
+        self.assertEqual(self.stats.counter('circuits_opened'), 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
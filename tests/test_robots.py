@@ -0,0 +1,177 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_robots
+----------------------------------
+
+Tests for `pycrawl.robots` module.
+"""
+
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+try:  # Python 3
+    from urllib import robotparser
+except ImportError:  # Python 2
+    import robotparser
+
+from requests.exceptions import ConnectionError
+
+from pycrawl.robots import RobotsCache, get_crawl_delay, parse_robots_txt
+
+
+ROBOTS_TXT = "User-agent: *\nDisallow: /private\n"
+
+
+class FakeResponse(object):
+    def __init__(self, status_code, text):
+        self.status_code = status_code
+        self.text = text
+
+
+class FakeSession(object):
+    """Serves robots.txt files from a dict, counting requests."""
+
+    def __init__(self, files, delay=0):
+        self.files = files
+        self.delay = delay
+        self.requests = []
+        self.lock = threading.Lock()
+
+    def get(self, url):
+        with self.lock:
+            self.requests.append(url)
+        time.sleep(self.delay)
+        if url not in self.files:
+            return FakeResponse(404, "not found")
+        if self.files[url] is ConnectionError:
+            raise ConnectionError()
+        if isinstance(self.files[url], int):
+            return FakeResponse(self.files[url], "error")
+        return FakeResponse(200, self.files[url])
+
+
+class TestRobotsCache(unittest.TestCase):
+
+    def setUp(self):
+        self.session = FakeSession({'http://a/robots.txt': ROBOTS_TXT,
+                                    'http://down/robots.txt': ConnectionError,
+                                    'http://busy/robots.txt': 503})
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_rules_applied(self):
+        cache = RobotsCache()
+        self.assertTrue(cache.can_fetch('http://a/public', self.session))
+        self.assertFalse(cache.can_fetch('http://a/private', self.session))
+
+    def test_missing_or_unreachable_allows_all(self):
+        cache = RobotsCache()
+        self.assertTrue(cache.can_fetch('http://b/private', self.session))
+        self.assertTrue(cache.can_fetch('http://down/private', self.session))
+
+    def test_fetched_once(self):
+        cache = RobotsCache()
+        for path in ['/', '/private', '/x', '/y']:
+            cache.can_fetch('http://a' + path, self.session)
+        self.assertEqual(self.session.requests, ['http://a/robots.txt'])
+
+    def test_fetched_once_across_threads(self):
+        session = FakeSession({'http://a/robots.txt': ROBOTS_TXT}, delay=0.05)
+        cache = RobotsCache()
+        threads = [threading.Thread(target=cache.can_fetch,
+                                    args=('http://a/{}'.format(i), session))
+                   for i in range(10)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(session.requests, ['http://a/robots.txt'])
+
+    def test_expired_entries_refetched(self):
+        cache = RobotsCache(ttl=60)
+        cache.store('http://a/robots.txt', ROBOTS_TXT,
+                    fetched_at=time.time() - 120)
+        cache.can_fetch('http://a/', self.session)
+        self.assertEqual(self.session.requests, ['http://a/robots.txt'])
+
+    def test_save_and_load(self):
+        path = os.path.join(self.tmpdir, 'robots.json')
+        cache = RobotsCache(path=path)
+        cache.can_fetch('http://a/', self.session)
+        cache.can_fetch('http://b/', self.session)
+        cache.save()
+
+        loaded = RobotsCache(path=path)
+        self.assertEqual(len(loaded), 2)
+        self.assertFalse(loaded.can_fetch('http://a/private', self.session))
+        self.assertTrue(loaded.can_fetch('http://b/private', self.session))
+        self.assertEqual(len(self.session.requests), 2,
+                         "loaded entries are not fetched again")
+
+    def test_failures_not_saved(self):
+        path = os.path.join(self.tmpdir, 'robots.json')
+        cache = RobotsCache(path=path)
+        for host in ['a', 'b', 'down', 'busy']:
+            self.assertTrue(cache.can_fetch('http://{}/'.format(host),
+                                            self.session))
+        cache.save()
+        with open(path) as f:
+            saved = json.load(f)
+        self.assertEqual(sorted(saved),
+                         ['http://a/robots.txt', 'http://b/robots.txt'])
+
+    def test_failures_expire_sooner(self):
+        cache = RobotsCache(ttl=60, failure_ttl=-1)
+        for _ in range(2):
+            cache.can_fetch('http://busy/private', self.session)
+            cache.can_fetch('http://b/private', self.session)
+        self.assertEqual(self.session.requests,
+                         ['http://busy/robots.txt', 'http://b/robots.txt',
+                          'http://busy/robots.txt'])
+
+    def test_unparseable_disallows_all(self):
+        def parse(self, lines):
+            raise ValueError("garbled")
+        path = os.path.join(self.tmpdir, 'robots.json')
+        cache = RobotsCache(path=path, failure_ttl=-1)
+        original = robotparser.RobotFileParser.parse
+        robotparser.RobotFileParser.parse = parse
+        try:
+            self.assertFalse(cache.can_fetch('http://a/public', self.session))
+        finally:
+            robotparser.RobotFileParser.parse = original
+        cache.save()
+        with open(path) as f:
+            self.assertEqual(json.load(f), {}, "the failure isn't saved")
+        self.assertTrue(cache.can_fetch('http://a/public', self.session),
+                        "and is tried again after failure_ttl")
+        self.assertEqual(len(self.session.requests), 2)
+
+
+class TestCrawlDelay(unittest.TestCase):
+
+    def delay(self, text):
+        return get_crawl_delay(parse_robots_txt('http://a/robots.txt', text))
+
+    @unittest.skipIf(not hasattr(robotparser.RobotFileParser, 'crawl_delay'),
+                     "Python 2's robotparser ignores delays")
+    def test_crawl_delay(self):
+        self.assertIsNone(self.delay(None))
+        self.assertIsNone(self.delay(ROBOTS_TXT))
+        self.assertEqual(self.delay("User-agent: *\nCrawl-delay: 2\n"), 2.0)
+        self.assertEqual(self.delay("User-agent: *\nRequest-rate: 1/5\n"),
+                         5.0)
+        self.assertEqual(self.delay("User-agent: *\nCrawl-delay: 2\n"
+                                    "Request-rate: 3/3\n"), 2.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,238 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_scheduler
+----------------------------------
+
+Tests for `pycrawl.scheduler` module.
+"""
+
+import unittest
+try:  # Python 3
+    from urllib import robotparser
+except ImportError:  # Python 2
+    import robotparser
+
+from pycrawl.frontier import Frontier
+from pycrawl.retry import CircuitBreakers
+from pycrawl.robots import RobotsCache
+from pycrawl.scheduler import CrawlBudget, HostScheduler, TokenBucket
+
+
+# Python 2's robotparser doesn't read Crawl-delay
+needs_crawl_delay = unittest.skipIf(
+    not hasattr(robotparser.RobotFileParser, 'crawl_delay'),
+    "Python 2's robotparser ignores delays")
+
+
+class FakeClock(object):
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_frontier(urls):
+    frontier = Frontier()
+    for url in urls:
+        frontier.add(url, 0)
+    return frontier
+
+
+class TestTokenBucket(unittest.TestCase):
+
+    def test_interval(self):
+        bucket = TokenBucket(2.0, now=0.0)
+        self.assertEqual(bucket.ready_at(0.0), 0.0)
+        bucket.take(0.0)
+        self.assertEqual(bucket.ready_at(0.5), 2.0)
+        self.assertEqual(bucket.ready_at(2.0), 2.0)
+
+    def test_burst(self):
+        bucket = TokenBucket(1.0, burst=3, now=0.0)
+        for _ in range(3):
+            self.assertEqual(bucket.ready_at(0.0), 0.0)
+            bucket.take(0.0)
+        self.assertEqual(bucket.ready_at(0.0), 1.0)
+        # refills no further than the burst size
+        self.assertEqual(bucket.ready_at(100.0), 100.0)
+        for _ in range(3):
+            bucket.take(100.0)
+        self.assertEqual(bucket.ready_at(100.0), 101.0)
+
+    def test_unlimited(self):
+        bucket = TokenBucket(0.0, now=0.0)
+        for _ in range(10):
+            bucket.take(0.0)
+        self.assertEqual(bucket.ready_at(0.0), 0.0)
+
+
+class TestHostScheduler(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+
+    def take_all(self, scheduler):
+        urls = []
+        while True:
+            item, wait = scheduler.take()
+            if item is None:
+                return urls, wait
+            urls.append(item[0])
+            scheduler.done(item[2])
+
+    def test_delay_per_host(self):
+        scheduler = HostScheduler(
+            make_frontier(['http://a/1', 'http://a/2', 'http://b/1',
+                           'http://a/3']),
+            delay=2.0, clock=self.clock)
+        # one from each host, then wait for a's delay
+        urls, wait = self.take_all(scheduler)
+        self.assertEqual(urls, ['http://a/1', 'http://b/1'])
+        self.assertEqual(wait, 2.0)
+        self.clock.now += 2.0
+        self.assertEqual(self.take_all(scheduler), (['http://a/2'], 2.0))
+        self.clock.now += 2.0
+        self.assertEqual(self.take_all(scheduler), (['http://a/3'], None))
+        self.assertEqual(len(scheduler), 0)
+        self.assertEqual(scheduler.hosts(), 2)
+
+    def test_hosts_take_turns(self):
+        scheduler = HostScheduler(
+            make_frontier(['http://a/1', 'http://a/2', 'http://b/1']),
+            clock=self.clock)
+        self.assertEqual(self.take_all(scheduler),
+                         (['http://a/1', 'http://b/1', 'http://a/2'], None))
+
+    def test_per_host_limit(self):
+        scheduler = HostScheduler(
+            make_frontier(['http://a/1', 'http://a/2', 'http://b/1']),
+            per_host_limit=1, clock=self.clock)
+        first, _ = scheduler.take()
+        second, _ = scheduler.take()
+        self.assertEqual(second[0], 'http://b/1')
+        # a is busy, and b has nothing more
+        self.assertEqual(scheduler.take(), (None, None))
+        scheduler.done(first[2])
+        self.assertEqual(scheduler.take()[0][0], 'http://a/2')
+
+    @needs_crawl_delay
+    def test_robots_delay(self):
+        robots_cache = RobotsCache(ttl=None)
+        scheduler = HostScheduler(
+            make_frontier(['http://a/1', 'http://a/2', 'http://a/3']),
+            delay=1.0, per_host_limit=4, robots_cache=robots_cache,
+            clock=self.clock)
+        # one request at a time until robots.txt is known
+        first, _ = scheduler.take()
+        self.clock.now += 5.0
+        self.assertEqual(scheduler.take(), (None, None))
+        robots_cache.store('http://a/robots.txt',
+                           'User-agent: *\nCrawl-delay: 3\n')
+        scheduler.done(first[2])
+        self.assertEqual(scheduler.take()[0][0], 'http://a/2')
+        self.assertEqual(scheduler.take(), (None, 3.0))
+
+    @needs_crawl_delay
+    def test_max_delay(self):
+        robots_cache = RobotsCache(ttl=None)
+        robots_cache.store('http://a/robots.txt',
+                           'User-agent: *\nCrawl-delay: 3600\n')
+        scheduler = HostScheduler(
+            make_frontier(['http://a/1', 'http://a/2']),
+            robots_cache=robots_cache, max_delay=10.0, clock=self.clock)
+        self.assertEqual(self.take_all(scheduler), (['http://a/1'], 10.0))
+
+    def test_budget(self):
+        budget = CrawlBudget(max_pages=2, clock=self.clock)
+        scheduler = HostScheduler(
+            make_frontier(['http://a/1', 'http://b/1', 'http://a/2']),
+            budget=budget, clock=self.clock)
+        self.assertEqual(self.take_all(scheduler),
+                         (['http://a/1', 'http://b/1'], None))
+        self.assertEqual(budget.exhausted, '2 pages')
+        self.assertEqual(len(scheduler), 1)
+
+    def test_retry(self):
+        scheduler = HostScheduler(
+            make_frontier(['http://a/1', 'http://a/2', 'http://b/1']),
+            clock=self.clock)
+        (url, depth, host), _ = scheduler.take()
+        self.assertEqual(url, 'http://a/1')
+        scheduler.retry(url, depth, host, 5.0)
+        scheduler.done(host)
+        # a is held off, but b isn't
+        self.assertEqual(self.take_all(scheduler), (['http://b/1'], 5.0))
+        self.clock.now += 5.0
+        self.assertEqual(self.take_all(scheduler),
+                         (['http://a/2', 'http://a/1'], None))
+
+    def test_circuit_breakers(self):
+        breakers = CircuitBreakers(threshold=1, cooldown=10.0, max_opens=1,
+                                   clock=self.clock)
+        scheduler = HostScheduler(
+            make_frontier(['http://a/{}'.format(i) for i in range(5)] +
+                          ['http://b/1']),
+            per_host_limit=4, breakers=breakers, clock=self.clock)
+        first, _ = scheduler.take()
+        breakers.record('a', False)
+        scheduler.done(first[2])
+        self.assertEqual(self.take_all(scheduler), (['http://b/1'], 10.0))
+        # once the cooldown is over, one request at a time
+        self.clock.now += 10.0
+        trial, _ = scheduler.take()
+        self.assertEqual(trial[0], 'http://a/1')
+        self.assertEqual(scheduler.take(), (None, None))
+        # the trial fails, and a is given up on
+        breakers.record('a', False)
+        scheduler.done(trial[2])
+        self.clock.now += 100.0
+        self.assertEqual(self.take_all(scheduler), ([], None))
+        self.assertEqual(scheduler.dropped, 3)
+        self.assertEqual(len(scheduler), 0)
+
+
+class TestCrawlBudget(unittest.TestCase):
+
+    def test_pages(self):
+        budget = CrawlBudget(max_pages=2)
+        self.assertTrue(budget.take_page())
+        self.assertTrue(budget.take_page())
+        self.assertFalse(budget.take_page())
+        self.assertEqual(budget.pages, 2)
+
+    def test_bytes(self):
+        budget = CrawlBudget(max_bytes=1000)
+        budget.on_stat('bytes_downloaded', 600)
+        budget.on_stat('bytes_written', 600)
+        self.assertTrue(budget.take_page())
+        budget.on_stat('bytes_downloaded', 600)
+        self.assertFalse(budget.take_page())
+        self.assertEqual(budget.exhausted, '1000 bytes')
+
+    def test_time(self):
+        clock = FakeClock()
+        budget = CrawlBudget(max_time=30, clock=clock)
+        self.assertTrue(budget.take_page())
+        clock.now += 30
+        self.assertFalse(budget.take_page())
+        self.assertEqual(budget.exhausted, '30 seconds')
+
+    def test_unlimited(self):
+        budget = CrawlBudget()
+        for _ in range(100):
+            self.assertTrue(budget.take_page())
+
+    def test_stop(self):
+        budget = CrawlBudget()
+        self.assertTrue(budget.take_page())
+        budget.stop("enough")
+        self.assertFalse(budget.take_page())
+        self.assertEqual(budget.exhausted, 'enough')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_scope
+----------------------------------
+
+Tests for `pycrawl.scope` module.
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from pycrawl.scope import CrawlScope, parse_content_type, read_seed_file
+
+
+class TestCrawlScope(unittest.TestCase):
+
+    def test_seed_hosts(self):
+        scope = CrawlScope.from_seeds(['http://a.com/', 'http://b.com:8000/x'])
+        self.assertTrue(scope.allows('http://a.com/page'))
+        self.assertTrue(scope.allows('http://A.com:81/page'),
+                        "a bare host name allows any port")
+        self.assertTrue(scope.allows('http://b.com:8000/'))
+        self.assertFalse(scope.allows('http://b.com/'))
+        self.assertFalse(scope.allows('http://c.com/'))
+        self.assertFalse(scope.allows('http://www.a.com/'))
+
+    def test_suffixes(self):
+        scope = CrawlScope(hosts=['a.com'], suffixes=['.example.org'])
+        self.assertTrue(scope.allows('http://example.org/'))
+        self.assertTrue(scope.allows('https://www.example.org/'))
+        self.assertTrue(scope.allows('http://x.y.example.org:8080/'))
+        self.assertFalse(scope.allows('http://badexample.org/'))
+        self.assertTrue(scope.allows('http://a.com/'))
+
+    def test_url_filters(self):
+        scope = CrawlScope(hosts=['a.com'], include=[r'/docs/', r'/blog/'],
+                           exclude=[r'/blog/drafts/'],
+                           deny_extensions=['zip', '.ISO'])
+        self.assertTrue(scope.allows('http://a.com/docs/intro.html'))
+        self.assertTrue(scope.allows('http://a.com/blog/post'))
+        self.assertFalse(scope.allows('http://a.com/about'))
+        self.assertFalse(scope.allows('http://a.com/blog/drafts/x'))
+        self.assertFalse(scope.allows('http://a.com/docs/dist.ZIP'))
+        self.assertFalse(scope.allows('http://a.com/docs/disk.iso'))
+        self.assertTrue(scope.allows('http://a.com/docs/zip'))
+        self.assertFalse(scope.allows('http://b.com/docs/'))
+
+    def test_content_types(self):
+        self.assertTrue(CrawlScope().allows_type('anything/at-all'))
+        scope = CrawlScope(content_types=['text/html', 'Image/*'])
+        self.assertTrue(scope.filters_types)
+        self.assertTrue(scope.allows_type('text/html; charset=UTF-8'))
+        self.assertTrue(scope.allows_type('TEXT/HTML'))
+        self.assertTrue(scope.allows_type('image/png'))
+        self.assertFalse(scope.allows_type('text/plain'))
+        self.assertFalse(scope.allows_type('application/zip'))
+        self.assertFalse(scope.allows_type(None))
+        self.assertTrue(CrawlScope(content_types=['*/*']).allows_type(None))
+        self.assertTrue(CrawlScope(content_types=[
+            'application/octet-stream']).allows_type(''))
+
+    def test_parse_content_type(self):
+        self.assertEqual(parse_content_type('text/html'), ('text/html', {}))
+        self.assertEqual(parse_content_type('Text/HTML; Charset="UTF-8"'),
+                         ('text/html', {'charset': 'UTF-8'}))
+        self.assertEqual(
+            parse_content_type('multipart/mixed; boundary="a;b"; x=1'),
+            ('multipart/mixed', {'boundary': 'a;b', 'x': '1'}))
+        self.assertEqual(parse_content_type(None), ('', {}))
+
+    def test_read_seed_file(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmpdir, 'seeds.txt')
+            with open(path, 'w') as f:
+                f.write("# our sites\nhttp://a.com/\n\n  b.com  \n")
+            self.assertEqual(read_seed_file(path),
+                             ['http://a.com/', 'b.com'])
+        finally:
+            shutil.rmtree(tmpdir)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_session
+----------------------------------
+
+Tests for `pycrawl.session` module.
+"""
+
+import time
+import unittest
+
+from requests.adapters import HTTPAdapter
+
+from tests.run_server import run_server, stop_server
+from pycrawl.session import CrawlSession, DEFAULT_TIMEOUT
+
+
+class RecordingAdapter(HTTPAdapter):
+    """Adapter that records the timeout of each request it sends."""
+
+    def __init__(self, *args, **kwargs):
+        super(RecordingAdapter, self).__init__(*args, **kwargs)
+        self.timeouts = []
+
+    def send(self, request, **kwargs):
+        self.timeouts.append(kwargs.get('timeout'))
+        return super(RecordingAdapter, self).send(request, **kwargs)
+
+
+class TestCrawlSession(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = run_server()
+        time.sleep(0.5)  # give it time to start up
+
+    @classmethod
+    def tearDownClass(cls):
+        stop_server(cls.server)
+
+    def test_pool_size(self):
+        session = CrawlSession(pool_size=7)
+        adapter = session.get_adapter('http://localhost:8000/')
+        self.assertEqual(adapter._pool_maxsize, 7)
+
+    def test_default_timeout(self):
+        session = CrawlSession()
+        adapter = RecordingAdapter()
+        session.mount('http://', adapter)
+        session.get('http://localhost:8000/')
+        session.get('http://localhost:8000/', timeout=3)
+        self.assertEqual(adapter.timeouts, [DEFAULT_TIMEOUT, 3])
+
+    def test_pool_shared_between_requests(self):
+        session = CrawlSession()
+        for name in ['index.html', 'depth2.html', 'local-relative.html']:
+            response = session.get('http://localhost:8000/' + name)
+            self.assertEqual(response.status_code, 200)
+        adapter = session.get_adapter('http://localhost:8000/')
+        pools = adapter.poolmanager.pools
+        self.assertEqual(len(pools), 1)
+        pool = pools[list(pools.keys())[0]]
+        # the test server speaks HTTP/1.0, so it closes each connection,
+        # but all requests should still have gone through one pool
+        self.assertEqual(pool.num_requests, 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
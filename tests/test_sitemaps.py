@@ -0,0 +1,185 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_sitemaps
+----------------------------------
+
+Tests for `pycrawl.sitemaps` module.
+"""
+
+import gzip
+import io
+import unittest
+
+from pycrawl.robots import parse_robots_txt
+from pycrawl.sitemaps import (SitemapError, SitemapParser, SitemapWalk,
+                              get_sitemap_urls, parse_lastmod,
+                              read_sitemaps)
+
+
+URLSET = b"""<?xml version="1.0" encoding="UTF-8"?>
+<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">
+  <url><loc>http://a/1</loc><lastmod>2024-01-02</lastmod></url>
+  <url><loc> http://a/2 </loc><changefreq>daily</changefreq></url>
+</urlset>
+"""
+
+INDEX = b"""<?xml version="1.0" encoding="UTF-8"?>
+<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">
+  <sitemap><loc>http://a/pages.xml.gz</loc></sitemap>
+  <sitemap><loc>http://a/index.xml</loc></sitemap>
+</sitemapindex>
+"""
+
+
+def gzipped(data):
+    buf = io.BytesIO()
+    with gzip.GzipFile(fileobj=buf, mode='wb') as f:
+        f.write(data)
+    return buf.getvalue()
+
+
+def parse_in_chunks(data, size, parser=None):
+    parser = parser or SitemapParser()
+    entries = []
+    for i in range(0, len(data), size):
+        entries.extend(parser.feed(data[i:i + size]))
+    entries.extend(parser.close())
+    return entries
+
+
+class FakeResponse(object):
+
+    def __init__(self, status_code, content=b''):
+        self.status_code = status_code
+        self.content = content
+        self.closed = False
+
+    def iter_content(self, chunk_size):
+        for i in range(0, len(self.content), chunk_size):
+            yield self.content[i:i + chunk_size]
+
+    def close(self):
+        self.closed = True
+
+
+class FakeSession(object):
+    """Serves files from a dict, recording requests."""
+
+    def __init__(self, files):
+        self.files = files
+        self.requests = []
+
+    def get(self, url, stream=False):
+        self.requests.append(url)
+        if url in self.files:
+            return FakeResponse(200, self.files[url])
+        return FakeResponse(404)
+
+
+class TestParseLastmod(unittest.TestCase):
+
+    def test_formats(self):
+        day = 1704153600.0  # 2024-01-02T00:00:00Z
+        self.assertEqual(parse_lastmod('2024-01-02'), day)
+        self.assertEqual(parse_lastmod('2024-01-02T01:30Z'), day + 5400)
+        self.assertEqual(parse_lastmod('2024-01-02T01:30:15.5+01:00'),
+                         day + 1815)
+        self.assertEqual(parse_lastmod('2024-01-02T00:00:00-0100'),
+                         day + 3600)
+        self.assertEqual(parse_lastmod(' 2024 '), 1704067200.0)
+
+    def test_invalid(self):
+        self.assertIsNone(parse_lastmod(None))
+        self.assertIsNone(parse_lastmod('yesterday'))
+        self.assertIsNone(parse_lastmod('2024-13-01'))
+
+
+class TestSitemapParser(unittest.TestCase):
+
+    def test_urlset(self):
+        expected = [('url', 'http://a/1', 1704153600.0),
+                    ('url', 'http://a/2', None)]
+        for size in [1, 7, len(URLSET)]:
+            self.assertEqual(parse_in_chunks(URLSET, size), expected)
+
+    def test_gzip(self):
+        parser = SitemapParser()
+        self.assertEqual(len(parse_in_chunks(gzipped(URLSET), 5, parser)),
+                         2)
+        self.assertEqual(parser.size, len(URLSET))
+
+    def test_index(self):
+        self.assertEqual([kind for kind, _, _ in parse_in_chunks(INDEX, 64)],
+                         ['sitemap', 'sitemap'])
+
+    def test_memory_stays_flat(self):
+        parser = SitemapParser()
+        parser.feed(URLSET)
+        self.assertEqual(len(parser._root), 0)
+
+    def test_too_large(self):
+        self.assertRaises(SitemapError, parse_in_chunks,
+                          gzipped(URLSET * 10), 1000,
+                          SitemapParser(max_size=len(URLSET)))
+
+    def test_not_a_sitemap(self):
+        self.assertRaises(SitemapError, parse_in_chunks,
+                          b'<html><body></body></html>', 100)
+        self.assertRaises(SitemapError, parse_in_chunks,
+                          URLSET[:-20], 100)
+        self.assertRaises(SitemapError, parse_in_chunks, b'', 100)
+
+
+class TestDiscovery(unittest.TestCase):
+
+    def test_from_robots(self):
+        parser = parse_robots_txt('http://a/robots.txt',
+                                  'Sitemap: http://a/s1.xml\n'
+                                  'Sitemap: http://b/s2.xml\n')
+        if not hasattr(parser, 'site_maps'):
+            self.skipTest("robotparser can't read Sitemap lines")
+        self.assertEqual(get_sitemap_urls('http://a/x?y', parser),
+                         ['http://a/s1.xml', 'http://b/s2.xml'])
+
+    def test_default(self):
+        self.assertEqual(get_sitemap_urls('http://a/x?y'),
+                         ['http://a/sitemap.xml'])
+        parser = parse_robots_txt('http://a/robots.txt',
+                                  'User-agent: *\nDisallow: /sitemap\n')
+        self.assertEqual(get_sitemap_urls('http://a/', parser), [])
+
+
+class TestReadSitemaps(unittest.TestCase):
+
+    def test_follows_indexes(self):
+        session = FakeSession({
+            'http://a/index.xml': INDEX,
+            'http://a/pages.xml.gz': gzipped(URLSET),
+        })
+        pages = list(read_sitemaps(['http://a/index.xml',
+                                    'http://a/missing.xml'], session))
+        self.assertEqual(pages, [('http://a/1', 1704153600.0),
+                                 ('http://a/2', None)])
+        # the index listing itself is not read again
+        self.assertEqual(session.requests, ['http://a/index.xml',
+                                            'http://a/missing.xml',
+                                            'http://a/pages.xml.gz'])
+
+    def test_max_sitemaps(self):
+        walk = SitemapWalk(['http://a/1.xml'], max_sitemaps=2)
+        urls = []
+        for url in walk:
+            urls.append(url)
+            walk.pages([('sitemap', url + '.next', None)])
+        self.assertEqual(urls, ['http://a/1.xml', 'http://a/1.xml.next'])
+
+    def test_bad_sitemap(self):
+        session = FakeSession({'http://a/s.xml': URLSET[:-60]})
+        self.assertEqual(list(read_sitemaps(['http://a/s.xml'], session)),
+                         [('http://a/1', 1704153600.0)])
+
+
+if __name__ == '__main__':
+    unittest.main()
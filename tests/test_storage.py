@@ -0,0 +1,217 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_storage
+----------------------------------
+
+Tests for `pycrawl.storage` module.
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from pycrawl.storage import (ContentStore, MirrorStore, PackReader, PackStore,
+                             WarcStore, read_warc_headers, write_chunks)
+
+
+class TestMirrorStore(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_write(self):
+        filename = os.path.join(self.tmpdir, 'site', 'page')
+        self.assertEqual(write_chunks(MirrorStore(), filename,
+                                      [b'ab', b'cd']), 4)
+        with open(filename, 'rb') as f:
+            self.assertEqual(f.read(), b'abcd')
+
+    def test_abort_leaves_nothing(self):
+        filename = os.path.join(self.tmpdir, 'page')
+
+        def chunks():
+            yield b'partial'
+            raise IOError("connection lost")
+        self.assertRaises(IOError, write_chunks, MirrorStore(), filename,
+                          chunks())
+        self.assertEqual(os.listdir(self.tmpdir), [])
+
+
+class TestContentStore(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.root = os.path.join(self.tmpdir, 'store')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def path(self, name):
+        return os.path.join(self.tmpdir, 'site', name)
+
+    def blobs(self, store):
+        return [name for _, _, names in os.walk(os.path.join(store.root,
+                                                             'blobs'))
+                for name in names]
+
+    def test_duplicates_stored_once(self):
+        store = ContentStore(self.root)
+        write_chunks(store, self.path('a'), [b'same ', b'body'])
+        write_chunks(store, self.path('b'), [b'same body'])
+        write_chunks(store, self.path('c'), [b'other body'])
+        store.close()
+        self.assertEqual(len(store), 2)
+        self.assertEqual(len(self.blobs(store)), 2)
+        self.assertTrue(os.path.samefile(self.path('a'), self.path('b')))
+        self.assertFalse(os.path.samefile(self.path('a'), self.path('c')))
+        with open(self.path('b'), 'rb') as f:
+            self.assertEqual(f.read(), b'same body')
+
+    def test_symlinks(self):
+        store = ContentStore(self.root, symlinks=True)
+        write_chunks(store, self.path('a'), [b'body'])
+        store.close()
+        self.assertTrue(os.path.islink(self.path('a')))
+        with open(self.path('a'), 'rb') as f:
+            self.assertEqual(f.read(), b'body')
+
+    def test_relink_replaces_file(self):
+        store = ContentStore(self.root)
+        write_chunks(store, self.path('a'), [b'old'])
+        write_chunks(store, self.path('a'), [b'new'])
+        store.close()
+        with open(self.path('a'), 'rb') as f:
+            self.assertEqual(f.read(), b'new')
+        self.assertEqual(os.listdir(os.path.join(self.tmpdir, 'site')),
+                         ['a'])
+
+    def test_index_reloaded(self):
+        store = ContentStore(self.root)
+        write_chunks(store, self.path('a'), [b'body'])
+        store.close()
+        store = ContentStore(self.root)
+        self.assertEqual(len(store), 1)
+        write_chunks(store, self.path('b'), [b'body'])
+        store.close()
+        self.assertEqual(len(self.blobs(store)), 1)
+        self.assertTrue(os.path.samefile(self.path('a'), self.path('b')))
+
+    def test_spool_to_disk(self):
+        store = ContentStore(self.root, spool_size=4)
+        write_chunks(store, self.path('a'), [b'abc', b'def', b'ghi'])
+        write_chunks(store, self.path('b'), [b'abcdefghi'])
+        store.close()
+        self.assertEqual(len(self.blobs(store)), 1)
+        with open(self.path('b'), 'rb') as f:
+            self.assertEqual(f.read(), b'abcdefghi')
+
+    def test_abort_leaves_nothing(self):
+        store = ContentStore(self.root, spool_size=4)
+
+        def chunks():
+            yield b'more than the spool size'
+            raise IOError("connection lost")
+        self.assertRaises(IOError, write_chunks, store, self.path('a'),
+                          chunks())
+        store.close()
+        self.assertEqual(self.blobs(store), [])
+        self.assertFalse(os.path.exists(self.path('a')))
+
+
+class TestWarcStore(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'crawl.warc')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_records(self):
+        store = WarcStore(self.path, spool_size=4)
+        write_chunks(store, 'site/a', [b'first', b' body'],
+                     url='http://site/a', content_type='text/html')
+        write_chunks(store, 'site/b', [b'xy'], url='http://site/b')
+        store.close()
+        records = list(read_warc_headers(self.path))
+        self.assertEqual([h['warc-type'] for _, h in records],
+                         ['warcinfo', 'resource', 'resource'])
+        offset, headers = records[1]
+        self.assertEqual(headers['warc-target-uri'], 'http://site/a')
+        self.assertEqual(headers['content-type'], 'text/html')
+        self.assertEqual(headers['content-length'], '10')
+        with open(self.path, 'rb') as f:
+            data = f.read()
+        self.assertIn(b'\r\n\r\nfirst body\r\n\r\n', data)
+        self.assertEqual(os.listdir(self.tmpdir), ['crawl.warc'])
+
+    def test_append(self):
+        store = WarcStore(self.path)
+        write_chunks(store, 'site/a', [b'a'], url='http://site/a')
+        store.close()
+        store = WarcStore(self.path)
+        self.assertTrue(store.exists('site/a', 'http://site/a'))
+        self.assertFalse(store.exists('site/b', 'http://site/b'))
+        write_chunks(store, 'site/b', [b'b'], url='http://site/b')
+        store.close()
+        types = [h['warc-type'] for _, h in read_warc_headers(self.path)]
+        self.assertEqual(types, ['warcinfo', 'resource', 'resource'])
+
+
+class TestPackStore(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'crawl.pack')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_read_back(self):
+        store = PackStore(self.path, spool_size=4, batch_size=2)
+        write_chunks(store, 'site/a', [b'first', b' body'],
+                     url='http://site/a', content_type='text/html')
+        write_chunks(store, 'site/b', [], url='http://site/b')
+        write_chunks(store, 'site/c', [b'third'], url='http://site/c')
+        store.close()
+        with PackReader(self.path) as reader:
+            self.assertEqual(len(reader), 3)
+            self.assertEqual(reader.get('http://site/a'), b'first body')
+            self.assertEqual(reader.get('http://site/b'), b'')
+            self.assertEqual(reader.get('http://site/c'), b'third')
+            self.assertEqual(reader.content_type('http://site/a'),
+                             'text/html')
+            self.assertNotIn('http://site/d', reader)
+
+    def test_index_written_in_batches(self):
+        store = PackStore(self.path, batch_size=2)
+        write_chunks(store, 'site/a', [b'a'], url='http://site/a')
+        with PackReader(self.path) as reader:
+            self.assertEqual(len(reader), 0)
+        write_chunks(store, 'site/b', [b'b'], url='http://site/b')
+        with PackReader(self.path) as reader:
+            self.assertEqual(reader.get('http://site/a'), b'a')
+        store.close()
+
+    def test_append(self):
+        store = PackStore(self.path)
+        write_chunks(store, 'site/a', [b'old'], url='http://site/a')
+        store.close()
+        store = PackStore(self.path)
+        self.assertTrue(store.exists('site/a', 'http://site/a'))
+        write_chunks(store, 'site/a', [b'new'], url='http://site/a')
+        write_chunks(store, 'site/b', [b'b'], url='http://site/b')
+        store.close()
+        with PackReader(self.path) as reader:
+            self.assertEqual(reader.get('http://site/a'), b'new')
+            self.assertEqual(reader.get('http://site/b'), b'b')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_urls
+----------------------------------
+
+Tests for `pycrawl.urls` module.
+"""
+
+import unittest
+
+from pycrawl.urls import canonical_url, clear_cache, parse_url
+
+
+class TestParseUrl(unittest.TestCase):
+
+    def setUp(self):
+        clear_cache()
+
+    def test_canonical(self):
+        parsed = parse_url('http://Site.com:8000/page;params?query#frag')
+        self.assertEqual(parsed.url, 'http://Site.com:8000/page')
+        self.assertEqual(parsed.scheme, 'http')
+        self.assertEqual(parsed.netloc, 'Site.com:8000')
+        self.assertEqual(parsed.hostname, 'site.com')
+        self.assertEqual(parsed.path, '/page')
+        self.assertEqual(parsed.robots_url,
+                         'http://Site.com:8000/robots.txt')
+
+    def test_root_netloc(self):
+        self.assertEqual(canonical_url('page.html', 'a.com'),
+                         'http://a.com/page.html')
+        self.assertEqual(canonical_url('/x?y', 'a.com'), 'http://a.com/x')
+        self.assertEqual(canonical_url('https://b.com/', 'a.com'),
+                         'https://b.com/')
+        relative = parse_url('page.html')
+        self.assertIsNone(relative.hostname)
+        self.assertEqual(relative.url, 'page.html')
+
+    def test_cached(self):
+        first = parse_url('http://a.com/1')
+        self.assertIs(parse_url('http://a.com/1'), first)
+        self.assertIsNot(parse_url('http://a.com/1', 'a.com'), first)
+        clear_cache()
+        self.assertIsNot(parse_url('http://a.com/1'), first)
+
+    def test_interned(self):
+        # build equal strings at run time, so they aren't already shared
+        urls = ['http://a.com/' + str(i) for i in (1, 1)]
+        self.assertIsNot(urls[0], urls[1])
+        first = canonical_url(urls[0] + '#a')
+        second = canonical_url(urls[1] + '#b')
+        self.assertIs(first, second)
+        self.assertIs(parse_url(urls[0]).netloc,
+                      parse_url('http://a.com/2').netloc)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_writer
+----------------------------------
+
+Tests for `pycrawl.writer` module.
+"""
+
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from pycrawl.storage import write_chunks
+from pycrawl.writer import QueuedMirrorStore
+
+
+class TestQueuedMirrorStore(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def path(self, *names):
+        return os.path.join(self.tmpdir, 'site', *names)
+
+    def read(self, filename):
+        with open(filename, 'rb') as f:
+            return f.read()
+
+    def test_write(self):
+        store = QueuedMirrorStore()
+        write_chunks(store, self.path('a'), [b'ab', b'cd'])
+        write_chunks(store, self.path('sub', 'b'), [b'b'])
+        store.flush()
+        self.assertEqual(self.read(self.path('a')), b'abcd')
+        self.assertEqual(self.read(self.path('sub', 'b')), b'b')
+        store.close()
+
+    def test_later_copy_wins(self):
+        store = QueuedMirrorStore()
+        for i in range(20):
+            write_chunks(store, self.path('a'), [str(i).encode('ascii')])
+        store.close()
+        self.assertEqual(self.read(self.path('a')), b'19')
+        self.assertEqual(os.listdir(self.path()), ['a'])
+
+    def test_exists_while_queued(self):
+        store = QueuedMirrorStore(queue_size=1)
+        blocked = threading.Event()
+        release = threading.Event()
+        write = store._write
+
+        def slow_write(*args):
+            blocked.set()
+            release.wait()
+            write(*args)
+        store._write = slow_write
+        write_chunks(store, self.path('a'), [b'a'])
+        blocked.wait()
+        self.assertTrue(store.exists(self.path('a')))
+        self.assertFalse(os.path.exists(self.path('a')))
+        release.set()
+        store.close()
+        self.assertTrue(store.exists(self.path('a')))
+        self.assertFalse(store.exists(self.path('b')))
+
+    def test_spooled(self):
+        store = QueuedMirrorStore(spool_size=4)
+        write_chunks(store, self.path('a'), [b'abc', b'def', b'ghi'])
+        store.close()
+        self.assertEqual(self.read(self.path('a')), b'abcdefghi')
+        self.assertEqual(os.listdir(self.path()), ['a'])
+
+    def test_fsync(self):
+        store = QueuedMirrorStore(fsync_interval=0)
+        write_chunks(store, self.path('a'), [b'a'])
+        store.close()
+        self.assertEqual(self.read(self.path('a')), b'a')
+        self.assertEqual(store._unsynced, [])
+
+    def test_error_raised(self):
+        not_a_dir = os.path.join(self.tmpdir, 'file')
+        with open(not_a_dir, 'w') as f:
+            f.write('not a directory')
+        store = QueuedMirrorStore()
+        write_chunks(store, os.path.join(not_a_dir, 'a'), [b'a'])
+        self.assertRaises(OSError, store.close)
+        self.assertRaises(OSError, store.open, self.path('b'))
+
+
+if __name__ == '__main__':
+    unittest.main()